@@ -0,0 +1,109 @@
+import argparse
+import http.client
+import json
+import math
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_PATHS = ["/api/repos?page={n}&page_size=100",
+                 "/api/repos?cursor=&page_size=100&month_from=2016-{month:02d}"]
+
+
+class Worker(threading.Thread):
+
+    def __init__(self, base_url, paths, deadline, offset, pages):
+        super().__init__(daemon=True)
+        self.url = urlparse(base_url)
+        self.paths = paths
+        self.deadline = deadline
+        self.offset = offset
+        self.pages = pages
+        self.latencies = []
+        self.errors = 0
+        self.connection = None
+
+    def connect(self):
+        # One keep-alive connection per worker, like a pooled client
+        self.connection = http.client.HTTPConnection(
+            self.url.hostname, self.url.port or 80, timeout=30)
+
+    def run(self):
+        self.connect()
+        count = self.offset
+        while time.perf_counter() < self.deadline:
+            # Paths are varied by page so the response cache can be bypassed with small caches
+            page = count % self.pages + 1
+            path = self.paths[count % len(self.paths)].format(
+                n=page, month=(page - 1) % 12 + 1)
+            count += 1
+            started_at = time.perf_counter()
+            try:
+                self.connection.request("GET", path)
+                response = self.connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                self.connection.close()
+                self.connect()
+                continue
+            self.latencies.append(time.perf_counter() - started_at)
+            if response.status not in (200, 304):
+                self.errors += 1
+        self.connection.close()
+
+
+def run_load_test(base_url, paths=DEFAULT_PATHS, concurrency=16, duration=10, pages=50, warm_up=1):
+    if warm_up > 0:
+        run_workers(base_url, paths, concurrency, warm_up, pages)
+    started_at = time.perf_counter()
+    workers = run_workers(base_url, paths, concurrency, duration, pages)
+    elapsed = max(time.perf_counter() - started_at, 1e-9)
+
+    latencies = [latency for worker in workers for latency in worker.latencies]
+    return {"concurrency": concurrency, "requests": len(latencies),
+            "errors": sum(worker.errors for worker in workers),
+            "elapsed_seconds": round(elapsed, 3),
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2)}
+
+
+def run_workers(base_url, paths, concurrency, duration, pages):
+    deadline = time.perf_counter() + duration
+    workers = [Worker(base_url, paths, deadline, offset, pages)
+               for offset in range(0, concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return workers
+
+
+def percentile(values, percent):
+    if len(values) == 0:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sends concurrent keep-alive requests to the API and reports requests/sec and latency percentiles")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--path", action="append", default=None,
+                        help="request path, {n} is replaced by a page number, can be repeated")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--pages", type=int, default=50,
+                        help="distinct values of {n}")
+    parser.add_argument("--warm-up", type=float, default=1,
+                        help="seconds of requests before measuring")
+    args = parser.parse_args()
+
+    print(json.dumps(run_load_test(args.base_url, args.path or DEFAULT_PATHS, args.concurrency,
+                                   args.duration, args.pages, args.warm_up), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import os
+import shutil
+
+# Production entry point: gunicorn -c gunicorn.conf.py src.app:app
+bind = os.getenv("API_BIND", "0.0.0.0:5000")
+# Each worker holds up to API_DB_POOL_SIZE + API_DB_MAX_OVERFLOW Postgres connections and its own
+# response cache, the default stays well under the max_connections shared with Airflow
+workers = int(os.getenv("API_WORKERS", "2"))
+# Threads wait on Postgres most of the time, each worker pool holds a connection per thread
+worker_class = "gthread"
+threads = int(os.getenv("API_THREADS", "4"))
+keepalive = int(os.getenv("API_KEEPALIVE", "5"))
+timeout = int(os.getenv("API_TIMEOUT", "30"))
+# Workers are recycled now and then so a slow leak never grows unbounded
+max_requests = int(os.getenv("API_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+# Workers write their metrics to a shared directory, /metrics adds them up
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/api_metrics")
+
+
+def on_starting(server):
+    # Metrics of a previous run are cleared
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"])
@@ -1,36 +1,281 @@
 import logging
 import os
+import time
+from contextlib import contextmanager
+from functools import wraps
 
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, g, jsonify, request, stream_with_context
 from flask_migrate import Migrate
+from sqlalchemy import text, tuple_
 from sqlalchemy.dialects import postgresql
 
 from src.exceptions.custom_exceptions import APIBadParameters
 from src.models.repo_data import RepoData
+from src.models.rollups import OwnerMonthlyData, OwnerYearlyData, RepoYearlyData
 from src.models.shared import db
-from src.utils.utils import validate_pagination
+from src.utils.export import csv_chunks, gzip_chunks, ndjson_chunks
+from src.utils.metrics import PROMETHEUS_CONTENT_TYPE, Metrics
+from src.utils.response_cache import ModelVersion, ResponseCache, TTLCache
+from src.utils.utils import (encode_cursor, parse_export_after,
+                             validate_export_format, validate_filters,
+                             validate_repos, validate_timeseries)
+
+
+def engine_options(database_url):
+    # Each worker process keeps its own pool, sized for its threads. Connections
+    # closed by Postgres or a proxy while idle are replaced before being used
+    if not database_url or not database_url.startswith("postgresql"):
+        return {}
+    return {"pool_size": int(os.getenv('API_DB_POOL_SIZE', os.getenv('API_THREADS', '4'))),
+            "max_overflow": int(os.getenv('API_DB_MAX_OVERFLOW', '2')),
+            "pool_timeout": int(os.getenv('API_DB_POOL_TIMEOUT', '10')),
+            "pool_recycle": int(os.getenv('API_DB_POOL_RECYCLE', '1800')),
+            "pool_pre_ping": True}
+
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
     'API_POSTGRES_CONNECTION_URL')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'])
 migrate = Migrate(app, db)
 db.init_app(app)
 migrate.init_app(app, db)
 
+READ_MODEL_KEY = (RepoData.month, RepoData.repo_owner, RepoData.repo_name)
+# Rows are read as plain tuples, no ORM instance is built per row
+READ_MODEL_COLUMNS = (*READ_MODEL_KEY, RepoData.number_of_new_contributors)
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+count_cache = TTLCache(int(os.getenv('API_COUNT_CACHE_MAX_ENTRIES', '1024')),
+                       int(os.getenv('API_COUNT_CACHE_TTL', '60')))
+# Rollups materialized by dbt, keyed by granularity and whether a repository is requested
+TIMESERIES_MODELS = {("month", False): OwnerMonthlyData, ("year", False): OwnerYearlyData,
+                     ("year", True): RepoYearlyData}
+# On gunicorn every worker writes to PROMETHEUS_MULTIPROC_DIR, any of them reports the sum
+metrics = Metrics(directory=os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def fetch_model_version():
+    # Bumped by every dbt run on the on-run-end hook
+    row = db.session.execute(text("SELECT version FROM github_read_model_version WHERE model = :model"),
+                             {"model": RepoData.__tablename__}).first()
+    return row[0] if row else 0
+
+
+response_cache = ResponseCache(
+    int(os.getenv('API_RESPONSE_CACHE_MAX_MB', '64')) * 1024 * 1024)
+model_version = ModelVersion(fetch_model_version, int(
+    os.getenv('API_MODEL_VERSION_CHECK_INTERVAL', '10')))
+
+
+@app.before_request
+def start_timer():
+    g.started_at = time.perf_counter()
+    g.stages = {}
+
+
+@app.after_request
+def record_request(response):
+    # Runs before a streamed response sends its first chunk, it's timed by timed_chunks
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.inc("api_requests_total", endpoint=endpoint,
+                status=response.status_code)
+    if "started_at" in g and not response.is_streamed:
+        metrics.observe("api_request_seconds", time.perf_counter() -
+                        g.started_at, endpoint=endpoint)
+    for stage, seconds in g.get("stages", {}).items():
+        metrics.observe("api_stage_seconds", seconds,
+                        endpoint=endpoint, stage=stage)
+    return response
+
+
+@contextmanager
+def timed(stage):
+    # Query and serialization times are added up over the request and recorded once
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        if "stages" in g:
+            g.stages[stage] = g.stages.get(stage, 0) + \
+                time.perf_counter() - started_at
+
+
+def timed_chunks(chunks, endpoint, started_at):
+    # Recorded once the last chunk is sent, or the client went away
+    try:
+        yield from chunks
+    finally:
+        metrics.observe("api_request_seconds", time.perf_counter() -
+                        started_at, endpoint=endpoint)
+
+
+def cached_response(validate):
+    # Arguments are validated first, a malformed request never waits on the database
+    def decorator(view):
+        @wraps(view)
+        def wrapper():
+            params = validate(request.args)
+            response_cache.sync_version(model_version.current())
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = response_cache.get(key)
+            metrics.inc("api_response_cache_total",
+                        result="miss" if entry is None else "hit")
+            if entry is None:
+                payload = view(params)
+                # Dates are rendered as ISO 8601 by the encoder itself
+                with timed("serialization"):
+                    body = orjson.dumps(payload)
+                entry = response_cache.set(key, body)
+            body, etag = entry
+
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
 
 @app.route('/api/repos', methods=['GET'])
-def get_repos():
-    page = request.args.get("page")
-    page_size = request.args.get("page_size")
-    page, page_size = validate_pagination(page, page_size)
-    pagination = RepoData.query.paginate(page, page_size, error_out=False)
-    results = [
-        {
-            "repo_name": repo.repo_name,
-            "month": repo.month.strftime('%Y-%m-%d'),
-            "number_of_new_contributors": repo.number_of_new_contributors
-        } for repo in pagination.items]
-    return {"total_records": pagination.total, "page": page, "page_size": pagination.per_page, "items": results}
+@cached_response(validate_repos)
+def get_repos(params):
+    if params["keyset"]:
+        return get_repos_by_cursor(params)
+
+    page = params["page"]
+    page_size = params["page_size"]
+    filters = params["filters"]
+    with timed("query"):
+        repos = filtered_query(filters).with_entities(*READ_MODEL_COLUMNS).order_by(
+            *READ_MODEL_KEY).limit(page_size).offset((page - 1) * page_size).all()
+    with timed("serialization"):
+        items = [serialize_repo(repo) for repo in repos]
+    response = {"page": page, "page_size": page_size, "items": items}
+    return with_total_records(response, params["include_total"], filters)
+
+
+def get_repos_by_cursor(params):
+    # Keyset pagination costs the same on any page, no OFFSET is used
+    page_size = params["page_size"]
+    filters = params["filters"]
+    query = filtered_query(filters)
+    if params["after"] is not None:
+        query = query.filter(tuple_(*READ_MODEL_KEY) > tuple_(*params["after"]))
+    with timed("query"):
+        repos = query.with_entities(*READ_MODEL_COLUMNS).order_by(
+            *READ_MODEL_KEY).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(repos) > page_size:
+        repos = repos[:page_size]
+        next_cursor = encode_cursor(*repos[-1][:len(READ_MODEL_KEY)])
+    with timed("serialization"):
+        items = [serialize_repo(repo) for repo in repos]
+    response = {"page_size": page_size,
+                "next_cursor": next_cursor, "items": items}
+    return with_total_records(response, params["include_total"], filters)
+
+
+@app.route('/api/repos/export', methods=['GET'])
+def export_repos():
+    export_format = validate_export_format(request.args.get("format"))
+    filters = validate_filters(request.args)
+    after = parse_export_after(request.args.get("after"))
+    query = filtered_query(filters).with_entities(*READ_MODEL_COLUMNS)
+    if after is not None:
+        query = query.filter(tuple_(*READ_MODEL_KEY) > tuple_(*after))
+
+    # Server side cursor, only one chunk of rows is kept in memory
+    rows = query.order_by(*READ_MODEL_KEY).execution_options(
+        stream_results=True).yield_per(EXPORT_CHUNK_ROWS)
+    serialize = ndjson_chunks if export_format == "ndjson" else csv_chunks
+    chunks = serialize(rows, EXPORT_CHUNK_ROWS)
+
+    headers = {"Vary": "Accept-Encoding"}
+    if request.accept_encodings["gzip"]:
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    chunks = timed_chunks(chunks, request.url_rule.rule, g.started_at)
+    return app.response_class(stream_with_context(chunks), mimetype=EXPORT_CONTENT_TYPES[export_format], headers=headers)
+
+
+@app.route('/api/timeseries', methods=['GET'])
+@cached_response(validate_timeseries)
+def get_timeseries(series):
+    model = TIMESERIES_MODELS[(series["granularity"],
+                               series["repo_name"] is not None)]
+
+    # Read straight from the rollup key, nothing is aggregated at request time
+    query = model.query.filter(model.repo_owner == series["repo_owner"])
+    if series["repo_name"] is not None:
+        query = query.filter(model.repo_name == series["repo_name"])
+    if series["period_from"] is not None:
+        query = query.filter(model.period >= series["period_from"])
+    if series["period_to"] is not None:
+        query = query.filter(model.period <= series["period_to"])
+    with timed("query"):
+        rows = query.with_entities(model.period, model.number_of_new_contributors,
+                                   model.cumulative_new_contributors).order_by(model.period).all()
+
+    with timed("serialization"):
+        items = [{"period": period, "number_of_new_contributors": new_contributors,
+                  "cumulative_new_contributors": cumulative} for period, new_contributors, cumulative in rows]
+    return {"repo_owner": series["repo_owner"], "repo_name": series["repo_name"],
+            "granularity": series["granularity"], "items": items}
+
+
+def filtered_query(filters):
+    # Every filter combination is served by one of the read model indexes
+    query = RepoData.query
+    if filters["repo_owner"] is not None:
+        query = query.filter(RepoData.repo_owner == filters["repo_owner"])
+    if filters["repo_name"] is not None:
+        query = query.filter(RepoData.repo_name == filters["repo_name"])
+    if filters["month_from"] is not None:
+        query = query.filter(RepoData.month >= filters["month_from"])
+    if filters["month_to"] is not None:
+        query = query.filter(RepoData.month <= filters["month_to"])
+    return query
+
+
+def serialize_repo(row):
+    month, repo_owner, repo_name, number_of_new_contributors = row
+    return {
+        "repo_owner": repo_owner,
+        "repo_name": repo_name,
+        "month": month,
+        "number_of_new_contributors": number_of_new_contributors
+    }
+
+
+def with_total_records(response, include_total, filters):
+    with timed("query"):
+        if include_total == "true":
+            response["total_records"] = filtered_query(filters).count()
+        elif include_total == "cached":
+            response["total_records"] = cached_count(filters)
+    return response
+
+
+def cached_count(filters):
+    key = tuple(sorted(filters.items()))
+    total = count_cache.get(key)
+    if total is None:
+        total = filtered_query(filters).count()
+        count_cache.set(key, total)
+    return total
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    if request.args.get("format") == "json":
+        return jsonify(metrics.summary())
+    return app.response_class(metrics.to_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 
 @app.errorhandler(APIBadParameters)
@@ -50,5 +295,6 @@ def handle_exception(err):
     return jsonify(response), 500
 
 
+# Development server only, production runs on gunicorn with gunicorn.conf.py
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=os.getenv('API_DEBUG', 'true').lower() == 'true')
@@ -0,0 +1,48 @@
+from src.models.shared import db
+
+
+class OwnerMonthlyData(db.Model):
+    __tablename__ = 'github_owner_monthly_contributors'
+
+    repo_owner = db.Column(db.String(), primary_key=True)
+    period = db.Column("month", db.Date(), primary_key=True)
+    number_of_new_contributors = db.Column(db.BigInteger(), nullable=False)
+    cumulative_new_contributors = db.Column(db.BigInteger(), nullable=False)
+
+    def __init__(self, repo_owner, period, number_of_new_contributors, cumulative_new_contributors):
+        self.repo_owner = repo_owner
+        self.period = period
+        self.number_of_new_contributors = number_of_new_contributors
+        self.cumulative_new_contributors = cumulative_new_contributors
+
+
+class OwnerYearlyData(db.Model):
+    __tablename__ = 'github_owner_yearly_contributors'
+
+    repo_owner = db.Column(db.String(), primary_key=True)
+    period = db.Column("year", db.Date(), primary_key=True)
+    number_of_new_contributors = db.Column(db.BigInteger(), nullable=False)
+    cumulative_new_contributors = db.Column(db.BigInteger(), nullable=False)
+
+    def __init__(self, repo_owner, period, number_of_new_contributors, cumulative_new_contributors):
+        self.repo_owner = repo_owner
+        self.period = period
+        self.number_of_new_contributors = number_of_new_contributors
+        self.cumulative_new_contributors = cumulative_new_contributors
+
+
+class RepoYearlyData(db.Model):
+    __tablename__ = 'github_repo_yearly_contributors'
+
+    repo_owner = db.Column(db.String(), primary_key=True)
+    repo_name = db.Column(db.String(), primary_key=True)
+    period = db.Column("year", db.Date(), primary_key=True)
+    number_of_new_contributors = db.Column(db.BigInteger(), nullable=False)
+    cumulative_new_contributors = db.Column(db.BigInteger(), nullable=False)
+
+    def __init__(self, repo_owner, repo_name, period, number_of_new_contributors, cumulative_new_contributors):
+        self.repo_owner = repo_owner
+        self.repo_name = repo_name
+        self.period = period
+        self.number_of_new_contributors = number_of_new_contributors
+        self.cumulative_new_contributors = cumulative_new_contributors
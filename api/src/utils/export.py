@@ -0,0 +1,48 @@
+import csv
+import io
+import zlib
+
+import orjson
+
+EXPORT_COLUMNS = ("month", "repo_owner", "repo_name",
+                  "number_of_new_contributors")
+
+
+def ndjson_chunks(rows, chunk_rows=1000):
+    lines = []
+    for month, repo_owner, repo_name, number_of_new_contributors in rows:
+        lines.append(orjson.dumps({"month": month, "repo_owner": repo_owner, "repo_name": repo_name,
+                                   "number_of_new_contributors": number_of_new_contributors}))
+        if len(lines) == chunk_rows:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+def csv_chunks(rows, chunk_rows=1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    buffered_rows = 0
+    for month, repo_owner, repo_name, number_of_new_contributors in rows:
+        writer.writerow([month.isoformat(), repo_owner,
+                         repo_name, number_of_new_contributors])
+        buffered_rows += 1
+        if buffered_rows == chunk_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            buffered_rows = 0
+    if buffer.tell() > 0:
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    # wbits 31 writes a gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
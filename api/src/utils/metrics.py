@@ -0,0 +1,96 @@
+import json
+import threading
+
+# prometheus_client reads PROMETHEUS_MULTIPROC_DIR when it's imported, gunicorn.conf.py sets it first
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter,
+                               Histogram, generate_latest, multiprocess)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROMETHEUS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+
+class Metrics():
+
+    def __init__(self, buckets=LATENCY_BUCKETS, directory=None):
+        # With a directory, the PROMETHEUS_MULTIPROC_DIR of gunicorn workers, every process writes
+        # its metrics there and the reports add all of them up. Otherwise they're kept in memory
+        self.buckets = buckets
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.registry = None if self.directory else CollectorRegistry()
+            self.collectors = {}
+
+    def inc(self, name, value=1, **labels):
+        self.collector(Counter, name, labels).inc(value)
+
+    def observe(self, name, value, **labels):
+        self.collector(Histogram, name, labels).observe(value)
+
+    def collector(self, metric_type, name, labels):
+        with self.lock:
+            metric = self.collectors.get(name)
+            if metric is None:
+                options = {"buckets": self.buckets} if metric_type is Histogram else {}
+                metric = self.collectors[name] = metric_type(
+                    name, name, sorted(labels), registry=self.registry, **options)
+        if not labels:
+            return metric
+        return metric.labels(**{label: str(value) for label, value in labels.items()})
+
+    def collect(self):
+        if not self.directory:
+            return self.registry
+
+        # Every process file is read and added up, dead workers included
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=self.directory)
+        return registry
+
+    def to_prometheus(self):
+        return generate_latest(self.collect()).decode("utf-8")
+
+    def summary(self):
+        counters = {}
+        histograms = {}
+        for family in self.collect().collect():
+            for sample in family.samples:
+                labels = {label: value for label, value in sample.labels.items() if label != "le"}
+                if family.type == "counter" and sample.name.endswith("_total"):
+                    counters[series_name(sample.name, labels)] = sample.value
+                elif family.type == "histogram":
+                    histogram = histograms.setdefault(
+                        series_name(family.name, labels), {"buckets": [], "sum": 0.0, "count": 0})
+                    if sample.name.endswith("_bucket"):
+                        histogram["buckets"].append((float(sample.labels["le"]), sample.value))
+                    elif sample.name.endswith("_sum"):
+                        histogram["sum"] = sample.value
+                    elif sample.name.endswith("_count"):
+                        histogram["count"] = int(sample.value)
+        return {
+            "counters": dict(sorted(counters.items())),
+            "histograms": {key: {"count": histogram["count"], "sum": round(histogram["sum"], 6),
+                                 "p50": self.quantile(histogram, 0.5),
+                                 "p99": self.quantile(histogram, 0.99)}
+                           for key, histogram in sorted(histograms.items())},
+        }
+
+    def quantile(self, histogram, quantile):
+        # Upper bound of the bucket holding the quantile, as Prometheus estimates it
+        if histogram["count"] == 0:
+            return None
+        rank = quantile * histogram["count"]
+        for bucket, cumulative in sorted(histogram["buckets"]):
+            if cumulative >= rank:
+                return min(bucket, self.buckets[-1])
+        return self.buckets[-1]
+
+
+def series_name(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{label}={json.dumps(value)}" for label, value in sorted(labels.items())) + "}"
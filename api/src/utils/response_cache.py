@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache():
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.version = None
+        self.lock = threading.Lock()
+
+    def sync_version(self, version):
+        # A new read model version invalidates every cached response
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.size = 0
+                self.version = version
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, body):
+        etag = hashlib.sha256(body).hexdigest()
+        # A zero cap disables the cache, the ETag is still sent
+        if self.max_bytes <= 0:
+            return body, etag
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key)[0])
+            self.entries[key] = (body, etag)
+            self.size += len(body)
+
+            # Least recently used responses are evicted over the size cap
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, (evicted_body, _) = self.entries.popitem(last=False)
+                self.size -= len(evicted_body)
+        return body, etag
+
+
+class TTLCache():
+
+    def __init__(self, max_entries=1024, ttl=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.clock() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, self.clock())
+
+            # Keys come from client filters, the least recently used ones are evicted over the cap
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class ModelVersion():
+
+    def __init__(self, fetch_version, check_interval=10):
+        self.fetch_version = fetch_version
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        # The marker is read at most once per check interval
+        with self.lock:
+            now = time.monotonic()
+            if self.checked_at is None or now - self.checked_at >= self.check_interval:
+                self.version = self.fetch_version()
+                self.checked_at = now
+            return self.version
@@ -1,5 +1,14 @@
+import base64
+import binascii
+import json
+from datetime import date
+
 from src.exceptions.custom_exceptions import APIBadParameters
 
+TOTAL_MODES = ("true", "false", "cached")
+EXPORT_FORMATS = ("ndjson", "csv")
+GRANULARITIES = ("month", "year")
+
 
 def try_parse_int(s, val=None):
     if s is None:
@@ -24,3 +33,120 @@ def validate_pagination(page, page_size):
         raise APIBadParameters(
             "Page size should be greater than 1 and less than 100")
     return page, page_size
+
+
+def validate_total_mode(include_total, default):
+    if(include_total is None):
+        return default
+    if(include_total not in TOTAL_MODES):
+        raise APIBadParameters(
+            f"Include total should be one of {', '.join(TOTAL_MODES)}")
+    return include_total
+
+
+def try_parse_month(s):
+    if s is None:
+        return None
+    try:
+        # Both YYYY-MM and YYYY-MM-DD are accepted, months start on day 1
+        return date.fromisoformat(s if len(s) > 7 else f"{s}-01").replace(day=1)
+    except ValueError:
+        raise APIBadParameters(
+            "Month should be formatted as YYYY-MM or YYYY-MM-DD")
+
+
+def validate_filters(args):
+    filters = {
+        "repo_owner": args.get("repo_owner") or None,
+        "repo_name": args.get("repo_name") or None,
+        "month_from": try_parse_month(args.get("month_from")),
+        "month_to": try_parse_month(args.get("month_to")),
+    }
+    if(filters["month_from"] and filters["month_to"] and filters["month_from"] > filters["month_to"]):
+        raise APIBadParameters("Month from should be before month to")
+    return filters
+
+
+def validate_repos(args):
+    # A cursor switches to keyset pagination, which doesn't count the total by default
+    keyset = "cursor" in args
+    filters = validate_filters(args)
+    page, page_size = validate_pagination(
+        None if keyset else args.get("page"), args.get("page_size"))
+    include_total = validate_total_mode(
+        args.get("include_total"), "false" if keyset else "true")
+    return {
+        "filters": filters,
+        "keyset": keyset,
+        "page": page,
+        "page_size": page_size,
+        "include_total": include_total,
+        "after": decode_cursor(args.get("cursor")),
+    }
+
+
+def validate_timeseries(args):
+    series = {
+        "repo_owner": args.get("repo_owner") or None,
+        "repo_name": args.get("repo_name") or None,
+        "granularity": args.get("granularity") or "month",
+        "period_from": try_parse_month(args.get("from")),
+        "period_to": try_parse_month(args.get("to")),
+    }
+    if(series["repo_owner"] is None):
+        raise APIBadParameters("Repo owner is required")
+    if(series["granularity"] not in GRANULARITIES):
+        raise APIBadParameters(
+            f"Granularity should be one of {', '.join(GRANULARITIES)}")
+    # Monthly series of a repository are the read model itself
+    if(series["repo_name"] is not None and series["granularity"] == "month"):
+        raise APIBadParameters(
+            "Monthly series of a repository are served by /api/repos")
+    if(series["granularity"] == "year"):
+        for bound in ("period_from", "period_to"):
+            if(series[bound] is not None):
+                series[bound] = series[bound].replace(month=1)
+    if(series["period_from"] and series["period_to"] and series["period_from"] > series["period_to"]):
+        raise APIBadParameters("From should be before to")
+    return series
+
+
+def encode_cursor(month, repo_owner, repo_name):
+    payload = json.dumps([month.strftime('%Y-%m-%d'), repo_owner, repo_name])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    # An empty cursor starts from the first page
+    if not cursor:
+        return None
+    try:
+        month, repo_owner, repo_name = json.loads(
+            base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return date.fromisoformat(month), repo_owner, repo_name
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        raise APIBadParameters("Invalid cursor")
+
+
+def validate_export_format(export_format):
+    if(export_format is None):
+        return "ndjson"
+    if(export_format not in EXPORT_FORMATS):
+        raise APIBadParameters(
+            f"Format should be one of {', '.join(EXPORT_FORMATS)}")
+    return export_format
+
+
+def parse_export_after(after):
+    # Rows are exported by (month, repo_owner, repo_name), the last exported key resumes it
+    if not after:
+        return None
+    parts = after.split(",")
+    if(len(parts) != 3 or not all(parts)):
+        raise APIBadParameters(
+            "After should be formatted as YYYY-MM-DD,repo_owner,repo_name")
+    try:
+        return date.fromisoformat(parts[0]), parts[1], parts[2]
+    except ValueError:
+        raise APIBadParameters(
+            "After should be formatted as YYYY-MM-DD,repo_owner,repo_name")
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+from src.utils.metrics import Metrics
+
+
+def test_counters_should_be_kept_per_labels():
+    metrics = Metrics()
+
+    metrics.inc("api_requests_total", endpoint="/api/repos", status=200)
+    metrics.inc("api_requests_total", endpoint="/api/repos", status=200)
+    metrics.inc("api_requests_total", endpoint="/api/repos", status=400)
+
+    assert metrics.summary()["counters"] == {'api_requests_total{endpoint="/api/repos",status="200"}': 2,
+                                             'api_requests_total{endpoint="/api/repos",status="400"}': 1}
+
+
+def test_to_prometheus_should_render_cumulative_histogram_buckets():
+    metrics = Metrics(buckets=(0.01, 0.1))
+
+    for seconds in (0.005, 0.05, 0.5):
+        metrics.observe("api_stage_seconds", seconds, stage="query")
+
+    exposition = metrics.to_prometheus()
+
+    assert "# TYPE api_stage_seconds histogram" in exposition
+    for line in ['api_stage_seconds_bucket{le="0.01",stage="query"} 1.0',
+                 'api_stage_seconds_bucket{le="0.1",stage="query"} 2.0',
+                 'api_stage_seconds_bucket{le="+Inf",stage="query"} 3.0',
+                 'api_stage_seconds_count{stage="query"} 3.0']:
+        assert line in exposition.splitlines()
+
+
+def test_summary_should_estimate_quantiles_from_buckets():
+    metrics = Metrics(buckets=(0.01, 0.1, 1))
+
+    for seconds in [0.005] * 99 + [0.5]:
+        metrics.observe("api_request_seconds", seconds)
+
+    assert metrics.summary()["histograms"]["api_request_seconds"] == {
+        "count": 100, "sum": 0.995, "p50": 0.01, "p99": 0.01}
+
+
+def test_metrics_with_a_directory_should_add_every_process_up(tmp_path):
+    # Each process stands for a gunicorn worker, prometheus_client reads the directory on import
+    script = "\n".join([
+        "from src.utils.metrics import Metrics",
+        f"metrics = Metrics(buckets=(0.01, 0.1), directory={str(tmp_path)!r})",
+        "metrics.inc('api_requests_total', endpoint='/api/repos', status=200)",
+        "metrics.observe('api_request_seconds', 0.05, endpoint='/api/repos')"])
+    for _ in range(0, 2):
+        subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.dirname(__file__)),
+                       env=dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path)))
+
+    metrics = Metrics(buckets=(0.01, 0.1), directory=str(tmp_path))
+
+    assert metrics.summary() == {
+        "counters": {'api_requests_total{endpoint="/api/repos",status="200"}': 2},
+        "histograms": {'api_request_seconds{endpoint="/api/repos"}': {"count": 2, "sum": 0.1, "p50": 0.1, "p99": 0.1}}}
+    assert 'api_request_seconds_bucket{endpoint="/api/repos",le="0.1"} 2.0' in metrics.to_prometheus().splitlines()
@@ -0,0 +1,84 @@
+from src.utils.response_cache import ModelVersion, ResponseCache, TTLCache
+
+
+def test_set_should_return_body_and_strong_etag():
+    cache = ResponseCache()
+
+    body, etag = cache.set("key", b'{"items": []}')
+
+    assert body == b'{"items": []}'
+    assert cache.get("key") == (body, etag)
+    assert cache.set("other", b'{"items": []}')[1] == etag
+
+
+def test_set_over_size_cap_should_evict_least_recently_used():
+    cache = ResponseCache(max_bytes=10)
+
+    cache.set("key1", b"1234")
+    cache.set("key2", b"1234")
+    cache.get("key1")
+    cache.set("key3", b"1234")
+
+    assert cache.get("key1") is not None
+    assert cache.get("key2") is None
+    assert cache.get("key3") is not None
+
+
+def test_zero_size_cap_should_disable_the_cache():
+    cache = ResponseCache(max_bytes=0)
+
+    body, etag = cache.set("key", b'{"items": []}')
+
+    assert body == b'{"items": []}'
+    assert etag == ResponseCache().set("key", body)[1]
+    assert cache.get("key") is None
+
+
+def test_sync_version_should_invalidate_entries_of_previous_version():
+    cache = ResponseCache()
+    cache.sync_version(1)
+    cache.set("key", b"body")
+
+    cache.sync_version(1)
+    assert cache.get("key") is not None
+
+    cache.sync_version(2)
+    assert cache.get("key") is None
+
+
+def test_ttl_cache_over_max_entries_should_evict_least_recently_used():
+    cache = TTLCache(max_entries=2)
+
+    cache.set("key1", 1)
+    cache.set("key2", 0)
+    cache.get("key1")
+    cache.set("key3", 3)
+
+    assert cache.get("key1") == 1
+    assert cache.get("key2") is None
+    assert cache.get("key3") == 3
+    assert len(cache.entries) == 2
+
+
+def test_ttl_cache_expired_entry_should_be_dropped():
+    now = [0]
+    cache = TTLCache(ttl=60, clock=lambda: now[0])
+    cache.set("key", 0)
+
+    now[0] = 60
+    assert cache.get("key") == 0
+
+    now[0] = 61
+    assert cache.get("key") is None
+    assert "key" not in cache.entries
+
+
+def test_model_version_should_be_fetched_once_per_interval():
+    versions = iter([1, 2])
+    model_version = ModelVersion(lambda: next(versions), check_interval=60)
+
+    assert model_version.current() == 1
+    assert model_version.current() == 1
+
+    model_version.check_interval = 0
+    assert model_version.current() == 2
@@ -0,0 +1,204 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import queue
+import resource
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark.mock_github import MockGithubServer, SyntheticOrg
+from src.exceptions import RateLimitExceedError, StatsNotReadyError
+from src.gateway import GitGateway
+from src.repository import Repository
+
+
+class TimedGitGateway(GitGateway):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def request(self, url):
+        started_at = time.perf_counter()
+        try:
+            return super().request(url)
+        finally:
+            self.latencies.append(time.perf_counter() - started_at)
+
+    def stream(self, url):
+        # Only the time to the headers, as on the request metrics, the body is read while parsed
+        started_at = time.perf_counter()
+        try:
+            return super().stream(url)
+        finally:
+            self.latencies.append(time.perf_counter() - started_at)
+
+
+def crawl_repository(gateway, owner, repo_name, poll_interval=1, max_polls=30, stream=False):
+    # Mirrors the DAG retries, cold stats are polled and rate limits waited out
+    polls = 0
+    rate_limited = 0
+    while True:
+        try:
+            if stream:
+                return list(gateway.iter_contributors_per_months(owner, repo_name)), polls, rate_limited
+            return gateway.get_contributors_per_months(owner, repo_name), polls, rate_limited
+        except StatsNotReadyError:
+            polls += 1
+            if polls > max_polls:
+                raise
+            time.sleep(poll_interval)
+        except RateLimitExceedError as ex:
+            rate_limited += 1
+            time.sleep(max(ex.time_to_wait, poll_interval))
+
+
+def run_benchmark(base_url, owner, conn=None, workers=8, load_batch_size=5000, poll_interval=1, max_polls=30,
+                  stream=False, trace_memory=False):
+    gateway = TimedGitGateway(
+        "benchmark", base_url=base_url, max_workers=workers)
+    repository = Repository(conn, load_batch_size)
+    rows = 0
+    polls = 0
+    rate_limited = 0
+
+    # tracemalloc hooks every allocation and slows the crawl down, the peak memory is
+    # sampled on its own run so the timings aren't skewed
+    if trace_memory:
+        tracemalloc.start()
+    started_at = time.perf_counter()
+    repos_list = gateway.get_all_repositories(owner)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(lambda repo: crawl_repository(
+            gateway, owner, repo["name"], poll_interval, max_polls, stream), repos_list)
+
+        pending = []
+        for contributors, repo_polls, repo_rate_limited in results:
+            pending += contributors
+            rows += len(contributors)
+            polls += repo_polls
+            rate_limited += repo_rate_limited
+            if len(pending) >= load_batch_size:
+                load(repository, pending)
+                pending = []
+        load(repository, pending)
+    elapsed = max(time.perf_counter() - started_at, 1e-9)
+    peak_memory = None
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "repositories": len(repos_list),
+        "requests": len(gateway.latencies),
+        "rows": rows,
+        "stats_polls": polls,
+        "rate_limited": rate_limited,
+        "loaded": conn is not None,
+        "streamed": stream,
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(gateway.latencies) / elapsed, 1),
+        "rows_per_second": round(rows / elapsed, 1),
+        "latency_p50_ms": round(percentile(gateway.latencies, 50) * 1000, 2),
+        "latency_p99_ms": round(percentile(gateway.latencies, 99) * 1000, 2),
+        "peak_memory_mb": round(peak_memory / (1024 * 1024), 2) if trace_memory else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+
+def load(repository, contributors_list):
+    # Without a database only the COPY payload is built
+    if repository.conn is None:
+        repository.to_csv(contributors_list)
+    else:
+        repository.bulk_insert(contributors_list)
+
+
+def percentile(values, percent):
+    if len(values) == 0:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * percent / 100) - 1, 0)]
+
+
+def serve_mock(orgs, options, ports):
+    # A separate process keeps the server out of the measured memory and GIL
+    server = MockGithubServer(orgs, **options).prepare().start()
+    ports.put(server.port)
+    threading.Event().wait()
+
+
+def wait_for_port(process, ports):
+    # Large organizations take a while to generate
+    while True:
+        try:
+            return ports.get(timeout=1)
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError("Mock Github server failed to start")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Crawls a mock Github organization with GitGateway and Repository")
+    parser.add_argument("--base-url", default=None,
+                        help="an already running mock server, one is started otherwise")
+    parser.add_argument("--owner", default="benchmark")
+    parser.add_argument("--repos", type=int, default=200)
+    parser.add_argument("--contributors", type=int, default=50)
+    parser.add_argument("--weeks", type=int, default=260)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--latency-jitter", type=float, default=0.05)
+    parser.add_argument("--warm-up-requests", type=int, default=1)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument("--reset-window", type=int, default=3600)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--load-batch-size", type=int, default=5000)
+    parser.add_argument("--poll-interval", type=float, default=1)
+    parser.add_argument("--stream", action="store_true",
+                        help="parses the stats payloads one contributor at a time")
+    parser.add_argument("--dsn", default=os.environ.get("BENCHMARK_POSTGRES_DSN"),
+                        help="loads into Postgres when set, only builds the COPY payload otherwise")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="crawls again with tracemalloc to report the peak memory")
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        orgs = [SyntheticOrg(args.owner, args.repos,
+                             args.contributors, args.weeks)]
+        options = {"latency": args.latency, "latency_jitter": args.latency_jitter,
+                   "warm_up_requests": args.warm_up_requests, "rate_limit": args.rate_limit,
+                   "reset_window": args.reset_window}
+        ports = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=serve_mock, args=(orgs, options, ports), daemon=True)
+        process.start()
+        base_url = f"http://127.0.0.1:{wait_for_port(process, ports)}"
+
+    conn = None
+    if args.dsn:
+        import psycopg2
+        conn = psycopg2.connect(args.dsn)
+    try:
+        report = run_benchmark(base_url, args.owner, conn, args.workers,
+                               args.load_batch_size, args.poll_interval, stream=args.stream)
+        if args.trace_memory:
+            # The stats are warm on the second run, only its memory is reported
+            report["peak_memory_mb"] = run_benchmark(base_url, args.owner, None, args.workers, args.load_batch_size,
+                                                     args.poll_interval, stream=args.stream, trace_memory=True)["peak_memory_mb"]
+    finally:
+        if conn is not None:
+            conn.close()
+        if process is not None:
+            process.terminate()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
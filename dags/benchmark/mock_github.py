@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+SECONDS_PER_WEEK = 7 * 24 * 3600
+FIRST_WEEK = datetime(2016, 1, 3, tzinfo=timezone.utc)
+
+
+class SyntheticOrg():
+
+    def __init__(self, owner, repos=100, contributors=20, weeks=260, seed=0):
+        self.owner = owner
+        self.repos = repos
+        self.contributors = contributors
+        self.weeks = weeks
+        self.seed = seed
+
+    def repo_names(self):
+        return [f"{self.owner}-repo-{index}" for index in range(0, self.repos)]
+
+    def has_repository(self, repo_name):
+        prefix = f"{self.owner}-repo-"
+        index = repo_name[len(prefix):]
+        return repo_name.startswith(prefix) and index.isdigit() and int(index) < self.repos
+
+    def repositories(self):
+        pushed_at = (FIRST_WEEK + timedelta(weeks=self.weeks)
+                     ).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return [{"name": name, "pushed_at": pushed_at, "size": self.contributors, "archived": False}
+                for name in self.repo_names()]
+
+    def contributors_stats(self, repo_name):
+        # The same repository always gets the same payload
+        rng = random.Random(f"{self.seed}:{self.owner}:{repo_name}")
+        stats = []
+        for index in range(0, self.contributors):
+            first_week = rng.randrange(0, self.weeks)
+            weeks = []
+            total = 0
+            for week in range(0, self.weeks):
+                commits = rng.randint(1, 5) if week == first_week or (
+                    week > first_week and rng.random() < 0.2) else 0
+                total += commits
+                weeks.append({"w": int(FIRST_WEEK.timestamp()) + week * SECONDS_PER_WEEK,
+                              "a": commits * 10, "d": commits * 3, "c": commits})
+            stats.append({"total": total, "weeks": weeks,
+                          "author": {"login": f"{repo_name}-user-{index}"}})
+        # Github sorts the contributors by total commits
+        stats.sort(key=lambda contributor: contributor["total"])
+        return stats
+
+
+class MockGithubServer():
+
+    def __init__(self, orgs, latency=0.0, latency_jitter=0.0, warm_up_requests=0,
+                 rate_limit=5000, reset_window=3600, host="127.0.0.1", port=0):
+        self.orgs = {org.owner: org for org in orgs}
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.warm_up_requests = warm_up_requests
+        self.rate_limit = rate_limit
+        self.reset_window = reset_window
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.warm_ups = {}
+        self.budgets = {}
+        self.payloads = {}
+        self.lock = threading.Lock()
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def application(self):
+        app = web.Application()
+        app.router.add_get("/users/{owner}/repos", self.repos_handler)
+        app.router.add_get(
+            "/repos/{owner}/{repo}/stats/contributors", self.contributors_handler)
+        return app
+
+    def start(self):
+        # The server runs on its own event loop so sync clients can call it
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.serve, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def serve(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.runner = web.AppRunner(self.application(), access_log=None)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, self.host, self.port)
+        self.loop.run_until_complete(site.start())
+        self.port = self.runner.addresses[0][1]
+        started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def repos_handler(self, request):
+        limited, headers = await self.begin_request(request)
+        if limited is not None:
+            return limited
+        org = self.orgs.get(request.match_info["owner"])
+        if org is None:
+            return web.json_response({"message": "Not Found"}, status=404, headers=headers)
+
+        page = int(request.query.get("page", "1"))
+        per_page = int(request.query.get("per_page", "30"))
+        repositories = org.repositories()
+        last_page = max((len(repositories) + per_page - 1) // per_page, 1)
+        headers["Link"] = f'<{self.base_url}/users/{org.owner}/repos?page={last_page}&per_page={per_page}>; rel="last"'
+        return web.json_response(repositories[(page - 1) * per_page:page * per_page], headers=headers)
+
+    async def contributors_handler(self, request):
+        limited, headers = await self.begin_request(request)
+        if limited is not None:
+            return limited
+        owner = request.match_info["owner"]
+        repo_name = request.match_info["repo"]
+        org = self.orgs.get(owner)
+        if org is None or not org.has_repository(repo_name):
+            return web.json_response({"message": "Not Found"}, status=404, headers=headers)
+
+        # Cold repositories answer 202 while Github computes their stats
+        with self.lock:
+            warm_ups = self.warm_ups.get((owner, repo_name), 0)
+            self.warm_ups[(owner, repo_name)] = warm_ups + 1
+        if warm_ups < self.warm_up_requests:
+            return web.json_response({}, status=202, headers=headers)
+
+        body, etag = self.contributors_payload(org, repo_name)
+        if request.headers.get("If-None-Match") == etag:
+            self.refund_request(request, headers)
+            return web.Response(status=304, headers=headers)
+        headers["ETag"] = etag
+        return web.Response(body=body, content_type="application/json", headers=headers)
+
+    def prepare(self):
+        # Payloads built up front keep their generation out of the measured latency
+        for org in self.orgs.values():
+            for repo_name in org.repo_names():
+                self.contributors_payload(org, repo_name)
+        return self
+
+    def contributors_payload(self, org, repo_name):
+        key = (org.owner, repo_name)
+        if key not in self.payloads:
+            body = json.dumps(org.contributors_stats(repo_name)).encode("utf-8")
+            self.payloads[key] = (
+                body, f'"{hashlib.sha1(body).hexdigest()}"')
+        return self.payloads[key]
+
+    async def begin_request(self, request):
+        if self.latency or self.latency_jitter:
+            await asyncio.sleep(self.latency + random.uniform(0, self.latency_jitter))
+
+        # Every token has its own budget on a fixed reset window
+        token = request.headers.get("Authorization", "anonymous")
+        now = time.time()
+        with self.lock:
+            self.requests += 1
+            budget = self.budgets.get(token)
+            if budget is None or now >= budget["reset"]:
+                budget = {"remaining": self.rate_limit,
+                          "reset": int(now + self.reset_window) + 1}
+                self.budgets[token] = budget
+            limited = budget["remaining"] == 0
+            if not limited:
+                budget["remaining"] -= 1
+            headers = {"X-RateLimit-Limit": str(self.rate_limit),
+                       "X-RateLimit-Remaining": str(budget["remaining"]),
+                       "X-RateLimit-Reset": str(budget["reset"])}
+
+        if limited:
+            return web.json_response({"message": "API rate limit exceeded"}, status=403, headers=headers), headers
+        return None, headers
+
+    def refund_request(self, request, headers):
+        # Not modified responses don't count on the rate limit, as on Github
+        token = request.headers.get("Authorization", "anonymous")
+        with self.lock:
+            budget = self.budgets[token]
+            budget["remaining"] = min(budget["remaining"] + 1, self.rate_limit)
+            headers["X-RateLimit-Remaining"] = str(budget["remaining"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serves synthetic Github organizations")
+    parser.add_argument("--owners", default="benchmark",
+                        help="comma separated organizations")
+    parser.add_argument("--repos", type=int, default=100)
+    parser.add_argument("--contributors", type=int, default=20)
+    parser.add_argument("--weeks", type=int, default=260)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--warm-up-requests", type=int, default=0)
+    parser.add_argument("--rate-limit", type=int, default=5000)
+    parser.add_argument("--reset-window", type=int, default=3600)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    orgs = [SyntheticOrg(owner.strip(), args.repos, args.contributors, args.weeks)
+            for owner in args.owners.split(",") if owner.strip()]
+    server = MockGithubServer(orgs, args.latency, args.latency_jitter, args.warm_up_requests,
+                              args.rate_limit, args.reset_window, port=args.port).prepare()
+    web.run_app(server.application(), port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+ArchivedResponse = namedtuple("ArchivedResponse", [
+                              "owner", "repo_name", "kind", "url", "status", "digest", "fetched_at"])
+
+CONTRIBUTORS_PATH = re.compile(r"/repos/([^/]+)/([^/]+)/stats/contributors$")
+REPOSITORIES_PATH = re.compile(r"/users/([^/]+)/repos$")
+
+
+class ResponseArchive():
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.objects_directory = os.path.join(directory, "objects")
+        self.path = os.path.join(directory, "index.sqlite")
+        os.makedirs(self.objects_directory, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY,
+                owner TEXT,
+                repo_name TEXT,
+                kind TEXT NOT NULL,
+                url TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL)''')
+            conn.execute('''CREATE INDEX IF NOT EXISTS responses_owner_repo_fetched_idx
+                ON responses(owner, repo_name, fetched_at)''')
+
+    @contextmanager
+    def connect(self):
+        # Several tasks can archive on the same directory
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def store(self, url, status, body, fetched_at=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        writer = self.writer(url, status, fetched_at)
+        writer.write(body)
+        return writer.close()
+
+    def writer(self, url, status, fetched_at=None):
+        return ArchiveWriter(self, url, status, fetched_at)
+
+    def object_path(self, digest):
+        return object_path(self.directory, digest)
+
+    def index(self, url, status, digest, size, fetched_at):
+        owner, repo_name, kind = describe_url(url)
+        with self.connect() as conn:
+            conn.execute("INSERT INTO responses(owner, repo_name, kind, url, status, digest, size, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (owner, repo_name, kind, url, status, digest, size, fetched_at))
+
+    def load(self, digest):
+        return load_object(self.directory, digest)
+
+    def latest(self, owner=None, kind="contributors", until=None):
+        # The last response of each repository fetched until the given time
+        until = until if until is not None else time.time()
+        with self.connect() as conn:
+            rows = conn.execute('''SELECT owner, repo_name, kind, url, status, digest, MAX(fetched_at) FROM responses
+                WHERE kind = ? AND (? IS NULL OR owner = ?) AND fetched_at <= ?
+                GROUP BY owner, repo_name ORDER BY owner, repo_name''', (kind, owner, owner, until)).fetchall()
+        return [ArchivedResponse(*row) for row in rows]
+
+
+class ArchiveWriter():
+
+    def __init__(self, archive, url, status, fetched_at=None):
+        self.archive = archive
+        self.url = url
+        self.status = status
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.hash = hashlib.sha256()
+        self.compressor = zlib.compressobj()
+        self.size = 0
+        self.file = tempfile.NamedTemporaryFile(
+            dir=archive.objects_directory, delete=False)
+
+    def write(self, chunk):
+        # Bodies are compressed as they arrive, streamed responses are never buffered
+        self.hash.update(chunk)
+        self.size += len(chunk)
+        self.file.write(self.compressor.compress(chunk))
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+        # Content addressed, a payload archived many times is stored once
+        digest = self.hash.hexdigest()
+        path = self.archive.object_path(digest)
+        if os.path.exists(path):
+            os.unlink(self.file.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self.file.name, path)
+        self.archive.index(self.url, self.status, digest,
+                           self.size, self.fetched_at)
+        return digest
+
+    def discard(self):
+        self.file.close()
+        os.unlink(self.file.name)
+
+
+def object_path(directory, digest):
+    return os.path.join(directory, "objects", digest[:2], digest[2:])
+
+
+def load_object(directory, digest):
+    with open(object_path(directory, digest), "rb") as object_file:
+        return zlib.decompress(object_file.read())
+
+
+def describe_url(url):
+    path = urlparse(url).path
+    match = CONTRIBUTORS_PATH.search(path)
+    if match:
+        return match.group(1), match.group(2), "contributors"
+    match = REPOSITORIES_PATH.search(path)
+    if match:
+        return match.group(1), None, "repositories"
+    return None, None, "other"
+
+
+def archive_chunks(chunks, writer):
+    # Incomplete bodies aren't archived
+    completed = False
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+        completed = True
+    finally:
+        if completed:
+            writer.close()
+        else:
+            writer.discard()
+
+
+async def aarchive_chunks(chunks, writer):
+    # Chunks are only compressed on the loop, the object file is moved and indexed on the executor
+    completed = False
+    try:
+        async for chunk in chunks:
+            writer.write(chunk)
+            yield chunk
+        completed = True
+    finally:
+        loop = asyncio.get_running_loop()
+        if completed:
+            await loop.run_in_executor(None, writer.close)
+        else:
+            await loop.run_in_executor(None, writer.discard)
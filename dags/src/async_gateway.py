@@ -0,0 +1,278 @@
+import asyncio
+import time
+from datetime import datetime
+
+import aiohttp
+
+from src.archive import aarchive_chunks
+from src.exceptions import StatsNotReadyError
+from src.gateway import (ARCHIVED_STATUSES, GITHUB_API_URL,
+                         REPOSITORIES_PER_PAGE, STREAM_CHUNK_SIZE, body_chunks,
+                         check_rate_limit, conditional_headers,
+                         contributors_url, get_first_contribution,
+                         iter_first_contributions, parse_contributors,
+                         parse_last_page, parse_repositories, record_rate_limit,
+                         record_response, repositories_url, store_response,
+                         validate_months)
+from src.json_stream import aiter_json_array, iter_json_array
+from src.metrics import StageTimer, metrics
+
+
+class AsyncGitGateway():
+
+    def __init__(self, token, cache=None, base_url=GITHUB_API_URL, concurrency=20, budget=None,
+                 poll_interval=2, max_poll_interval=30, stream_stats=False, archive=None):
+        if concurrency < 1:
+            raise ValueError("concurrency should be greater than 0")
+        self.token = token
+        self.cache = cache
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.budget = budget
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.stream_stats = stream_stats
+        self.archive = archive
+        self.session = None
+        self.semaphore = None
+
+    async def __aenter__(self):
+        # A single pool of keep-alive connections shared by every request
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    async def get_repositories(self, owner, page_number=1):
+        return (await self.get_repositories_page(owner, page_number))[0]
+
+    async def get_repositories_page(self, owner, page_number=1):
+        status, data, headers = await self.request(
+            repositories_url(self.base_url, owner, page_number))
+        return parse_repositories(status, data), parse_last_page(headers)
+
+    async def get_all_repositories(self, owner):
+        repos_list, last_page = await self.get_repositories_page(owner)
+
+        # Once the page count is known the remaining pages are requested concurrently
+        if last_page is not None:
+            pages = await asyncio.gather(*[self.get_repositories(owner, page_number)
+                                           for page_number in range(2, last_page + 1)])
+            for repos_request in pages:
+                repos_list += repos_request
+            return repos_list
+
+        # Without a Link header pages are requested until a partial page
+        current_page = 1
+        repos_request = repos_list
+        while(len(repos_request) == REPOSITORIES_PER_PAGE):
+            current_page = current_page + 1
+            repos_request = await self.get_repositories(owner, current_page)
+            repos_list = repos_list + repos_request
+        return repos_list
+
+    async def get_contributors_per_month(self, owner, repo_name, month):
+        if not isinstance(month, datetime):
+            raise ValueError("month should be a datetime")
+
+        return await self.get_contributors_per_months(owner, repo_name, month, month)
+
+    async def get_contributors_per_months(self, owner, repo_name, start_month=None, end_month=None):
+        validate_months(start_month, end_month)
+
+        if self.stream_stats:
+            return [contributor async for contributor in self.iter_contributors_per_months(owner, repo_name, start_month, end_month)]
+
+        status, data, _ = await self.request(
+            contributors_url(self.base_url, owner, repo_name))
+        return parse_contributors(owner, repo_name, status, data, start_month, end_month)
+
+    async def iter_contributors_per_months(self, owner, repo_name, start_month=None, end_month=None):
+        # Stats are parsed while they are downloaded, one contributor at a time
+        validate_months(start_month, end_month)
+
+        url = contributors_url(self.base_url, owner, repo_name)
+        token, cached_response, headers = await self.prepare_request(url)
+        async with self.semaphore:
+            # Only the time to the headers, the body is read while it is parsed
+            started_at = time.perf_counter()
+            reserved = True
+            try:
+                async with self.session.get(url, headers=headers) as resp:
+                    record_response(url, resp.status,
+                                    time.perf_counter() - started_at)
+                    reserved = False
+                    await self.complete_request(token, resp.status, resp.headers)
+
+                    if resp.status == 304 and cached_response:
+                        await self.archive_response(url, 200, cached_response.body)
+                        for contributor in iter_first_contributions(owner, repo_name, iter_json_array(body_chunks(cached_response.body)), start_month, end_month):
+                            yield contributor
+                        return
+
+                    if resp.status != 200:
+                        data = await resp.read()
+                        await self.archive_response(url, resp.status, data)
+                        for contributor in parse_contributors(owner, repo_name, resp.status, data, start_month, end_month):
+                            yield contributor
+                        return
+
+                    # Streamed bodies aren't kept on the response cache, they are the large ones
+                    chunks = resp.content.iter_chunked(STREAM_CHUNK_SIZE)
+                    if self.archive:
+                        chunks = aarchive_chunks(
+                            chunks, self.archive.writer(url, resp.status))
+                    timer = StageTimer(owner, repo_name)
+                    try:
+                        async for contribution in aiter_json_array(chunks):
+                            timer.lap("parse")
+                            contributor = get_first_contribution(
+                                owner, repo_name, contribution, start_month, end_month)
+                            timer.lap("transform")
+                            if contributor is not None:
+                                yield contributor
+                                timer.resume()
+                    finally:
+                        timer.record()
+            finally:
+                if reserved:
+                    await self.release_request(token)
+
+    async def warm_up_stats(self, owner, repos):
+        # A first request asks Github to start computing the stats of cold repositories. Ready
+        # stats aren't parsed, they are kept on the response cache and the crawl revalidates
+        # them with a conditional request that doesn't count on the rate limit. Streamed stats
+        # are only probed, keeping or caching the payloads would defeat the bounded memory
+        request = self.probe if self.stream_stats else self.request
+        results = await asyncio.gather(*[request(contributors_url(self.base_url, owner, repo))
+                                         for repo in repos], return_exceptions=True)
+        return {repo: stats_readiness(result) for repo, result in zip(repos, results)}
+
+    async def crawl_contributors(self, owner, repos, start_month=None, end_month=None, poll_timeout=300):
+        # Failed repositories are returned as exceptions so one error doesn't cancel the batch
+        deadline = asyncio.get_running_loop().time() + poll_timeout
+        results = await asyncio.gather(
+            *[self.poll_contributors(owner, repo, start_month, end_month, deadline) for repo in repos], return_exceptions=True)
+        return dict(zip(repos, results))
+
+    async def poll_contributors(self, owner, repo_name, start_month, end_month, deadline):
+        # Each repository is polled on its own backoff, ready ones finish right away
+        delay = self.poll_interval
+        while True:
+            try:
+                return await self.get_contributors_per_months(owner, repo_name, start_month, end_month)
+            except StatsNotReadyError:
+                if asyncio.get_running_loop().time() + delay > deadline:
+                    raise
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    async def request(self, url):
+        token, cached_response, headers = await self.prepare_request(url)
+
+        async with self.semaphore:
+            started_at = time.perf_counter()
+            try:
+                async with self.session.get(url, headers=headers) as resp:
+                    data = await resp.read()
+                    status = resp.status
+                    response_headers = resp.headers
+            except BaseException:
+                await self.release_request(token)
+                raise
+            record_response(url, status, time.perf_counter() - started_at)
+
+        await self.complete_request(token, status, response_headers)
+
+        # Not modified responses don't count on rate limit
+        if status == 304 and cached_response:
+            await self.archive_response(url, 200, cached_response.body)
+            return 200, cached_response.body, response_headers
+
+        if status == 200 and self.cache:
+            await run_blocking(store_response, self.cache, url, response_headers, data)
+        await self.archive_response(url, status, data)
+        return status, data, response_headers
+
+    async def probe(self, url):
+        # Only the status matters, the body is drained chunk by chunk without being kept
+        token, cached_response, headers = await self.prepare_request(url)
+
+        async with self.semaphore:
+            started_at = time.perf_counter()
+            try:
+                async with self.session.get(url, headers=headers) as resp:
+                    record_response(url, resp.status,
+                                    time.perf_counter() - started_at)
+                    async for _ in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                        pass
+                    status = resp.status
+                    response_headers = resp.headers
+            except BaseException:
+                await self.release_request(token)
+                raise
+
+        await self.complete_request(token, status, response_headers)
+        if status == 304 and cached_response:
+            return 200, None, response_headers
+        return status, None, response_headers
+
+    async def archive_response(self, url, status, body):
+        if self.archive and status in ARCHIVED_STATUSES:
+            await run_blocking(self.archive.store, url, status, body)
+
+    async def prepare_request(self, url):
+        if self.session is None:
+            raise RuntimeError(
+                "AsyncGitGateway should be used as an async context manager")
+
+        token = self.token
+        if self.budget:
+            token, delay = await run_blocking(self.budget.acquire)
+            if delay > 0:
+                metrics.observe("github_rate_limit_pacing_seconds", delay)
+                await asyncio.sleep(delay)
+
+        cached_response = await run_blocking(self.cache.get, url) if self.cache else None
+        headers = conditional_headers(
+            self.get_auth_header(token), cached_response)
+        return token, cached_response, headers
+
+    async def release_request(self, token):
+        # Transport errors, timeouts and cancellations would otherwise keep the budget reserved
+        if self.budget:
+            await run_blocking(self.budget.release, token)
+
+    async def complete_request(self, token, status, headers):
+        if self.budget:
+            await run_blocking(self.budget.update, token, headers)
+        record_rate_limit(token, headers)
+        check_rate_limit(status, headers)
+
+    def get_auth_header(self, token=None):
+        token = token or self.token
+        if token:
+            return {"Authorization": f"token {token}", "user-agent": "github-crawler"}
+        else:
+            return {"user-agent": "github-crawler"}
+
+
+async def run_blocking(func, *args):
+    # The budget file lock and the sqlite cache and archive would stall every request on the loop
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+def stats_readiness(result):
+    if isinstance(result, Exception):
+        return "failed"
+    status = result[0]
+    if status == 202:
+        return "computing"
+    if status in (200, 204):
+        return "ready"
+    return "failed"
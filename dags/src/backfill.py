@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import time
+from datetime import datetime
+
+from src.async_gateway import AsyncGitGateway
+from src.crawl_state import repository_weight
+from src.exceptions import RateLimitExceedError, StatsNotReadyError
+from src.gateway import GITHUB_API_URL
+from src.rate_limit import RateLimitBudget
+from src.repository import Repository
+
+BACKFILL_START_DATE = datetime(2016, 1, 1)
+
+
+class BackfillProgress():
+
+    def __init__(self, repos_per_owner, finished=0, clock=time.monotonic):
+        # The ETA is weighted by repository size, a large repository takes longer to crawl
+        self.clock = clock
+        self.started_at = clock()
+        self.repositories = sum(len(repos_list)
+                                for repos_list in repos_per_owner.values())
+        self.weight = sum(repository_weight(repo) for repos_list in repos_per_owner.values()
+                          for repo in repos_list)
+        self.finished = finished
+        self.crawled = 0
+        self.crawled_weight = 0
+        self.failed = 0
+        self.rows = 0
+
+    def update(self, crawled_repos, failed, rows):
+        self.crawled += len(crawled_repos)
+        self.crawled_weight += sum(repository_weight(repo)
+                                   for repo in crawled_repos)
+        self.failed += failed
+        self.rows += rows
+
+    def eta_seconds(self):
+        if self.crawled_weight == 0:
+            return None
+        elapsed = self.clock() - self.started_at
+        return elapsed * (self.weight - self.crawled_weight) / self.crawled_weight
+
+    def report(self):
+        elapsed = max(self.clock() - self.started_at, 1e-9)
+        eta = self.eta_seconds()
+        total = self.finished + self.repositories
+        return {"repositories": total, "finished": self.finished + self.crawled, "failed": self.failed,
+                "rows": self.rows, "percent": round(100 * (self.finished + self.crawled) / total, 1) if total else 100.0,
+                "elapsed_seconds": round(elapsed, 1), "rows_per_second": round(self.rows / elapsed, 1),
+                "eta_seconds": round(eta) if eta is not None else None}
+
+    def __str__(self):
+        report = self.report()
+        eta = f"{report['eta_seconds']}s" if report["eta_seconds"] is not None else "unknown"
+        return (f"Backfilled {report['finished']} of {report['repositories']} repositories({report['percent']}%), "
+                f"{report['rows']} rows, {report['failed']} failed, ETA {eta}")
+
+
+def backfill_run_id(backfill_id):
+    # Checkpoints of a backfill outlive the DAG run, triggering it again resumes it
+    return f"backfill:{backfill_id}"
+
+
+def plan_backfill(repository, backfill_id, repos_per_owner):
+    # Repositories checkpointed by a previous attempt of the same backfill are skipped
+    pending_per_owner = {}
+    finished = 0
+    for repo_owner, repos_list in repos_per_owner.items():
+        checkpoint = repository.get_checkpoint(
+            backfill_run_id(backfill_id), repo_owner)
+        pending_per_owner[repo_owner] = [
+            repo for repo in repos_list if repo["name"] not in checkpoint]
+        finished += len(repos_list) - len(pending_per_owner[repo_owner])
+    return pending_per_owner, finished
+
+
+async def run_backfill(async_gateway, repository, backfill_id, repos_per_owner, progress, start_month=BACKFILL_START_DATE,
+                       end_month=None, batch_size=50, poll_timeout=300):
+    # One stats request per repository covers every month, each batch is loaded and
+    # checkpointed before the next one
+    failures = {}
+    for repo_owner, repos_list in repos_per_owner.items():
+        for offset in range(0, len(repos_list), batch_size):
+            batch = repos_list[offset:offset + batch_size]
+            results = await async_gateway.crawl_contributors(
+                repo_owner, [repo["name"] for repo in batch], start_month, end_month, poll_timeout)
+
+            contributors_list = []
+            crawled = []
+            for repo in batch:
+                result = results[repo["name"]]
+                if isinstance(result, Exception):
+                    logging.error(
+                        f"Unable to backfill {repo_owner}/{repo['name']} repository: {result!r}")
+                    failures[(repo_owner, repo["name"])] = result
+                else:
+                    contributors_list += result
+                    crawled.append(repo)
+
+            repository.bulk_insert(contributors_list)
+            repository.save_crawl_state(repo_owner, crawled)
+            repository.save_checkpoint(backfill_run_id(
+                backfill_id), repo_owner, [repo["name"] for repo in crawled])
+            progress.update(crawled, len(batch) - len(crawled),
+                            len(contributors_list))
+            logging.info(str(progress))
+
+            # The remaining batches would be rate limited as well
+            if any(isinstance(ex, RateLimitExceedError) for ex in failures.values()):
+                return failures
+    return failures
+
+
+async def backfill(async_gateway, repository, backfill_id, repo_owners, start_month=BACKFILL_START_DATE, end_month=None,
+                   batch_size=50, poll_timeout=300, max_passes=5):
+    repos_per_owner = {repo_owner: await async_gateway.get_all_repositories(repo_owner)
+                       for repo_owner in repo_owners}
+    logging.info(
+        f"Backfill {backfill_id} plan: {sum(len(repos_list) for repos_list in repos_per_owner.values())} repositories of {len(repo_owners)} accounts")
+
+    # Repositories whose stats are still being computed, or rate limited, are retried on
+    # the next pass, the checkpoints skip everything already loaded
+    failures = {}
+    for _ in range(0, max_passes):
+        pending_per_owner, finished = plan_backfill(
+            repository, backfill_id, repos_per_owner)
+        progress = BackfillProgress(pending_per_owner, finished)
+        if progress.repositories == 0:
+            break
+        failures = await run_backfill(async_gateway, repository, backfill_id, pending_per_owner, progress,
+                                      start_month, end_month, batch_size, poll_timeout)
+        if not failures:
+            break
+
+        errors = [ex for ex in failures.values() if not isinstance(
+            ex, (RateLimitExceedError, StatsNotReadyError))]
+        if errors:
+            break
+        rate_limit_errors = [ex for ex in failures.values()
+                             if isinstance(ex, RateLimitExceedError)]
+        if rate_limit_errors:
+            seconds_to_wait = max(
+                max(ex.time_to_wait for ex in rate_limit_errors), 1)
+            logging.warning(
+                f"Rate limit exceed, resuming the backfill in {seconds_to_wait:.0f}s")
+            await asyncio.sleep(seconds_to_wait)
+
+    pending_per_owner, finished = plan_backfill(
+        repository, backfill_id, repos_per_owner)
+    summary = BackfillProgress(pending_per_owner, finished).report()
+    summary["failed"] = len(failures)
+    summary["failures"] = {f"{repo_owner}/{repo_name}": repr(ex)
+                           for (repo_owner, repo_name), ex in failures.items()}
+    return summary
+
+
+def run_transform(dbt_dir):
+    # A single dbt run once every repository is loaded, the read model and the rollups
+    # pick up every month from the loaded_at watermark
+    subprocess.run(["dbt", "run", "--profiles-dir", "."],
+                   cwd=dbt_dir, check=True)
+
+
+async def run(args, tokens, conn):
+    budget = RateLimitBudget(os.path.join(
+        args.data_dir, "rate_limit.json"), tokens)
+    async with AsyncGitGateway(tokens[0] if tokens else None, base_url=args.base_url, concurrency=args.concurrency,
+                               budget=budget) as async_gateway:
+        start_month = parse_month(args.start_month) or BACKFILL_START_DATE
+        return await backfill(async_gateway, Repository(conn, args.load_batch_size), args.backfill_id, args.owner,
+                              start_month, parse_month(args.end_month), args.batch_size, args.poll_timeout, args.max_passes)
+
+
+def parse_month(value):
+    return datetime.strptime(value, "%Y-%m") if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Loads the whole history of Github accounts, resuming from the checkpoints of a previous attempt")
+    parser.add_argument("--owner", action="append", required=True,
+                        help="account to backfill, can be repeated")
+    parser.add_argument("--backfill-id", default="default",
+                        help="a backfill run again with the same id resumes it")
+    parser.add_argument("--start-month", default=None,
+                        help="YYYY-MM, 2016-01 by default")
+    parser.add_argument("--end-month", default=None, help="YYYY-MM")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--load-batch-size", type=int, default=5000)
+    parser.add_argument("--poll-timeout", type=int, default=300)
+    parser.add_argument("--max-passes", type=int, default=5)
+    parser.add_argument("--base-url", default=GITHUB_API_URL)
+    parser.add_argument("--data-dir", default="data",
+                        help="directory of the shared rate limit budget")
+    parser.add_argument("--dsn", default=os.environ.get("BACKFILL_POSTGRES_DSN"))
+    parser.add_argument("--dbt-dir", default=None,
+                        help="runs dbt once the backfill is complete")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or BACKFILL_POSTGRES_DSN is required")
+    logging.basicConfig(level=logging.INFO)
+
+    # Several comma separated tokens are rotated, as on the DAG
+    access_tokens = os.environ.get("GITHUB_ACCESS_TOKEN", "")
+    tokens = [token.strip()
+              for token in access_tokens.split(",") if token.strip()]
+
+    import psycopg2
+    conn = psycopg2.connect(args.dsn)
+    try:
+        summary = asyncio.run(run(args, tokens, conn))
+    finally:
+        conn.close()
+
+    complete = summary["finished"] == summary["repositories"]
+    if complete and args.dbt_dir:
+        run_transform(args.dbt_dir)
+    print(json.dumps(summary, indent=2))
+    if not complete:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
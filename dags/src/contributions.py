@@ -0,0 +1,135 @@
+from operator import itemgetter
+
+import numpy as np
+
+WEEK = itemgetter("w")
+COMMITS = itemgetter("c")
+
+
+class ContributorWeeks():
+
+    def __init__(self):
+        # Weekly commits of every contributor laid end to end, offsets delimit each contributor.
+        # Github returns the same weeks for every contributor of a repository, so they are kept
+        # once on the axis unless a contributor comes with a different series. Commits are
+        # copied into growable arrays, the parsed payload isn't kept alive by them
+        self.logins = []
+        self.offsets = GrowableArray(np.int64)
+        self.offsets.append(0)
+        self.commits = GrowableArray(np.int64)
+        self.axis = None
+        self.weeks = None
+
+    @classmethod
+    def from_stats(cls, contributors_stats):
+        contributor_weeks = cls()
+        for contribution in contributors_stats:
+            contributor_weeks.append(contribution)
+        return contributor_weeks
+
+    def append(self, contribution):
+        # Contributors without commits are skipped wherever they are on the list
+        if contribution.get("total") == 0:
+            return
+
+        series = contribution["weeks"]
+        weeks = list(map(WEEK, series))
+        if self.weeks is None:
+            if self.axis is None:
+                self.axis = weeks
+            elif weeks != self.axis:
+                # Every week is compared, a series with a gap or in another order has its own weeks
+                self.weeks = GrowableArray(np.float64)
+                self.weeks.extend(np.tile(np.array(self.axis, dtype=np.float64), len(self.logins)))
+        if self.weeks is not None:
+            self.weeks.extend(weeks)
+
+        self.logins.append(contribution["author"]["login"])
+        self.commits.extend(map(COMMITS, series), len(series))
+        self.offsets.append(len(self.commits))
+
+    def __len__(self):
+        return len(self.logins)
+
+    def first_contributions(self, start_month=None, end_month=None):
+        # Returns the contributor indexes, first contribution weeks and commits of that week
+        commits = self.commits.values()
+        if self.weeks is None:
+            contributors, weeks, first_commits = self.first_weeks_on_axis(
+                commits)
+        else:
+            contributors, weeks, first_commits = self.first_weeks(commits)
+
+        # Months are bucketed once for the whole repository
+        months = weeks.astype("datetime64[s]").astype("datetime64[M]")
+        in_range = np.ones(len(months), dtype=bool)
+        if start_month is not None:
+            in_range &= months >= np.datetime64(
+                start_month.strftime("%Y-%m"), "M")
+        if end_month is not None:
+            in_range &= months <= np.datetime64(
+                end_month.strftime("%Y-%m"), "M")
+        return contributors[in_range], months[in_range], first_commits[in_range]
+
+    def first_weeks_on_axis(self, commits):
+        # Contributors x weeks matrix, the earliest active column of each row is its first week
+        axis = np.array(self.axis or [], dtype=np.float64).astype(np.int64)
+        matrix = commits.reshape(len(self.logins), len(axis))
+        if np.any(axis[1:] < axis[:-1]):
+            columns = np.argsort(axis, kind="stable")
+            axis = axis[columns]
+            matrix = matrix[:, columns]
+
+        active = matrix > 0
+        contributors = np.flatnonzero(active.any(axis=1))
+        if len(contributors) == 0:
+            return contributors, axis[:0], commits[:0]
+        first = active[contributors].argmax(axis=1)
+        return contributors, axis[first], matrix[contributors, first]
+
+    def first_weeks(self, commits):
+        # Contributors have their own weeks, active weeks are sorted by contributor and week
+        weeks = self.weeks.values().astype(np.int64)
+        offsets = self.offsets.values()
+        active = np.flatnonzero(commits > 0)
+        contributors = np.searchsorted(offsets, active, side="right") - 1
+
+        order = np.lexsort((weeks[active], contributors))
+        contributors, first = np.unique(contributors[order], return_index=True)
+        active = active[order][first]
+        return contributors, weeks[active], commits[active]
+
+    def first_contribution_records(self, owner, repo_name, start_month=None, end_month=None):
+        contributors, months, commits = self.first_contributions(
+            start_month, end_month)
+        month_days = np.datetime_as_string(months.astype("datetime64[D]"))
+        return [{'repo_owner': owner, 'contributor': self.logins[contributor], 'month': month,
+                 'repo_name': repo_name, 'total_commits': total_commits}
+                for contributor, month, total_commits in zip(contributors.tolist(), month_days.tolist(), commits.tolist())]
+
+
+class GrowableArray():
+
+    def __init__(self, dtype, capacity=1024):
+        # Doubled when full, appending stays amortized constant time per value
+        self.buffer = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values, count=None):
+        count = len(values) if count is None else count
+        end = self.size + count
+        if end > len(self.buffer):
+            buffer = np.empty(max(end, 2 * len(self.buffer)), dtype=self.buffer.dtype)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size:end] = np.fromiter(values, dtype=self.buffer.dtype, count=count)
+        self.size = end
+
+    def append(self, value):
+        self.extend((value,), 1)
+
+    def values(self):
+        return self.buffer[:self.size]
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,69 @@
+import heapq
+from datetime import datetime
+from itertools import zip_longest
+
+
+def parse_pushed_at(pushed_at):
+    if pushed_at is None or isinstance(pushed_at, datetime):
+        return pushed_at
+    return datetime.fromisoformat(pushed_at.replace("Z", "+00:00"))
+
+
+def changed_repositories(repos_list, crawl_state, full_refresh=False):
+    if full_refresh:
+        return list(repos_list)
+
+    changed = []
+    for repo in repos_list:
+        state = crawl_state.get(repo["name"])
+        pushed_at = parse_pushed_at(repo.get("pushed_at"))
+        last_pushed_at = parse_pushed_at(state["pushed_at"]) if state else None
+
+        # Never crawled, unknown push date or pushed since the last successful crawl
+        if last_pushed_at is None or pushed_at is None or pushed_at > last_pushed_at:
+            changed.append(repo)
+    return changed
+
+
+def crawl_watermark(pushed_at, interval_end):
+    # Pushes after the end of the crawled interval must still look like changes to the next run
+    pushed_at = parse_pushed_at(pushed_at)
+    if pushed_at is None or interval_end is None:
+        return pushed_at.isoformat() if pushed_at else None
+    return min(pushed_at, interval_end).isoformat()
+
+
+def shard_repositories(repos_list, shards):
+    if shards < 1:
+        raise ValueError("shards should be greater than 0")
+
+    # Largest repositories first, each one to the lightest shard, the repository
+    # size stands for the stats payload to crawl
+    heap = [(0, 0, index) for index in range(0, min(shards, len(repos_list)))]
+    assigned = [[] for _ in heap]
+    for repo in sorted(repos_list, key=lambda repo: repo.get("size") or 0, reverse=True):
+        weight, count, index = heapq.heappop(heap)
+        assigned[index].append(repo)
+        heapq.heappush(heap, (weight + repository_weight(repo), count + 1, index))
+    return assigned
+
+
+def shard_owners(repos_per_owner, shards):
+    if shards < 1:
+        raise ValueError("shards should be greater than 0")
+
+    # Shards are split between owners by their size, every owner with repositories
+    # to crawl gets at least one so a large owner never holds the others back
+    weights = {owner: sum(repository_weight(repo) for repo in repos_list)
+               for owner, repos_list in repos_per_owner.items() if repos_list}
+    total_weight = sum(weights.values())
+    owner_shards = [[{"owner": owner, "repos": repos} for repos in shard_repositories(
+        repos_per_owner[owner], max(round(shards * weight / total_weight), 1))]
+        for owner, weight in sorted(weights.items())]
+
+    # Owners are interleaved, the mapped tasks run roughly on their index order
+    return [shard for shards_round in zip_longest(*owner_shards) for shard in shards_round if shard is not None]
+
+
+def repository_weight(repo):
+    return max(repo.get("size") or 0, 1)
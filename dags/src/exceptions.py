@@ -9,3 +9,7 @@ class RateLimitExceedError(Exception):
         self.message = message
         self.time_to_wait = time_to_wait
         super().__init__(self.message,self.time_to_wait)
+
+class StatsNotReadyError(HttpRequestError):
+    def __init__(self, message):
+        super().__init__(message, 202)
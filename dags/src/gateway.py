@@ -1,89 +1,352 @@
 
-import calendar
 import json
 import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
 import urllib3
 
-from src.exceptions import HttpRequestError, RateLimitExceedError
+from src.archive import archive_chunks, describe_url
+from src.contributions import ContributorWeeks
+from src.exceptions import (HttpRequestError, RateLimitExceedError,
+                            StatsNotReadyError)
+from src.json_stream import iter_json_array
+from src.metrics import StageTimer, metrics
+from src.rate_limit import token_key
+
+
+GITHUB_API_URL = "https://api.github.com"
+REPOSITORIES_PER_PAGE = 100
+LAST_PAGE_LINK = re.compile(r'<([^>]+)>;\s*rel="last"')
+STREAM_CHUNK_SIZE = 64 * 1024
+# Responses kept on the raw archive, the others can't be replayed
+ARCHIVED_STATUSES = (200, 204)
 
 
 class GitGateway():
 
-    def __init__(self, token):
+    def __init__(self, token, cache=None, base_url=GITHUB_API_URL, budget=None, max_workers=8, archive=None):
         self.token = token
-        self.http = urllib3.PoolManager()
+        self.cache = cache
+        self.archive = archive
+        self.base_url = base_url
+        self.budget = budget
+        self.max_workers = max_workers
+        self.http = urllib3.PoolManager(maxsize=max_workers)
 
     def get_repositories(self, owner, page_number=1):
-        resp = self.http.request(
-            "GET", f'https://api.github.com/users/{owner}/repos?page={page_number}&page_size=50', headers=self.get_auth_header())
+        return self.get_repositories_page(owner, page_number)[0]
 
-        self.handle_rate_limit(resp)
-        if resp.status == 200:
-            json_response = json.loads(resp.data)
-            return [repo["name"] for repo in json_response if repo.get("name")]
-        else:
-            raise HttpRequestError(resp.data, resp.status)
+    def get_repositories_page(self, owner, page_number=1):
+        status, data, headers = self.request(
+            repositories_url(self.base_url, owner, page_number))
+        return parse_repositories(status, data), parse_last_page(headers)
+
+    def get_all_repositories(self, owner):
+        repos_list, last_page = self.get_repositories_page(owner)
+
+        # Once the page count is known the remaining pages are requested concurrently
+        if last_page is not None:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for repos_request in executor.map(lambda page_number: self.get_repositories(owner, page_number), range(2, last_page + 1)):
+                    repos_list += repos_request
+            return repos_list
+
+        # Without a Link header pages are requested until a partial page
+        current_page = 1
+        repos_request = repos_list
+        while(len(repos_request) == REPOSITORIES_PER_PAGE):
+            current_page = current_page + 1
+            logging.info(
+                f"Requesting page {current_page} of account {owner} repositories list")
+            repos_request = self.get_repositories(owner, current_page)
+            repos_list = repos_list + repos_request
+        return repos_list
 
     def get_contributors_per_month(self, owner, repo_name, month):
         if not isinstance(month, datetime):
             raise ValueError("month should be a datetime")
 
-        resp = self.http.request(
-            "GET", f'https://api.github.com/repos/{owner}/{repo_name}/stats/contributors', headers=self.get_auth_header())
+        return self.get_contributors_per_months(owner, repo_name, month, month)
 
-        self.handle_rate_limit(resp)
+    def get_contributors_per_months(self, owner, repo_name, start_month=None, end_month=None):
+        validate_months(start_month, end_month)
 
-        if resp.status == 200:
-            json_response = json.loads(resp.data)
-            first_day_month_date = month.replace(
-                day=1, tzinfo=timezone.utc).date()
-            first_day_month_unix_timestamp = month.replace(
-                day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=timezone.utc).timestamp()
-            last_day_month_unix_timestamp = month.replace(day=calendar.monthrange(
-                month.year, month.month)[1], hour=23, minute=59, second=59, microsecond=0, tzinfo=timezone.utc).timestamp()
-
-            first_contributions = []
-            for contribution in json_response:
-
-                # discard contributors without commits
-                if contribution["total"] == 0:
-                    break
-
-                # Select for first contribution on a datetime ordered array
-                first_contribution = next(
-                    ctr for ctr in contribution["weeks"] if ctr["c"] > 0)
-
-                # Validate if the first contribution is on the request month
-                if first_day_month_unix_timestamp <= first_contribution["w"] <= last_day_month_unix_timestamp:
-                    first_contributions.append({
-                        'repo_owner': owner,
-                        'contributor':
-                        contribution["author"]["login"], 'month': str(first_day_month_date), 'repo_name': repo_name, 'total_commits': first_contribution["c"]})
-            return first_contributions
-
-        # No content
-        elif resp.status == 204:
-            return []
+        status, data, _ = self.request(
+            contributors_url(self.base_url, owner, repo_name))
+        return parse_contributors(owner, repo_name, status, data, start_month, end_month)
 
-        else:
-            raise HttpRequestError(resp.data, resp.status)
+    def iter_contributors_per_months(self, owner, repo_name, start_month=None, end_month=None):
+        # Stats are parsed while they are downloaded, one contributor at a time
+        validate_months(start_month, end_month)
+
+        status, chunks, _ = self.stream(
+            contributors_url(self.base_url, owner, repo_name))
+        yield from stream_contributors(owner, repo_name, status, chunks, start_month, end_month)
+
+    def request(self, url):
+        token, cached_response, headers = self.prepare_request(url)
+
+        started_at = time.perf_counter()
+        try:
+            resp = self.http.request("GET", url, headers=headers)
+        except BaseException:
+            self.release_request(token)
+            raise
+        record_response(url, resp.status, time.perf_counter() - started_at)
+        self.complete_request(token, resp)
+
+        # Not modified responses don't count on rate limit
+        if resp.status == 304 and cached_response:
+            self.archive_response(url, 200, cached_response.body)
+            return 200, cached_response.body, resp.headers
+
+        if resp.status == 200 and self.cache:
+            store_response(self.cache, url, resp.headers, resp.data)
+        self.archive_response(url, resp.status, resp.data)
+        return resp.status, resp.data, resp.headers
+
+    def stream(self, url):
+        token, cached_response, headers = self.prepare_request(url)
+
+        # Only the time to the headers, the body is read while it is parsed
+        started_at = time.perf_counter()
+        try:
+            resp = self.http.request(
+                "GET", url, headers=headers, preload_content=False)
+        except BaseException:
+            self.release_request(token)
+            raise
+        record_response(url, resp.status, time.perf_counter() - started_at)
+        try:
+            self.complete_request(token, resp)
+        except Exception:
+            release_connection(resp)
+            raise
+
+        if resp.status == 304 and cached_response:
+            release_connection(resp)
+            self.archive_response(url, 200, cached_response.body)
+            return 200, body_chunks(cached_response.body), resp.headers
+
+        # Streamed bodies aren't kept on the response cache, they are the large ones
+        chunks = stream_chunks(resp)
+        if self.archive and resp.status in ARCHIVED_STATUSES:
+            chunks = archive_chunks(
+                chunks, self.archive.writer(url, resp.status))
+        return resp.status, chunks, resp.headers
+
+    def archive_response(self, url, status, body):
+        if self.archive and status in ARCHIVED_STATUSES:
+            self.archive.store(url, status, body)
+
+    def prepare_request(self, url):
+        token = self.token
+        if self.budget:
+            token, delay = self.budget.acquire()
+            if delay > 0:
+                metrics.observe("github_rate_limit_pacing_seconds", delay)
+                time.sleep(delay)
+
+        cached_response = self.cache.get(url) if self.cache else None
+        headers = conditional_headers(
+            self.get_auth_header(token), cached_response)
+        return token, cached_response, headers
+
+    def complete_request(self, token, resp):
+        if self.budget:
+            self.budget.update(token, resp.headers)
+        record_rate_limit(token, resp.headers)
+        self.handle_rate_limit(resp)
+
+    def release_request(self, token):
+        # Transport errors and timeouts would otherwise keep the budget reserved
+        if self.budget:
+            self.budget.release(token)
 
     def handle_rate_limit(self, response):
-        remaining_requests = response.headers['X-RateLimit-Remaining']
-        limit_requests = response.headers['X-RateLimit-Limit']
-        reset_time = response.headers['X-RateLimit-Reset']
-        logging.info(
-            f"RateLimit Report - RemainingRequests: {remaining_requests} - Limit: {limit_requests} - NextResetWindow: {reset_time}")
-        if(response.status == 403):
-            if(int(remaining_requests) == 0):
-                seconds_to_wait = (datetime.utcfromtimestamp(
-                    int(reset_time)) - datetime.now()).total_seconds()
-                raise RateLimitExceedError(
-                    f"Github Rate exceed limit of {limit_requests} with next reset time window is in about {seconds_to_wait} seconds", seconds_to_wait)
-
-    def get_auth_header(self):
-        if self.token:
-            return {"Authorization": f"token {self.token}", "user-agent": "github-crawler"}
+        check_rate_limit(response.status, response.headers)
+
+    def get_auth_header(self, token=None):
+        token = token or self.token
+        if token:
+            return {"Authorization": f"token {token}", "user-agent": "github-crawler"}
         else:
             return {"user-agent": "github-crawler"}
+
+
+def repositories_url(base_url, owner, page_number):
+    return f'{base_url}/users/{owner}/repos?page={page_number}&per_page={REPOSITORIES_PER_PAGE}'
+
+
+def contributors_url(base_url, owner, repo_name):
+    return f'{base_url}/repos/{owner}/{repo_name}/stats/contributors'
+
+
+def parse_last_page(headers):
+    link = headers.get("Link")
+    match = LAST_PAGE_LINK.search(link) if link else None
+    if match is None:
+        return None
+    page = parse_qs(urlparse(match.group(1)).query).get("page")
+    return int(page[0]) if page else None
+
+
+def check_rate_limit(status, headers):
+    remaining_requests = headers['X-RateLimit-Remaining']
+    limit_requests = headers['X-RateLimit-Limit']
+    reset_time = headers['X-RateLimit-Reset']
+    logging.debug(
+        f"RateLimit Report - RemainingRequests: {remaining_requests} - Limit: {limit_requests} - NextResetWindow: {reset_time}")
+    if(status == 403):
+        if(int(remaining_requests) == 0):
+            metrics.inc("github_rate_limit_exceeded_total")
+            seconds_to_wait = (datetime.utcfromtimestamp(
+                int(reset_time)) - datetime.now()).total_seconds()
+            raise RateLimitExceedError(
+                f"Github Rate exceed limit of {limit_requests} with next reset time window is in about {seconds_to_wait} seconds", seconds_to_wait)
+
+
+def record_response(url, status, seconds):
+    owner, repo_name, kind = describe_url(url)
+    metrics.inc("github_http_requests_total", kind=kind, status=status)
+    metrics.observe_stage("http", seconds, owner, repo_name)
+
+
+def record_rate_limit(token, headers):
+    # Tokens are only identified by their hash
+    remaining_requests = headers.get("X-RateLimit-Remaining")
+    if remaining_requests is not None:
+        metrics.set("github_rate_limit_remaining",
+                    int(remaining_requests), token=token_key(token))
+
+
+def conditional_headers(headers, cached_response):
+    if cached_response:
+        if cached_response.etag:
+            headers["If-None-Match"] = cached_response.etag
+        if cached_response.last_modified:
+            headers["If-Modified-Since"] = cached_response.last_modified
+    return headers
+
+
+def store_response(cache, url, headers, data):
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if etag or last_modified:
+        cache.set(url, etag, last_modified, data)
+
+
+def validate_months(*months):
+    for month in months:
+        if month is not None and not isinstance(month, datetime):
+            raise ValueError("month should be a datetime")
+
+
+def parse_repositories(status, data):
+    if status == 200:
+        json_response = json.loads(data)
+        return [{"name": repo["name"], "pushed_at": repo.get("pushed_at"), "size": repo.get("size"),
+                 "archived": repo.get("archived", False)} for repo in json_response if repo.get("name")]
+    else:
+        raise HttpRequestError(data, status)
+
+
+def parse_contributors(owner, repo_name, status, data, start_month=None, end_month=None):
+    if status == 200:
+        with metrics.stage("parse", owner, repo_name):
+            json_response = json.loads(data)
+        with metrics.stage("transform", owner, repo_name):
+            return extract_first_contributions(owner, repo_name, json_response, start_month, end_month)
+
+    # No content
+    elif status == 204:
+        return []
+
+    # Github is still computing the repository stats
+    elif status == 202:
+        metrics.inc("github_stats_not_ready_total")
+        raise StatsNotReadyError(data)
+
+    else:
+        raise HttpRequestError(data, status)
+
+
+def stream_chunks(resp):
+    try:
+        yield from resp.stream(STREAM_CHUNK_SIZE)
+    finally:
+        release_connection(resp)
+
+
+def body_chunks(body):
+    # A cached body is parsed chunk by chunk too, a single chunk would decode every item at once
+    for offset in range(0, len(body), STREAM_CHUNK_SIZE):
+        yield body[offset:offset + STREAM_CHUNK_SIZE]
+
+
+def release_connection(resp):
+    # The unread body is drained so the connection can go back to the pool
+    resp.drain_conn()
+    resp.release_conn()
+
+
+def stream_contributors(owner, repo_name, status, chunks, start_month=None, end_month=None):
+    if status != 200:
+        yield from parse_contributors(owner, repo_name, status, b"".join(chunks), start_month, end_month)
+        return
+
+    yield from iter_first_contributions(owner, repo_name, iter_json_array(chunks), start_month, end_month)
+
+
+def month_key(month):
+    return (month.year, month.month)
+
+
+def extract_first_contributions(owner, repo_name, contributors_stats, start_month=None, end_month=None):
+    # Every contributor of the repository is computed at once on columnar arrays
+    return ContributorWeeks.from_stats(contributors_stats).first_contribution_records(owner, repo_name, start_month, end_month)
+
+
+def iter_first_contributions(owner, repo_name, contributors_stats, start_month=None, end_month=None):
+    # Streamed payloads are parsed while downloaded, the parse time includes reading the body
+    timer = StageTimer(owner, repo_name)
+    try:
+        for contribution in contributors_stats:
+            timer.lap("parse")
+            first_contribution = get_first_contribution(
+                owner, repo_name, contribution, start_month, end_month)
+            timer.lap("transform")
+            if first_contribution is not None:
+                yield first_contribution
+                timer.resume()
+    finally:
+        timer.record()
+
+
+def get_first_contribution(owner, repo_name, contribution, start_month=None, end_month=None):
+    # Contributors without commits are discarded, Github doesn't guarantee any order
+    if contribution.get("total") == 0:
+        return None
+    first_contribution = min((ctr for ctr in contribution["weeks"] if ctr["c"] > 0),
+                             key=lambda ctr: ctr["w"], default=None)
+    if first_contribution is None:
+        return None
+    first_contribution_date = datetime.fromtimestamp(
+        first_contribution["w"], tz=timezone.utc).date()
+    first_contribution_key = month_key(first_contribution_date)
+
+    # Validate if the first contribution is on the requested months range,
+    # bounds are inclusive and a missing bound means an open range
+    if start_month is not None and first_contribution_key < month_key(start_month):
+        return None
+    if end_month is not None and first_contribution_key > month_key(end_month):
+        return None
+
+    return {
+        'repo_owner': owner,
+        'contributor':
+        contribution["author"]["login"], 'month': str(first_contribution_date.replace(day=1)), 'repo_name': repo_name, 'total_commits': first_contribution["c"]}
@@ -1,102 +1,428 @@
+import asyncio
+import json
 import logging
-import time
-from datetime import date, datetime, timedelta
+import os
+from datetime import timedelta
 
-from airflow.decorators import dag, task
+from airflow.decorators import task
+from airflow.exceptions import AirflowException
 from airflow.hooks.postgres_hook import PostgresHook
 from airflow.models import DAG, Variable
 from airflow.operators.bash import BashOperator
 from airflow.operators.python import get_current_context
+from airflow.sensors.python import PythonSensor
 
-from src.exceptions import RateLimitExceedError
+from src.archive import ResponseArchive
+from src.async_gateway import AsyncGitGateway
+from src.backfill import (BACKFILL_START_DATE, BackfillProgress,
+                          plan_backfill, run_backfill)
+from src.crawl_state import (changed_repositories, crawl_watermark,
+                             shard_owners)
+from src.exceptions import (HttpRequestError, RateLimitExceedError,
+                            StatsNotReadyError)
 from src.gateway import GitGateway
+from src.metrics import metrics
+from src.rate_limit import RESET_WINDOW_SECONDS, RateLimitBudget
 from src.repository import Repository
+from src.response_cache import ResponseCache
+from src.snapshot import RepositoriesSnapshot
 
-gateway = GitGateway(Variable.get("GITHUB_ACCESS_TOKEN", default_var=None))
-pghook = PostgresHook(postgres_conn_id="postgres_datawarehouse")
-repository = Repository(pghook.get_conn())
+# Nothing on module level should touch Github, Airflow Variables or the
+# database, the scheduler parses this file every 30 seconds
+POSTGRES_CONN_ID = "postgres_datawarehouse"
+DATA_DIR = "/opt/airflow/data"
 
-repo_owner = Variable.get("GITHUB_REPO_OWNER", default_var=None)
-CACHE_KEY_REPOSITORY_LIST = f"{repo_owner}_REPOS_LIST"
-CACHE_KEY_TIMESTAMP_TTL = f"{repo_owner}_CACHE_TIMESTAMP_TTL"
-CACHE_TTL = Variable.get("CACHE_TTL", default_var="24")
 
+def get_repo_owners():
+    # Several comma separated accounts are crawled by the same DAG
+    repo_owners = Variable.get("GITHUB_REPO_OWNER", default_var=None)
+    if not repo_owners:
+        return []
+    return list(dict.fromkeys(owner.strip() for owner in repo_owners.split(",") if owner.strip()))
 
-def get_all_available_repositories():
-    repos_list = Variable.get(CACHE_KEY_REPOSITORY_LIST, default_var=[],
-                              deserialize_json=True)
-    repos_list_cache_ttl = float(Variable.get(CACHE_KEY_TIMESTAMP_TTL, default_var=str(datetime.now().timestamp()),
-                                              deserialize_json=False))
-    cache_ttl = timedelta(hours=int(Variable.get(CACHE_TTL, default_var="24")))
-    cache_live_time = (datetime.now() - datetime.fromtimestamp(repos_list_cache_ttl)).total_seconds()
 
-    # If repository list is loaded and cache isn't expired
-    if(len(repos_list) > 0 and (cache_live_time < cache_ttl.total_seconds())):
+def get_tokens():
+    # Several comma separated tokens can be rotated to increase the throughput
+    access_tokens = Variable.get("GITHUB_ACCESS_TOKEN", default_var=None)
+    return [token.strip() for token in access_tokens.split(",")
+            if token.strip()] if access_tokens else []
+
+
+def get_budget(tokens):
+    return RateLimitBudget(os.path.join(DATA_DIR, "rate_limit.json"), tokens)
+
+
+def get_gateway():
+    cache = ResponseCache(os.path.join(DATA_DIR, "http_cache.sqlite"), max_size=int(
+        Variable.get("GITHUB_HTTP_CACHE_MAX_MB", default_var="512")) * 1024 * 1024)
+    tokens = get_tokens()
+    # Raw responses can be archived to rebuild the data offline with src.replay
+    archive = ResponseArchive(os.path.join(DATA_DIR, "archive")) if Variable.get(
+        "GITHUB_ARCHIVE_RESPONSES", default_var="false").lower() == "true" else None
+    return GitGateway(tokens[0] if tokens else None, cache, budget=get_budget(tokens), archive=archive)
+
+
+def publish_metrics(context):
+    # A summary of every crawl task on its log and on the metrics directory
+    task_instance = context.get("ti")
+    name = f"{task_instance.dag_id}_{task_instance.task_id}_{task_instance.map_index}"
+    logging.info(f"Crawl metrics: {json.dumps(metrics.summary())}")
+    try:
+        metrics.write(os.path.join(DATA_DIR, "metrics"), name)
+    except OSError:
+        # Metrics never fail the crawl
+        logging.exception("Unable to write the crawl metrics")
+
+
+def retry_after_reset(ex):
+    # AirflowRescheduleException only works from sensors in reschedule mode on Airflow 2.3, a
+    # plain task is queued again right away and a mapped one breaks its task_reschedule row.
+    # The task fails into a retry, its backoff is capped at the reset window and the crawl
+    # waits on the wait_for_rate_limit sensor without holding a worker slot
+    logging.warning(f"Rate limit exceed, retrying: {ex.message}")
+    raise AirflowException(
+        f"Github rate limit exceed, the budget is reset in about {max(ex.time_to_wait, 0):.0f} seconds") from ex
+
+
+def rate_limit_available():
+    seconds_to_wait = get_budget(get_tokens()).seconds_to_wait()
+    if seconds_to_wait > 0:
+        logging.info(
+            f"Github rate budget exhausted, the next reset window is in about {seconds_to_wait:.0f} seconds")
+        return False
+    return True
+
+
+def wait_for_rate_limit():
+    # Only reads the shared budget file, the slot is released between pokes
+    return PythonSensor(
+        task_id="wait_for_rate_limit",
+        python_callable=rate_limit_available,
+        mode="reschedule",
+        poke_interval=60,
+        timeout=2 * RESET_WINDOW_SECONDS)
+
+
+def is_full_refresh(context):
+    conf = context.get("dag_run").conf or {}
+    return bool(conf.get("full_refresh", False))
+
+
+def list_repositories(repo_owner):
+    snapshot = RepositoriesSnapshot(DATA_DIR, repo_owner)
+    cache_ttl = timedelta(hours=int(
+        Variable.get("GITHUB_CACHE_TTL", default_var="24")))
+
+    # If repository snapshot exists and isn't expired
+    repos_list = snapshot.load(cache_ttl)
+    if repos_list is not None:
         return repos_list
 
+    repos_list = get_gateway().get_all_repositories(repo_owner)
+    logging.info(
+        f"Discovered {len(repos_list)} repositories of account {repo_owner}")
+    snapshot.save(repos_list)
+    return repos_list
+
+
+@task(retries=8, retry_delay=timedelta(minutes=1), retry_exponential_backoff=True,
+      max_retry_delay=timedelta(seconds=RESET_WINDOW_SECONDS))
+def discover_repositories():
+    conn = None
     try:
-        current_page = 1
-        repos_request = gateway.get_repositories(repo_owner, current_page)
-        repos_list += repos_request
-        while(len(repos_request) > 0):
+        conn = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID).get_conn()
+        repository = Repository(conn)
+        repository.prune_checkpoints()
+        full_refresh = is_full_refresh(get_current_context())
+
+        changed_per_owner = {}
+        for repo_owner in get_repo_owners():
+            # An account that can't be listed doesn't hold back the others
+            try:
+                repos_list = list_repositories(repo_owner)
+            except HttpRequestError as ex:
+                logging.error(
+                    f"Unable to list repositories of account {repo_owner}: {ex.status} {ex.message}")
+                continue
+
+            crawl_state = repository.get_crawl_state(repo_owner)
+            changed_per_owner[repo_owner] = changed_repositories(
+                repos_list, crawl_state, full_refresh)
             logging.info(
-                f"Requesting page {current_page} of account {repo_owner} repositories list")
-            current_page = current_page + 1
-            repos_request = gateway.get_repositories(repo_owner, current_page)
-            repos_list += repos_request
-
-        # Add on cache
-        Variable.set(CACHE_KEY_REPOSITORY_LIST,
-                     value=repos_list, serialize_json=True)
-        Variable.set(CACHE_KEY_TIMESTAMP_TTL, value=(
-            datetime.now() + cache_ttl).timestamp())
-        return repos_list
+                f"{len(changed_per_owner[repo_owner])} of {len(repos_list)} repositories of account {repo_owner} to crawl(full refresh: {full_refresh})")
+        return changed_per_owner
 
     except RateLimitExceedError as ex:
-        logging.exception("Rate limit exceed")
-        time.sleep(ex.time_to_wait)
-        raise
+        retry_after_reset(ex)
 
     except Exception:
-        logging.exception("Unable to prepare base repositories DAG")
+        logging.exception("Unable to discover repositories")
         raise
 
+    finally:
+        if conn is not None:
+            conn.close()
+
 
-@task(retries=20, retry_delay=timedelta(seconds=30), retry_exponential_backoff=True)
-def get_contributors(repo):
+@task(retries=8, retry_delay=timedelta(minutes=1), retry_exponential_backoff=True,
+      max_retry_delay=timedelta(seconds=RESET_WINDOW_SECONDS))
+def warm_up_stats(repos_per_owner):
+    try:
+        readiness = asyncio.run(warm_up_batch(repos_per_owner))
+    except RateLimitExceedError as ex:
+        retry_after_reset(ex)
+
+    for repo_owner, owner_readiness in readiness.items():
+        summary = {state: sum(1 for value in owner_readiness.values() if value == state)
+                   for state in ("ready", "computing", "failed")}
+        logging.info(
+            f"Contributors stats readiness of account {repo_owner}: {summary}")
+    return repos_per_owner
+
+
+@task
+def shard_repositories_list(repos_per_owner):
+    # A fixed number of mapped tasks whatever the accounts size, split between the accounts
+    shards = int(Variable.get("GITHUB_CRAWL_SHARDS", default_var="8"))
+    return shard_owners(repos_per_owner, shards)
+
+
+def get_async_gateway():
+    gateway = get_gateway()
+    concurrency = int(Variable.get(
+        "GITHUB_CRAWL_CONCURRENCY", default_var="20"))
+    # Large stats payloads can be parsed one contributor at a time
+    stream_stats = Variable.get(
+        "GITHUB_STREAM_STATS", default_var="false").lower() == "true"
+    return AsyncGitGateway(gateway.token, gateway.cache, concurrency=concurrency, budget=gateway.budget,
+                           stream_stats=stream_stats, archive=gateway.archive)
+
+
+async def warm_up_batch(repos_per_owner):
+    # One account after the other on a single connection pool
+    readiness = {}
+    async with get_async_gateway() as async_gateway:
+        for repo_owner, repos_list in repos_per_owner.items():
+            readiness[repo_owner] = await async_gateway.warm_up_stats(
+                repo_owner, [repo["name"] for repo in repos_list])
+    return readiness
+
+
+async def crawl_shard(repo_owner, repos, end_month, interval_end, repository, run_id):
+    batch_size = int(Variable.get("GITHUB_CRAWL_BATCH_SIZE", default_var="50"))
+    poll_timeout = int(Variable.get(
+        "GITHUB_STATS_POLL_TIMEOUT", default_var="300"))
+    max_attempts = int(Variable.get(
+        "GITHUB_STATS_MAX_ATTEMPTS", default_var="3"))
+    failures = {}
+    attempts = {}
+    pending = list(repos)
+    crawled = 0
+
+    # A single gateway and database connection for every batch of the shard
+    async with get_async_gateway() as async_gateway:
+        while pending:
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            # The whole history comes in a single payload and is extracted since 2016. Weeks start
+            # on Sunday and commits are bucketed by author date, a push after the watermark can
+            # land on any earlier month, the upsert leaves the unchanged rows alone
+            results = await async_gateway.crawl_contributors(
+                repo_owner, [repo["name"] for repo in batch], BACKFILL_START_DATE, end_month, poll_timeout)
+
+            contributors_list = []
+            finished = []
+            for repo in batch:
+                result = results[repo["name"]]
+                if isinstance(result, StatsNotReadyError):
+                    # Polled again after the other batches, Github keeps computing meanwhile
+                    attempts[repo["name"]] = attempts.get(repo["name"], 0) + 1
+                    if attempts[repo["name"]] < max_attempts:
+                        pending.append(repo)
+                    else:
+                        failures[repo["name"]] = result
+                elif isinstance(result, Exception):
+                    logging.error(
+                        f"Unable to get contributors for {repo['name']} repository: {result!r}")
+                    failures[repo["name"]] = result
+                else:
+                    contributors_list += result
+                    finished.append(dict(repo, pushed_at=crawl_watermark(
+                        repo.get("pushed_at"), interval_end)))
+
+            # Successful repositories are loaded and checkpointed batch by batch
+            repository.bulk_insert(contributors_list)
+            repository.save_crawl_state(repo_owner, finished)
+            repository.save_checkpoint(
+                run_id, repo_owner, [repo["name"] for repo in finished])
+            crawled += len(finished)
+            logging.info(
+                f"Crawled {crawled} of {len(repos)} repositories of the shard")
+
+            # The remaining batches would be rate limited as well
+            if any(isinstance(ex, RateLimitExceedError) for ex in failures.values()):
+                break
+    return failures
+
+
+def raise_crawl_failures(failures):
+    rate_limit_errors = [ex for ex in failures.values()
+                         if isinstance(ex, RateLimitExceedError)]
+    if rate_limit_errors:
+        raise max(rate_limit_errors, key=lambda ex: ex.time_to_wait)
+    errors = [ex for ex in failures.values()
+              if not isinstance(ex, StatsNotReadyError)]
+    if errors:
+        raise errors[0]
+    if failures:
+        # Without a checkpoint nor a crawl state the next run crawls them again, the shard
+        # finishes so the transform runs and the next runs aren't held back
+        metrics.inc("github_repositories_deferred_total", len(failures))
+        logging.warning(
+            f"Stats of {len(failures)} repositories are still being computed, deferred to the next run: {sorted(failures)}")
+
+
+@task(retries=8, retry_delay=timedelta(minutes=1), retry_exponential_backoff=True,
+      max_retry_delay=timedelta(seconds=RESET_WINDOW_SECONDS))
+def get_contributors(shard):
+    conn = None
+    repo_owner = shard["owner"]
+    repos = shard["repos"]
+    context = None
+    metrics.reset()
     try:
         context = get_current_context()
-        execution_date = context.get("dag_run").execution_date
-        contributors_list = gateway.get_contributors_per_month(
-            repo_owner, repo, execution_date)
-        repository.bulk_insert(contributors_list)
+        dag_run = context.get("dag_run")
+        execution_date = dag_run.execution_date
+
+        conn = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID).get_conn()
+        repository = Repository(conn, batch_size=int(Variable.get(
+            "GITHUB_LOAD_BATCH_SIZE", default_var="5000")))
+
+        # A retried shard skips the repositories finished by its previous tries
+        finished = repository.get_checkpoint(dag_run.run_id, repo_owner)
+        pending = [repo for repo in repos if repo["name"] not in finished]
+        logging.info(
+            f"{len(pending)} of {len(repos)} repositories of account {repo_owner} shard to crawl")
+        failures = asyncio.run(crawl_shard(
+            repo_owner, pending, execution_date, context.get("data_interval_end"), repository, dag_run.run_id))
+
+        raise_crawl_failures(failures)
 
     except RateLimitExceedError as ex:
-        logging.exception("Rate limit exceed")
-        time.sleep(ex.time_to_wait)
-        raise
+        retry_after_reset(ex)
 
     except Exception:
         logging.exception(
-            f"Unable to get contributors for {repo} repository")
+            f"Unable to get contributors for {len(repos)} repositories shard of account {repo_owner}")
         raise
 
+    finally:
+        if conn is not None:
+            conn.close()
+        if context is not None:
+            publish_metrics(context)
+
 
 with DAG(
     "github_etl",
     description="Extract all repositories contributors data",
     schedule_interval="0 0 1 * *",
-    catchup=True,
+    catchup=False,
     max_active_runs=1,
-    start_date=datetime(2016, 1, 1),
+    start_date=BACKFILL_START_DATE,
         is_paused_upon_creation=False) as dag:
 
-    repos_list = get_all_available_repositories()
+    repos_per_owner = warm_up_stats(discover_repositories())
+    shards = shard_repositories_list(repos_per_owner)
+    shards >> wait_for_rate_limit() >> get_contributors.expand(shard=shards) >> BashOperator(
+        task_id='update_dbt',
+        retries=10,
+        retry_delay=timedelta(minutes=1),
+        bash_command="cd /dbt && dbt run --profiles-dir . {{ \"--vars '{recompute_all: true}'\" if (dag_run.conf or {}).get('full_refresh') else '' }}")
+
+
+def get_backfill_id(context):
+    # Triggering the backfill again with the same id resumes it, by default clearing
+    # the failed tasks of a run resumes that run
+    dag_run = context.get("dag_run")
+    return (dag_run.conf or {}).get("backfill_id") or dag_run.run_id
+
+
+@task(retries=8, retry_delay=timedelta(minutes=1), retry_exponential_backoff=True,
+      max_retry_delay=timedelta(seconds=RESET_WINDOW_SECONDS))
+def plan_backfill_shards():
+    conn = None
+    try:
+        backfill_id = get_backfill_id(get_current_context())
+        repos_per_owner = {repo_owner: list_repositories(
+            repo_owner) for repo_owner in get_repo_owners()}
+
+        conn = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID).get_conn()
+        pending_per_owner, finished = plan_backfill(
+            Repository(conn), backfill_id, repos_per_owner)
+        logging.info(
+            f"Backfill {backfill_id} plan: {BackfillProgress(pending_per_owner, finished).report()}")
+        shards = int(Variable.get("GITHUB_CRAWL_SHARDS", default_var="8"))
+        return shard_owners(pending_per_owner, shards)
+
+    except RateLimitExceedError as ex:
+        retry_after_reset(ex)
+
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+async def backfill_shard_batches(backfill_id, repo_owner, repos, repository):
+    batch_size = int(Variable.get("GITHUB_CRAWL_BATCH_SIZE", default_var="50"))
+    poll_timeout = int(Variable.get(
+        "GITHUB_STATS_POLL_TIMEOUT", default_var="300"))
+    # A retried shard skips the repositories checkpointed by its previous tries
+    pending_per_owner, finished = plan_backfill(
+        repository, backfill_id, {repo_owner: repos})
+    progress = BackfillProgress(pending_per_owner, finished)
+    async with get_async_gateway() as async_gateway:
+        return await run_backfill(async_gateway, repository, backfill_id, pending_per_owner, progress,
+                                  BACKFILL_START_DATE, None, batch_size, poll_timeout)
+
+
+@task(retries=8, retry_delay=timedelta(minutes=1), retry_exponential_backoff=True,
+      max_retry_delay=timedelta(seconds=RESET_WINDOW_SECONDS))
+def backfill_shard(shard):
+    conn = None
+    metrics.reset()
+    context = get_current_context()
+    try:
+        conn = PostgresHook(postgres_conn_id=POSTGRES_CONN_ID).get_conn()
+        repository = Repository(conn, batch_size=int(Variable.get(
+            "GITHUB_LOAD_BATCH_SIZE", default_var="5000")))
+        failures = asyncio.run(backfill_shard_batches(
+            get_backfill_id(context), shard["owner"], shard["repos"], repository))
+        raise_crawl_failures(failures)
+
+    except RateLimitExceedError as ex:
+        retry_after_reset(ex)
+
+    finally:
+        if conn is not None:
+            conn.close()
+        publish_metrics(context)
+
+
+# Loads the whole history of the accounts at once, planned up front and resumable,
+# instead of catching up month by month
+with DAG(
+    "github_backfill",
+    description="Backfill all repositories contributors data since 2016",
+    schedule_interval=None,
+    catchup=False,
+    max_active_runs=1,
+    start_date=BACKFILL_START_DATE,
+        is_paused_upon_creation=False) as backfill_dag:
 
-    task_list = [get_contributors(repo) for repo in repos_list]
-    if(len(task_list) > 0):
-        task_list >> BashOperator(
-            task_id='update_dbt',
-            retries=10,
-            retry_delay=timedelta(minutes=1),
-            bash_command="cd /dbt && dbt run --profiles-dir . --vars 'execution_date: {{ execution_date.replace(day=1).strftime('%Y-%m-%d') }}'")
+    backfill_shards = plan_backfill_shards()
+    backfill_shards >> wait_for_rate_limit() >> backfill_shard.expand(shard=backfill_shards) >> BashOperator(
+        task_id='update_dbt',
+        retries=10,
+        retry_delay=timedelta(minutes=1),
+        bash_command="cd /dbt && dbt run --profiles-dir .")
@@ -0,0 +1,91 @@
+import codecs
+import json
+
+WHITESPACE = " \t\n\r"
+DELIMITERS = ",]" + WHITESPACE
+
+
+class JsonArrayStream():
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.state = "start"
+        self.retry_size = 0
+
+    def feed(self, chunk):
+        self.buffer += self.text.decode(chunk)
+        # An item still incomplete is decoded again once the buffer doubled, so
+        # items spanning many chunks aren't parsed over and over
+        if len(self.buffer) < self.retry_size:
+            return []
+        return self.drain(final=False)
+
+    def close(self):
+        self.buffer += self.text.decode(b"", final=True)
+        items = self.drain(final=True)
+        if self.state != "end" or self.buffer.strip(WHITESPACE):
+            raise ValueError("Invalid or incomplete JSON array")
+        return items
+
+    def drain(self, final):
+        items = []
+        position = 0
+        self.retry_size = 0
+        while self.state != "end":
+            while position < len(self.buffer) and self.buffer[position] in WHITESPACE:
+                position += 1
+            if position == len(self.buffer):
+                break
+
+            char = self.buffer[position]
+            if self.state == "start":
+                if char != "[":
+                    raise ValueError("JSON payload isn't an array")
+                self.state = "first"
+                position += 1
+            elif self.state == "separator":
+                if char not in ",]":
+                    raise ValueError(f"Unexpected {char!r} between array items")
+                self.state = "item" if char == "," else "end"
+                position += 1
+            elif self.state == "first" and char == "]":
+                self.state = "end"
+                position += 1
+            else:
+                try:
+                    item, end = self.decoder.raw_decode(self.buffer, position)
+                except json.JSONDecodeError:
+                    if final:
+                        raise ValueError("Invalid or incomplete JSON array")
+                    self.retry_size = 2 * (len(self.buffer) - position)
+                    break
+                # A number may continue on the next chunk, e.g. "-2500." then "0", scalars are kept
+                # until the delimiter after them arrived
+                if not final and not isinstance(item, (dict, list, str)) and (
+                        end == len(self.buffer) or self.buffer[end] not in DELIMITERS):
+                    break
+                items.append(item)
+                self.state = "separator"
+                position = end
+
+        self.buffer = self.buffer[position:]
+        return items
+
+
+def iter_json_array(chunks):
+    # Items of a top level array are yielded one at a time as the chunks arrive
+    stream = JsonArrayStream()
+    for chunk in chunks:
+        yield from stream.feed(chunk)
+    yield from stream.close()
+
+
+async def aiter_json_array(chunks):
+    stream = JsonArrayStream()
+    async for chunk in chunks:
+        for item in stream.feed(chunk):
+            yield item
+    for item in stream.close():
+        yield item
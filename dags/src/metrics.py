@@ -0,0 +1,181 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metrics():
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = defaultdict(float)
+            self.gauges = {}
+            self.histograms = {}
+            # Stage seconds per repository only go to the run summary, too many series for Prometheus
+            self.repositories = defaultdict(lambda: defaultdict(float))
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.counters[(name, label_key(labels))] += value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [
+                    [0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def observe_stage(self, stage, seconds, owner=None, repo_name=None):
+        self.observe("github_stage_seconds", seconds, stage=stage)
+        if repo_name is not None:
+            self.add_repository_seconds(owner, repo_name, stage, seconds)
+
+    def add_repository_seconds(self, owner, repo_name, stage, seconds):
+        with self.lock:
+            self.repositories[f"{owner}/{repo_name}"][stage] += seconds
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started_at, **labels)
+
+    @contextmanager
+    def stage(self, stage, owner=None, repo_name=None):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() -
+                               started_at, owner, repo_name)
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for kind, values in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (series, labels), value in sorted(values.items()):
+                        if series == name:
+                            lines.append(
+                                f"{name}{format_labels(labels)} {value:g}")
+
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (series, labels), (counts, total, count) in sorted(self.histograms.items()):
+                    if series != name:
+                        continue
+                    cumulative = 0
+                    for bucket, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                        cumulative += bucket_count
+                        lines.append(
+                            f"{name}_bucket{format_labels(labels + (('le', str(bucket)),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {total:g}")
+                    lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        with self.lock:
+            return {
+                "counters": {series_name(key): value for key, value in sorted(self.counters.items())},
+                "gauges": {series_name(key): value for key, value in sorted(self.gauges.items())},
+                "histograms": {series_name(key): {"count": count, "sum": round(total, 6),
+                                                  "p50": self.quantile(counts, count, 0.5),
+                                                  "p99": self.quantile(counts, count, 0.99)}
+                               for key, (counts, total, count) in sorted(self.histograms.items())},
+                "repositories": {repo: {stage: round(seconds, 6) for stage, seconds in stages.items()}
+                                 for repo, stages in sorted(self.repositories.items())},
+            }
+
+    def write(self, directory, name):
+        # Prometheus textfile for the node exporter collector next to the JSON summary,
+        # both replaced atomically so a scrape never reads a partial file
+        os.makedirs(directory, exist_ok=True)
+        for extension, content in (("prom", self.to_prometheus()), ("json", json.dumps(self.summary(), indent=2))):
+            path = os.path.join(directory, f"{name}.{extension}")
+            with open(f"{path}.tmp", "w") as metrics_file:
+                metrics_file.write(content)
+            os.replace(f"{path}.tmp", path)
+
+    def quantile(self, counts, count, quantile):
+        # Upper bound of the bucket holding the quantile, as Prometheus estimates it
+        if count == 0:
+            return None
+        rank = quantile * count
+        cumulative = 0
+        for bucket, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return bucket
+        return self.buckets[-1]
+
+
+class StageTimer():
+
+    def __init__(self, owner, repo_name, registry=None):
+        # Many short laps of one repository are added up and recorded once
+        self.owner = owner
+        self.repo_name = repo_name
+        self.registry = registry if registry is not None else metrics
+        self.seconds = defaultdict(float)
+        self.resume()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.seconds[stage] += now - self.started_at
+        self.started_at = now
+
+    def resume(self):
+        # The time spent by the consumer of a generator isn't counted
+        self.started_at = time.perf_counter()
+
+    def record(self):
+        for stage, seconds in self.seconds.items():
+            self.registry.observe_stage(
+                stage, seconds, self.owner, self.repo_name)
+        self.seconds.clear()
+
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def series_name(key):
+    name, labels = key
+    return f"{name}{format_labels(labels)}"
+
+
+# Process wide registry shared by the gateways, the repository and the DAG tasks
+metrics = Metrics()
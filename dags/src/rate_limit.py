@@ -0,0 +1,120 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from src.exceptions import RateLimitExceedError
+
+# Github resets the rate limit every hour
+RESET_WINDOW_SECONDS = 3600
+
+
+class RateLimitBudget():
+
+    def __init__(self, path, tokens, limit=5000, pace_below=0.2):
+        if not tokens:
+            tokens = [None]
+        self.path = path
+        self.tokens = list(tokens)
+        self.limit = limit
+        self.pace_below = pace_below
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, count=1):
+        with self.locked_state() as state:
+            now = time.time()
+            candidates = []
+            for token in self.tokens:
+                budget = self.refresh(state, token, now)
+                if budget["remaining"] - budget["reserved"] >= count:
+                    candidates.append((token, budget))
+
+            if not candidates:
+                reset_time = min(self.refresh(state, token, now)["reset"]
+                                 for token in self.tokens)
+                seconds_to_wait = max(reset_time - now, 0)
+                raise RateLimitExceedError(
+                    f"Github Rate budget of {len(self.tokens)} tokens exhausted with next reset time window is in about {seconds_to_wait} seconds", seconds_to_wait)
+
+            # Rotate to the token with the largest budget left
+            token, budget = max(
+                candidates, key=lambda candidate: candidate[1]["remaining"] - candidate[1]["reserved"])
+            budget["reserved"] += count
+
+            # Close to exhaustion the requests are spread until the reset window
+            delay = 0
+            available = budget["remaining"] - budget["reserved"] + count
+            if available < budget["limit"] * self.pace_below:
+                interval = max(budget["reset"] - now, 0) / available
+                next_request_at = max(budget["next_request_at"], now)
+                delay = next_request_at - now
+                budget["next_request_at"] = next_request_at + interval * count
+            return token, delay
+
+    def seconds_to_wait(self, count=1):
+        # Time until a token has budget left, nothing is reserved
+        with self.locked_state() as state:
+            now = time.time()
+            budgets = [self.refresh(state, token, now)
+                       for token in self.tokens]
+            if any(budget["remaining"] - budget["reserved"] >= count for budget in budgets):
+                return 0
+            return max(min(budget["reset"] for budget in budgets) - now, 0)
+
+    def update(self, token, headers, reserved=1):
+        with self.locked_state() as state:
+            budget = self.release_reserved(state, token, reserved)
+            if headers.get("X-RateLimit-Remaining") is not None:
+                budget["remaining"] = int(headers["X-RateLimit-Remaining"])
+            if headers.get("X-RateLimit-Limit") is not None:
+                budget["limit"] = int(headers["X-RateLimit-Limit"])
+            if headers.get("X-RateLimit-Reset") is not None:
+                budget["reset"] = float(headers["X-RateLimit-Reset"])
+
+    def release(self, token, reserved=1):
+        # Requests without a response give their reservation back
+        with self.locked_state() as state:
+            self.release_reserved(state, token, reserved)
+
+    def release_reserved(self, state, token, reserved):
+        budget = self.refresh(state, token, time.time())
+        budget["reserved"] = max(budget["reserved"] - reserved, 0)
+        return budget
+
+    def refresh(self, state, token, now):
+        key = token_key(token)
+        budget = state.get(key)
+        if budget is None or now >= budget["reset"]:
+            budget = {"remaining": self.limit, "limit": self.limit, "reserved": 0,
+                      "reset": now + RESET_WINDOW_SECONDS, "next_request_at": now}
+            state[key] = budget
+        return budget
+
+    @contextmanager
+    def locked_state(self):
+        # Every worker on the host shares the budget through an exclusive file lock
+        with open(f"{self.path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.path) as state_file:
+                        state = json.load(state_file)
+                except (FileNotFoundError, ValueError):
+                    state = {}
+                yield state
+                with open(f"{self.path}.tmp", "w") as state_file:
+                    json.dump(state, state_file)
+                os.replace(f"{self.path}.tmp", self.path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def token_key(token):
+    # Tokens are never written to disk
+    if token is None:
+        return "anonymous"
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,102 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from datetime import datetime
+
+from src.archive import ResponseArchive, load_object
+from src.gateway import parse_contributors
+from src.repository import Repository
+
+
+def extract_archived(task):
+    # Runs on the worker processes, only the archive directory is shared
+    directory, archived_response, start_month, end_month = task
+    body = load_object(directory, archived_response.digest)
+    return parse_contributors(archived_response.owner, archived_response.repo_name, archived_response.status,
+                              body, start_month, end_month)
+
+
+def replay(archive, conn=None, owner=None, until=None, start_month=None, end_month=None, processes=None,
+           load_batch_size=5000, replace=False):
+    started_at = time.monotonic()
+    responses = archive.latest(owner, "contributors", until)
+    repository = Repository(conn, load_batch_size) if conn else None
+
+    rows = 0
+    tasks = [(archive.directory, response, start_month, end_month)
+             for response in responses]
+    with multiprocessing.Pool(processes) as pool:
+        batches = batch_contributors(pool.imap_unordered(
+            extract_archived, tasks, chunksize=max(len(tasks) // ((processes or os.cpu_count()) * 4), 1)), load_batch_size)
+        if repository and replace:
+            # Only the replayed owner and months are deleted, in the load transaction
+            rows = repository.replace_contributors(
+                batches, owner, start_month, end_month)
+        else:
+            for contributors_list in batches:
+                rows += len(contributors_list)
+                if repository:
+                    repository.bulk_insert(contributors_list)
+
+    elapsed = max(time.monotonic() - started_at, 1e-9)
+    logging.info(
+        f"Replayed {len(responses)} archived responses into {rows} rows in {elapsed:.3f}s")
+    return {"repositories": len(responses), "rows": rows, "loaded": repository is not None,
+            "elapsed_seconds": round(elapsed, 3), "rows_per_second": round(rows / elapsed, 1)}
+
+
+def batch_contributors(extracted, batch_size):
+    # Rows of several repositories are loaded together
+    pending = []
+    for contributors in extracted:
+        pending += contributors
+        if len(pending) >= batch_size:
+            yield pending
+            pending = []
+    if pending:
+        yield pending
+
+
+def parse_month(value):
+    return datetime.strptime(value, "%Y-%m") if value else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuilds github_repo_data from the raw response archive, without calling Github")
+    parser.add_argument("--archive", required=True,
+                        help="archive directory, e.g. /opt/airflow/data/archive")
+    parser.add_argument("--owner", default=None)
+    parser.add_argument("--until", default=None,
+                        help="replays the responses fetched until this ISO date")
+    parser.add_argument("--start-month", default=None, help="YYYY-MM")
+    parser.add_argument("--end-month", default=None, help="YYYY-MM")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--load-batch-size", type=int, default=5000)
+    parser.add_argument("--dsn", default=os.environ.get("REPLAY_POSTGRES_DSN"),
+                        help="loads into Postgres when set, only extracts otherwise")
+    parser.add_argument("--replace", action="store_true",
+                        help="replaces the rows of the owner and months range, or every row, in a single transaction")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    conn = None
+    if args.dsn:
+        import psycopg2
+        conn = psycopg2.connect(args.dsn)
+    try:
+        until = datetime.fromisoformat(
+            args.until).timestamp() if args.until else None
+        summary = replay(ResponseArchive(args.archive), conn, args.owner, until, parse_month(args.start_month),
+                         parse_month(args.end_month), args.processes, args.load_batch_size, args.replace)
+    finally:
+        if conn is not None:
+            conn.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
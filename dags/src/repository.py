@@ -1,21 +1,213 @@
+import csv
+import io
+import logging
+import time
+from collections import Counter
+
+from src.metrics import metrics
+
+COLUMNS = ("repo_owner", "contributor", "month", "repo_name", "total_commits")
+
+STAGING_TABLE_SQL = '''CREATE TEMP TABLE IF NOT EXISTS github_repo_data_staging
+(LIKE github_repo_data INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'''
+
+COPY_SQL = f'''COPY github_repo_data_staging({",".join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)'''
+
+ENSURE_PARTITION_SQL = '''SELECT ensure_month_partition(%s, %s)'''
+
+# DISTINCT ON keeps a single row per key, ON CONFLICT can't update the same row twice.
+# A contributor moved to another month is deleted from its old partition and the old
+# month kept on previous_month. The old month is read from github_contributor_months, a
+# single primary key lookup per row, the key alone would probe the index of every
+# partition. Unchanged rows keep their loaded_at so dbt doesn't recompute their month
+MERGE_SQL = f'''WITH staged AS (
+SELECT DISTINCT ON (contributor,repo_owner,repo_name) {",".join(COLUMNS)} FROM github_repo_data_staging
+), previous AS (
+SELECT contributor_months.contributor, contributor_months.repo_owner, contributor_months.repo_name, contributor_months.month
+FROM github_contributor_months contributor_months JOIN staged ON contributor_months.contributor = staged.contributor
+AND contributor_months.repo_owner = staged.repo_owner AND contributor_months.repo_name = staged.repo_name
+WHERE contributor_months.month <> staged.month::date
+), moved AS (
+DELETE FROM github_repo_data USING previous
+WHERE github_repo_data.contributor = previous.contributor AND github_repo_data.repo_owner = previous.repo_owner
+AND github_repo_data.repo_name = previous.repo_name AND github_repo_data.month = previous.month
+RETURNING github_repo_data.contributor, github_repo_data.repo_owner, github_repo_data.repo_name, github_repo_data.month
+), months AS (
+INSERT INTO github_contributor_months(contributor,repo_owner,repo_name,month)
+SELECT contributor, repo_owner, repo_name, month::date FROM staged
+ON CONFLICT (repo_owner,repo_name,contributor)
+DO UPDATE SET month = EXCLUDED.month
+WHERE github_contributor_months.month <> EXCLUDED.month
+)
+INSERT INTO github_repo_data({",".join(COLUMNS)},previous_month)
+SELECT {",".join(f"staged.{column}" for column in COLUMNS)}, moved.month FROM staged
+LEFT JOIN moved ON moved.contributor = staged.contributor AND moved.repo_owner = staged.repo_owner AND moved.repo_name = staged.repo_name
+ON CONFLICT (contributor,repo_owner,repo_name,month)
+DO UPDATE SET
+total_commits = EXCLUDED.total_commits,
+loaded_at = now()
+WHERE github_repo_data.total_commits IS DISTINCT FROM EXCLUDED.total_commits'''
+
+
+CRAWL_STATE_SQL = '''SELECT repo_name, pushed_at FROM github_crawl_state WHERE repo_owner = %s'''
+
+SAVE_CRAWL_STATE_SQL = '''INSERT INTO github_crawl_state(repo_owner,repo_name,pushed_at,crawled_at)
+SELECT %s, repo_name, pushed_at, now()
+FROM unnest(%s::varchar[], %s::timestamptz[]) AS state(repo_name, pushed_at)
+ON CONFLICT (repo_owner,repo_name)
+DO UPDATE SET
+pushed_at = EXCLUDED.pushed_at,
+crawled_at = EXCLUDED.crawled_at'''
+
+CHECKPOINT_SQL = '''SELECT repo_name FROM github_crawl_checkpoint WHERE run_id = %s AND repo_owner = %s'''
+
+SAVE_CHECKPOINT_SQL = '''INSERT INTO github_crawl_checkpoint(run_id,repo_owner,repo_name)
+SELECT %s, %s, repo_name FROM unnest(%s::varchar[]) AS checkpoint(repo_name)
+ON CONFLICT (run_id,repo_owner,repo_name) DO NOTHING'''
+
+PRUNE_CHECKPOINTS_SQL = '''DELETE FROM github_crawl_checkpoint WHERE finished_at < now() - make_interval(days => %s)'''
+
+
 class Repository():
-    def __init__(self, conn):
+    def __init__(self, conn, batch_size=5000):
+        if batch_size < 1:
+            raise ValueError("batch_size should be greater than 0")
         self.conn = conn
+        self.batch_size = batch_size
+        self.partitions = set()
 
     def bulk_insert(self, contributors_list):
         if(len(contributors_list) == 0):
             return
 
+        started_at = time.monotonic()
+        ps_cursor = self.conn.cursor()
+        self.ensure_partitions(ps_cursor, contributors_list)
+        self.merge(ps_cursor, contributors_list)
+        self.conn.commit()
+        ps_cursor.close()
+
+        elapsed = max(time.monotonic() - started_at, 1e-9)
+        record_load(contributors_list, elapsed)
+        logging.info(
+            f"Loaded {len(contributors_list)} rows in {elapsed:.3f}s ({len(contributors_list) / elapsed:.0f} rows/sec)")
+
+    def merge(self, ps_cursor, contributors_list):
+        ps_cursor.execute(STAGING_TABLE_SQL)
+        for offset in range(0, len(contributors_list), self.batch_size):
+            batch = contributors_list[offset:offset + self.batch_size]
+            ps_cursor.copy_expert(COPY_SQL, self.to_csv(batch))
+            ps_cursor.execute(MERGE_SQL)
+            ps_cursor.execute("TRUNCATE github_repo_data_staging")
+
+    def ensure_partitions(self, ps_cursor, contributors_list, commit=True):
+        months = {contributor["month"]
+                  for contributor in contributors_list} - self.partitions
+        if(len(months) == 0):
+            return months
+
+        for month in sorted(months):
+            ps_cursor.execute(ENSURE_PARTITION_SQL, ("github_repo_data", month))
+        # Committed on its own so the parent table lock isn't held during the load
+        if commit:
+            self.conn.commit()
+            self.partitions |= months
+        return months
+
+    def replace_contributors(self, batches, repo_owner=None, start_month=None, end_month=None):
+        # The delete and the load are a single transaction, a failed load keeps the old rows.
+        # Partitions created by the load lock the parent table until the commit
         ps_cursor = self.conn.cursor()
+        self.delete_contributors(ps_cursor, repo_owner, start_month, end_month)
+        rows = 0
+        months = set()
+        for contributors_list in batches:
+            months |= self.ensure_partitions(ps_cursor, contributors_list, commit=False)
+            self.merge(ps_cursor, contributors_list)
+            rows += len(contributors_list)
+        self.conn.commit()
+        ps_cursor.close()
+        self.partitions |= months
+        return rows
+
+    def delete_contributors(self, ps_cursor, repo_owner=None, start_month=None, end_month=None):
+        # Bounded to the owner and the months replaced, both inclusive
+        conditions = []
+        params = []
+        if repo_owner is not None:
+            conditions.append("repo_owner = %s")
+            params.append(repo_owner)
+        if start_month is not None:
+            conditions.append("month >= %s")
+            params.append(start_month.strftime("%Y-%m-01"))
+        if end_month is not None:
+            conditions.append("month <= %s")
+            params.append(end_month.strftime("%Y-%m-01"))
+        if(len(conditions) == 0):
+            ps_cursor.execute("TRUNCATE github_repo_data, github_contributor_months")
+            return
+
+        for table in ("github_repo_data", "github_contributor_months"):
+            ps_cursor.execute(
+                f"DELETE FROM {table} WHERE {' AND '.join(conditions)}", tuple(params))
+
+    def to_csv(self, contributors_list):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
         for contributor in contributors_list:
-            sql = f'''INSERT INTO github_repo_data(repo_owner,contributor,month,repo_name,total_commits) VALUES(%(repo_owner)s,%(contributor)s,%(month)s,%(repo_name)s,%(total_commits)s) ON CONFLICT (contributor,repo_owner,repo_name) 
-            DO UPDATE SET 
-            repo_owner = (%(repo_owner)s),
-            contributor = (%(contributor)s),
-            month = (%(month)s),
-            repo_name = (%(repo_name)s),
-            total_commits = (%(total_commits)s)
-            '''
-            ps_cursor.execute(sql, contributor)
+            writer.writerow([contributor[column] for column in COLUMNS])
+        buffer.seek(0)
+        return buffer
+
+    def get_crawl_state(self, repo_owner):
+        ps_cursor = self.conn.cursor()
+        ps_cursor.execute(CRAWL_STATE_SQL, (repo_owner,))
+        rows = ps_cursor.fetchall()
+        ps_cursor.close()
+        return {repo_name: {"pushed_at": pushed_at} for repo_name, pushed_at in rows}
+
+    def save_crawl_state(self, repo_owner, crawled_repos):
+        if(len(crawled_repos) == 0):
+            return
+
+        # A single statement for the whole batch
+        ps_cursor = self.conn.cursor()
+        ps_cursor.execute(SAVE_CRAWL_STATE_SQL, (repo_owner,
+                                                 [repo["name"] for repo in crawled_repos],
+                                                 [repo.get("pushed_at") for repo in crawled_repos]))
         self.conn.commit()
         ps_cursor.close()
+
+    def get_checkpoint(self, run_id, repo_owner):
+        ps_cursor = self.conn.cursor()
+        ps_cursor.execute(CHECKPOINT_SQL, (run_id, repo_owner))
+        rows = ps_cursor.fetchall()
+        ps_cursor.close()
+        return {repo_name for repo_name, in rows}
+
+    def save_checkpoint(self, run_id, repo_owner, repo_names):
+        if(len(repo_names) == 0):
+            return
+
+        ps_cursor = self.conn.cursor()
+        ps_cursor.execute(SAVE_CHECKPOINT_SQL,
+                          (run_id, repo_owner, list(repo_names)))
+        self.conn.commit()
+        ps_cursor.close()
+
+    def prune_checkpoints(self, days=30):
+        ps_cursor = self.conn.cursor()
+        ps_cursor.execute(PRUNE_CHECKPOINTS_SQL, (days,))
+        self.conn.commit()
+        ps_cursor.close()
+
+
+def record_load(contributors_list, seconds):
+    # Batches mix repositories, the load time is split on their share of the rows
+    metrics.observe_stage("load", seconds)
+    metrics.inc("github_rows_loaded_total", len(contributors_list))
+    rows = Counter((contributor["repo_owner"], contributor["repo_name"])
+                   for contributor in contributors_list)
+    for (owner, repo_name), count in rows.items():
+        metrics.add_repository_seconds(
+            owner, repo_name, "load", seconds * count / len(contributors_list))
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import time
+import zlib
+from collections import namedtuple
+from contextlib import contextmanager
+
+CachedResponse = namedtuple("CachedResponse", ["etag", "last_modified", "body"])
+
+
+class ResponseCache():
+
+    def __init__(self, path, max_size=512 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL)''')
+
+    @contextmanager
+    def connect(self):
+        # Several tasks can share the same cache file
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, url):
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT etag, last_modified, body FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        return CachedResponse(row[0], row[1], zlib.decompress(row[2]))
+
+    def set(self, url, etag, last_modified, body):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        compressed_body = zlib.compress(body)
+        with self.connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses(url, etag, last_modified, body, size, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (url, etag, last_modified, compressed_body, len(compressed_body), time.time()))
+            self.evict(conn)
+
+    def evict(self, conn):
+        total_size = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if(total_size <= self.max_size):
+            return
+
+        # Least recently used entries are removed first
+        expired_urls = []
+        for url, size in conn.execute("SELECT url, size FROM responses ORDER BY accessed_at"):
+            if(total_size <= self.max_size):
+                break
+            expired_urls.append((url,))
+            total_size -= size
+        conn.executemany("DELETE FROM responses WHERE url = ?", expired_urls)
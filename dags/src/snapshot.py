@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+from datetime import datetime
+
+# Snapshots written with another layout are refreshed from Github
+SNAPSHOT_VERSION = 2
+
+
+class RepositoriesSnapshot():
+
+    def __init__(self, directory, owner):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{owner}_repos.json")
+
+    def load(self, ttl):
+        try:
+            with open(self.path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+
+        # Expired snapshots must be refreshed from Github
+        snapshot_age = datetime.now().timestamp() - snapshot["created_at"]
+        if(snapshot_age > ttl.total_seconds()):
+            return None
+        return snapshot["repositories"]
+
+    def save(self, repositories):
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot = {"version": SNAPSHOT_VERSION, "created_at": datetime.now().timestamp(),
+                    "repositories": repositories}
+
+        # Write on a temporary file first so readers never see a partial snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from mock.mock import Mock
+from benchmark.mock_github import MockGithubServer, SyntheticOrg
+from src.archive import ResponseArchive
+from src.gateway import GitGateway
+from src.replay import replay
+
+
+class ArchiveTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = ResponseArchive(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_should_keep_a_payload_once(self):
+        url = "https://api.github.com/repos/facebook/react/stats/contributors"
+        first_digest = self.archive.store(url, 200, b"[]", fetched_at=1)
+        second_digest = self.archive.store(url, 200, "[]", fetched_at=2)
+
+        self.assertEqual(first_digest, second_digest)
+        self.assertEqual(b"[]", self.archive.load(first_digest))
+        objects = [name for _, _, names in os.walk(
+            self.archive.objects_directory) for name in names]
+        self.assertEqual(1, len(objects))
+
+    def test_latest_should_return_the_last_response_of_each_repository_until_a_time(self):
+        url = "https://api.github.com/repos/facebook/{}/stats/contributors"
+        self.archive.store(url.format("react"), 200, b"[1]", fetched_at=1)
+        self.archive.store(url.format("react"), 200, b"[2]", fetched_at=2)
+        self.archive.store(url.format("react"), 200, b"[3]", fetched_at=3)
+        self.archive.store(url.format("jest"), 204, b"", fetched_at=1)
+        self.archive.store(
+            "https://api.github.com/users/facebook/repos?page=1&per_page=100", 200, b"[]", fetched_at=1)
+
+        result = self.archive.latest("facebook", until=2)
+
+        self.assertEqual([("jest", 204), ("react", 200)], [
+                         (response.repo_name, response.status) for response in result])
+        self.assertEqual(b"[2]", self.archive.load(result[1].digest))
+        self.assertEqual([], self.archive.latest("google"))
+
+    def test_discarded_writer_should_not_index_the_response(self):
+        writer = self.archive.writer(
+            "https://api.github.com/repos/facebook/react/stats/contributors", 200)
+        writer.write(b"[{")
+        writer.discard()
+
+        self.assertEqual([], self.archive.latest())
+        self.assertEqual([], os.listdir(self.archive.objects_directory))
+
+    def test_gateway_should_archive_plain_and_streamed_responses(self):
+        org = SyntheticOrg("facebook", repos=2, contributors=3, weeks=10)
+        with MockGithubServer([org]) as server:
+            gateway = GitGateway(
+                "123", base_url=server.base_url, archive=self.archive)
+            plain = gateway.get_contributors_per_months(
+                "facebook", "facebook-repo-0")
+            streamed = list(gateway.iter_contributors_per_months(
+                "facebook", "facebook-repo-1"))
+            gateway.get_repositories("facebook")
+
+        self.assertEqual(3, len(plain))
+        self.assertEqual(3, len(streamed))
+        self.assertEqual(["facebook-repo-0", "facebook-repo-1"],
+                         [response.repo_name for response in self.archive.latest("facebook")])
+        self.assertEqual(1, len(self.archive.latest(
+            "facebook", kind="repositories")))
+
+    def test_replay_should_extract_and_load_the_archived_responses(self):
+        org = SyntheticOrg("facebook", repos=5, contributors=4, weeks=10)
+        for repo_name in org.repo_names():
+            body, _ = MockGithubServer([org]).contributors_payload(org, repo_name)
+            self.archive.store(
+                f"https://api.github.com/repos/facebook/{repo_name}/stats/contributors", 200, body)
+        conn = Mock()
+
+        summary = replay(self.archive, conn, "facebook",
+                         processes=2, load_batch_size=8, replace=True)
+
+        self.assertEqual(5, summary["repositories"])
+        self.assertEqual(20, summary["rows"])
+        loaded = [c[0][1].getvalue().count("\n")
+                  for c in conn.cursor().copy_expert.call_args_list]
+        self.assertEqual(20, sum(loaded))
+        conn.cursor().execute.assert_any_call(
+            "DELETE FROM github_repo_data WHERE repo_owner = %s", ("facebook",))
+        self.assertEqual(1, conn.commit.call_count)
+
+    def test_replay_with_replace_and_months_should_only_delete_the_replayed_months(self):
+        org = SyntheticOrg("facebook", repos=2, contributors=4, weeks=10)
+        for repo_name in org.repo_names():
+            body, _ = MockGithubServer([org]).contributors_payload(org, repo_name)
+            self.archive.store(
+                f"https://api.github.com/repos/facebook/{repo_name}/stats/contributors", 200, body)
+        conn = Mock()
+
+        summary = replay(self.archive, conn, "facebook", start_month=datetime(2016, 2, 1),
+                         end_month=datetime(2016, 2, 1), processes=1, replace=True)
+
+        statements = [c[0] for c in conn.cursor().execute.call_args_list]
+        self.assertEqual(("DELETE FROM github_repo_data WHERE repo_owner = %s AND month >= %s AND month <= %s",
+                          ("facebook", "2016-02-01", "2016-02-01")), statements[0])
+        loaded = "".join(c[0][1].getvalue() for c in conn.cursor().copy_expert.call_args_list)
+        self.assertEqual(summary["rows"], loaded.count("\n"))
+        self.assertEqual(summary["rows"], loaded.count(",2016-02-01,"))
+        self.assertEqual(1, conn.commit.call_count)
+
+    def test_replay_without_connection_should_only_extract(self):
+        self.archive.store(
+            "https://api.github.com/repos/facebook/react/stats/contributors", 204, b"")
+
+        summary = replay(self.archive, processes=1)
+
+        self.assertEqual({"repositories": 1, "rows": 0, "loaded": False},
+                         {key: summary[key] for key in ("repositories", "rows", "loaded")})
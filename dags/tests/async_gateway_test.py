@@ -0,0 +1,198 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+
+import aiohttp
+from aiohttp import web
+from mock.mock import Mock, patch
+from aiohttp.test_utils import TestServer
+from src import gateway as gateway_module
+from src.async_gateway import AsyncGitGateway
+from src.exceptions import (HttpRequestError, RateLimitExceedError,
+                            StatsNotReadyError)
+from src.response_cache import ResponseCache
+
+
+class AsyncGatewayTests(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.requests = []
+        self.cold_requests = 0
+        self.not_modified = 0
+        app = web.Application()
+        app.router.add_get("/users/{owner}/repos", self.repos_handler)
+        app.router.add_get(
+            "/repos/{owner}/{repo}/stats/contributors", self.contributors_handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.base_url = str(self.server.make_url("")).rstrip("/")
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def repos_handler(self, request):
+        self.requests.append(request)
+        if request.match_info["owner"] == "paged":
+            page = int(request.query["page"])
+            headers = dict(self.rate_limit(
+            ), Link=f'<{self.base_url}/users/paged/repos?page=4&per_page=100>; rel="last"')
+            return web.json_response([{"name": f"page{page}"}], headers=headers)
+        return web.json_response([{"name": "test1"}, {"name": "test2"}], headers=self.rate_limit())
+
+    async def contributors_handler(self, request):
+        self.requests.append(request)
+        repo = request.match_info["repo"]
+        if repo == "broken":
+            return web.Response(status=500, text="[]", headers=self.rate_limit())
+        if repo == "cold":
+            self.cold_requests += 1
+            if self.cold_requests < 3:
+                return web.json_response({}, status=202, headers=self.rate_limit())
+        if repo == "frozen":
+            return web.json_response({}, status=202, headers=self.rate_limit())
+        if repo == "limited":
+            return web.Response(status=403, text="[]", headers=self.rate_limit(True))
+        if request.headers.get("If-None-Match") == f'"{repo}"':
+            self.not_modified += 1
+            return web.Response(status=304, headers=self.rate_limit())
+        return web.json_response([{"total": 1, "weeks": [{"c": 2, "w": datetime(2020, 1, 5).timestamp()}],
+                                   "author": {"login": f"{repo}-user"}}], headers=dict(self.rate_limit(), ETag=f'"{repo}"'))
+
+    async def test_get_repositories_should_return_repository_metadata(self):
+        async with AsyncGitGateway("123", base_url=self.base_url) as gateway:
+            result = await gateway.get_repositories("facebook")
+
+        self.assertEqual([{"name": "test1", "pushed_at": None, "size": None, "archived": False},
+                          {"name": "test2", "pushed_at": None, "size": None, "archived": False}], result)
+        self.assertEqual("token 123", self.requests[0].headers["Authorization"])
+
+    async def test_get_all_repositories_should_request_remaining_pages(self):
+        async with AsyncGitGateway("123", base_url=self.base_url) as gateway:
+            result = await gateway.get_all_repositories("paged")
+
+        self.assertEqual(["page1", "page2", "page3", "page4"],
+                         [repo["name"] for repo in result])
+        self.assertEqual("100", self.requests[0].query["per_page"])
+
+    async def test_crawl_contributors_should_return_results_per_repository(self):
+        async with AsyncGitGateway("123", base_url=self.base_url, concurrency=2) as gateway:
+            result = await gateway.crawl_contributors("facebook", ["react", "jest", "broken", "limited"])
+
+        self.assertEqual([{'repo_owner': 'facebook', 'contributor': 'react-user', 'month': '2020-01-01',
+                           'repo_name': 'react', 'total_commits': 2}], result["react"])
+        self.assertEqual("jest-user", result["jest"][0]["contributor"])
+        self.assertIsInstance(result["broken"], HttpRequestError)
+        self.assertEqual(500, result["broken"].status)
+        self.assertIsInstance(result["limited"], RateLimitExceedError)
+
+    async def test_crawl_contributors_should_poll_repositories_while_stats_are_computed(self):
+        async with AsyncGitGateway("123", base_url=self.base_url, poll_interval=0.01) as gateway:
+            result = await gateway.crawl_contributors("facebook", ["cold", "frozen", "react"], poll_timeout=0.5)
+
+        self.assertEqual(3, self.cold_requests)
+        self.assertEqual("cold-user", result["cold"][0]["contributor"])
+        self.assertIsInstance(result["frozen"], StatsNotReadyError)
+        self.assertEqual("react-user", result["react"][0]["contributor"])
+
+    async def test_warm_up_stats_should_report_repositories_readiness(self):
+        async with AsyncGitGateway("123", base_url=self.base_url) as gateway:
+            result = await gateway.warm_up_stats("facebook", ["cold", "react", "broken"])
+
+        self.assertEqual(1, self.cold_requests)
+        self.assertEqual({"cold": "computing", "react": "ready", "broken": "failed"}, result)
+
+    async def test_crawl_after_warm_up_should_revalidate_the_cached_stats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(os.path.join(directory, "cache.sqlite"))
+            async with AsyncGitGateway("123", base_url=self.base_url, cache=cache) as gateway:
+                await gateway.warm_up_stats("facebook", ["react"])
+                result = await gateway.crawl_contributors("facebook", ["react"])
+
+        self.assertEqual(1, self.not_modified)
+        self.assertEqual("react-user", result["react"][0]["contributor"])
+
+    async def test_warm_up_with_streamed_stats_should_not_keep_the_payloads(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(os.path.join(directory, "cache.sqlite"))
+            async with AsyncGitGateway("123", base_url=self.base_url, cache=cache, stream_stats=True) as gateway:
+                result = await gateway.warm_up_stats("facebook", ["cold", "react", "broken"])
+            cached_response = cache.get(
+                f"{self.base_url}/repos/facebook/react/stats/contributors")
+
+        self.assertEqual({"cold": "computing", "react": "ready", "broken": "failed"}, result)
+        self.assertIsNone(cached_response)
+
+    async def test_streamed_stats_not_modified_should_parse_the_cached_body_in_chunks(self):
+        with tempfile.TemporaryDirectory() as directory, patch.object(gateway_module, "STREAM_CHUNK_SIZE", 8):
+            cache = ResponseCache(os.path.join(directory, "cache.sqlite"))
+            async with AsyncGitGateway("123", base_url=self.base_url, cache=cache) as gateway:
+                await gateway.warm_up_stats("facebook", ["react"])
+            async with AsyncGitGateway("123", base_url=self.base_url, cache=cache, stream_stats=True) as gateway:
+                result = await gateway.crawl_contributors("facebook", ["react"])
+
+        self.assertEqual(1, self.not_modified)
+        self.assertEqual([{'repo_owner': 'facebook', 'contributor': 'react-user', 'month': '2020-01-01',
+                           'repo_name': 'react', 'total_commits': 2}], result["react"])
+
+    async def test_crawl_contributors_with_streamed_stats_should_return_results_per_repository(self):
+        async with AsyncGitGateway("123", base_url=self.base_url, poll_interval=0.01, stream_stats=True) as gateway:
+            result = await gateway.crawl_contributors("facebook", ["react", "cold", "broken"], poll_timeout=0.5)
+
+        self.assertEqual([{'repo_owner': 'facebook', 'contributor': 'react-user', 'month': '2020-01-01',
+                           'repo_name': 'react', 'total_commits': 2}], result["react"])
+        self.assertEqual("cold-user", result["cold"][0]["contributor"])
+        self.assertIsInstance(result["broken"], HttpRequestError)
+
+    async def test_budget_and_cache_should_be_called_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        calls = []
+
+        class Budget():
+            def acquire(self):
+                calls.append(("acquire", threading.get_ident()))
+                return "123", 0
+
+            def update(self, token, headers):
+                calls.append(("update", threading.get_ident()))
+
+        class Cache():
+            def get(self, url):
+                calls.append(("get", threading.get_ident()))
+
+            def set(self, url, etag, last_modified, body):
+                calls.append(("set", threading.get_ident()))
+
+        async with AsyncGitGateway("123", base_url=self.base_url, budget=Budget(), cache=Cache()) as gateway:
+            await gateway.request(f"{self.base_url}/repos/facebook/react/stats/contributors")
+
+        self.assertEqual(["acquire", "get", "update", "set"], [name for name, _ in calls])
+        self.assertTrue(all(thread != loop_thread for _, thread in calls))
+
+    async def test_request_transport_error_should_release_the_reserved_budget(self):
+        budget = Mock()
+        budget.acquire.return_value = ("123", 0)
+
+        async with AsyncGitGateway("123", base_url="http://127.0.0.1:1", budget=budget, stream_stats=True) as gateway:
+            result = await gateway.crawl_contributors("facebook", ["react"], poll_timeout=0)
+            with self.assertRaises(aiohttp.ClientError):
+                await gateway.get_repositories("facebook")
+
+        self.assertIsInstance(result["react"], aiohttp.ClientError)
+        self.assertEqual(2, budget.release.call_count)
+        budget.update.assert_not_called()
+
+    async def test_request_outside_context_manager_should_raise_an_exception(self):
+        gateway = AsyncGitGateway("123", base_url=self.base_url)
+
+        with self.assertRaises(RuntimeError):
+            await gateway.get_repositories("facebook")
+
+    def rate_limit(self, reached=False):
+        return {'X-RateLimit-Remaining': "0" if reached else "100", 'X-RateLimit-Limit': "500",
+                'X-RateLimit-Reset': str(int((datetime.now() + timedelta(seconds=1)).timestamp()))}
+
+
+if __name__ == '__main__':
+    unittest.main()
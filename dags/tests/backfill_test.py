@@ -0,0 +1,85 @@
+import unittest
+
+from benchmark.mock_github import MockGithubServer, SyntheticOrg
+from src.async_gateway import AsyncGitGateway
+from src.backfill import (BackfillProgress, backfill, backfill_run_id,
+                          plan_backfill)
+
+
+class CheckpointRepository():
+
+    def __init__(self):
+        self.rows = []
+        self.crawl_state = {}
+        self.checkpoints = {}
+
+    def bulk_insert(self, contributors_list):
+        self.rows += contributors_list
+
+    def save_crawl_state(self, repo_owner, crawled_repos):
+        for repo in crawled_repos:
+            self.crawl_state[(repo_owner, repo["name"])] = repo
+
+    def get_checkpoint(self, run_id, repo_owner):
+        return set(self.checkpoints.get((run_id, repo_owner), set()))
+
+    def save_checkpoint(self, run_id, repo_owner, repo_names):
+        self.checkpoints.setdefault((run_id, repo_owner), set()).update(repo_names)
+
+
+class BackfillTests(unittest.IsolatedAsyncioTestCase):
+
+    def test_progress_eta_should_be_weighted_by_repository_size(self):
+        now = [0]
+        progress = BackfillProgress({"facebook": [{"name": "react", "size": 300}, {"name": "jest", "size": 100}]},
+                                    finished=2, clock=lambda: now[0])
+        self.assertIsNone(progress.report()["eta_seconds"])
+
+        now[0] = 10
+        progress.update([{"name": "jest", "size": 100}], 0, 50)
+
+        self.assertEqual({"repositories": 4, "finished": 3, "failed": 0, "rows": 50, "percent": 75.0,
+                          "elapsed_seconds": 10, "rows_per_second": 5.0, "eta_seconds": 30}, progress.report())
+        self.assertEqual(
+            "Backfilled 3 of 4 repositories(75.0%), 50 rows, 0 failed, ETA 30s", str(progress))
+
+    def test_plan_backfill_should_skip_checkpointed_repositories(self):
+        repository = CheckpointRepository()
+        repository.save_checkpoint(
+            backfill_run_id("bootstrap"), "facebook", ["react"])
+        repository.save_checkpoint(
+            backfill_run_id("other"), "facebook", ["jest"])
+
+        pending, finished = plan_backfill(repository, "bootstrap", {
+            "facebook": [{"name": "react"}, {"name": "jest"}], "google": [{"name": "react"}]})
+
+        self.assertEqual({"facebook": [{"name": "jest"}], "google": [
+                         {"name": "react"}]}, pending)
+        self.assertEqual(1, finished)
+
+    async def test_backfill_should_load_every_repository_once_and_resume_from_checkpoints(self):
+        orgs = [SyntheticOrg("facebook", repos=6, contributors=3, weeks=20),
+                SyntheticOrg("google", repos=2, contributors=2, weeks=20)]
+        repository = CheckpointRepository()
+        repository.save_checkpoint(backfill_run_id(
+            "bootstrap"), "facebook", ["facebook-repo-0"])
+
+        # Every stats request is computed once first, the second pass loads the repositories
+        with MockGithubServer(orgs, warm_up_requests=1) as server:
+            async with AsyncGitGateway("123", base_url=server.base_url, poll_interval=0.01) as gateway:
+                summary = await backfill(gateway, repository, "bootstrap", ["facebook", "google"],
+                                         batch_size=3, poll_timeout=0)
+                requests = server.requests
+                resumed = await backfill(gateway, repository, "bootstrap", ["facebook", "google"])
+
+        self.assertEqual({"repositories": 8, "finished": 8, "failed": 0, "failures": {}},
+                         {key: summary[key] for key in ("repositories", "finished", "failed", "failures")})
+        self.assertEqual({"facebook-repo-1", "facebook-repo-2", "facebook-repo-3", "facebook-repo-4", "facebook-repo-5",
+                          "google-repo-0", "google-repo-1"}, {row["repo_name"] for row in repository.rows})
+        self.assertEqual(7, len(repository.crawl_state))
+        self.assertEqual(8, resumed["finished"])
+        self.assertEqual(requests + 2, server.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import random
+import unittest
+from datetime import datetime, timezone
+
+from src.contributions import ContributorWeeks
+from src.gateway import get_first_contribution
+
+
+class ContributionsTests(unittest.TestCase):
+
+    def test_first_contribution_records_should_match_the_per_contributor_scan(self):
+        rng = random.Random(1)
+        stats = []
+        for index in range(0, 200):
+            weeks = [{"w": int(datetime(2016, 1, 3, tzinfo=timezone.utc).timestamp()) + week * 604800,
+                      "c": rng.choice([0, 0, 0, 1, 2])} for week in range(0, 100)]
+            rng.shuffle(weeks)
+            stats.append({"total": sum(week["c"] for week in weeks), "weeks": weeks,
+                          "author": {"login": f"user{index}"}})
+
+        for start_month, end_month in ((None, None), (datetime(2016, 3, 1), datetime(2016, 6, 1))):
+            expected = [get_first_contribution("facebook", "react", contribution, start_month, end_month)
+                        for contribution in stats]
+            result = ContributorWeeks.from_stats(stats).first_contribution_records(
+                "facebook", "react", start_month, end_month)
+
+            self.assertEqual([row for row in expected if row is not None], result)
+
+    def test_first_contribution_records_on_shared_weeks_should_match_the_per_contributor_scan(self):
+        rng = random.Random(2)
+        axis = [int(datetime(2016, 1, 3, tzinfo=timezone.utc).timestamp()) + week * 604800
+                for week in range(0, 100)]
+        for weeks_axis in (axis, list(reversed(axis))):
+            stats = [{"total": 1, "weeks": [{"w": week, "c": rng.choice([0, 0, 0, 1, 2])} for week in weeks_axis],
+                      "author": {"login": f"user{index}"}} for index in range(0, 200)]
+
+            expected = [get_first_contribution("facebook", "react", contribution)
+                        for contribution in stats]
+            result = ContributorWeeks.from_stats(stats).first_contribution_records(
+                "facebook", "react")
+
+            self.assertEqual([row for row in expected if row is not None], result)
+
+    def test_first_contribution_records_with_different_middle_weeks_should_use_each_contributor_weeks(self):
+        def week(year, month, day):
+            return datetime(year, month, day, tzinfo=timezone.utc).timestamp()
+        stats = [{"total": 1, "weeks": [{"w": week(2020, 1, 5), "c": 0}, {"w": week(2020, 2, 2), "c": 0}, {"w": week(2020, 6, 7), "c": 1}],
+                  "author": {"login": "user1"}},
+                 {"total": 1, "weeks": [{"w": week(2020, 1, 5), "c": 0}, {"w": week(2020, 5, 3), "c": 1}, {"w": week(2020, 6, 7), "c": 0}],
+                  "author": {"login": "user2"}}]
+
+        result = ContributorWeeks.from_stats(stats).first_contribution_records(
+            "facebook", "react")
+
+        self.assertEqual([("user1", "2020-06-01"), ("user2", "2020-05-01")],
+                         [(row["contributor"], row["month"]) for row in result])
+
+    def test_first_contribution_records_should_skip_contributors_without_commits_anywhere(self):
+        stats = [{"total": 1, "weeks": [{"w": datetime(2020, 1, 5, tzinfo=timezone.utc).timestamp(), "c": 1}],
+                  "author": {"login": "user1"}},
+                 {"total": 0},
+                 {"total": 0, "weeks": [{"w": datetime(2020, 1, 5, tzinfo=timezone.utc).timestamp(), "c": 0}],
+                  "author": {"login": "user2"}},
+                 {"total": 3, "weeks": [{"w": datetime(2021, 3, 7, tzinfo=timezone.utc).timestamp(), "c": 3}],
+                  "author": {"login": "user3"}}]
+
+        result = ContributorWeeks.from_stats(stats).first_contribution_records(
+            "facebook", "react")
+
+        self.assertEqual([
+            {'repo_owner': 'facebook', 'contributor': 'user1', 'month': '2020-01-01',
+             'repo_name': 'react', 'total_commits': 1},
+            {'repo_owner': 'facebook', 'contributor': 'user3', 'month': '2021-03-01',
+             'repo_name': 'react', 'total_commits': 3}], result)
+
+    def test_first_contribution_records_without_contributors_should_return_an_empty_list(self):
+        self.assertEqual([], ContributorWeeks.from_stats(
+            []).first_contribution_records("facebook", "react"))
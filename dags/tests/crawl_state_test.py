@@ -0,0 +1,93 @@
+import unittest
+from datetime import datetime, timezone
+
+from src.crawl_state import (changed_repositories, crawl_watermark,
+                             shard_owners, shard_repositories)
+
+
+class CrawlStateTests(unittest.TestCase):
+
+    repos_list = [
+        {"name": "new", "pushed_at": "2021-01-01T00:00:00Z"},
+        {"name": "pushed", "pushed_at": "2021-03-01T10:00:00Z"},
+        {"name": "dormant", "pushed_at": "2018-05-01T00:00:00Z", "archived": True},
+        {"name": "unknown", "pushed_at": None}]
+
+    crawl_state = {
+        "pushed": {"pushed_at": datetime(2021, 3, 1, 9, 0, tzinfo=timezone.utc)},
+        "dormant": {"pushed_at": datetime(2018, 5, 1, 0, 0, tzinfo=timezone.utc)},
+        "unknown": {"pushed_at": datetime(2018, 5, 1, 0, 0, tzinfo=timezone.utc)}}
+
+    def test_changed_repositories_should_skip_repositories_without_new_pushes(self):
+        result = changed_repositories(self.repos_list, self.crawl_state)
+
+        self.assertEqual(["new", "pushed", "unknown"], [repo["name"] for repo in result])
+
+    def test_changed_repositories_with_full_refresh_should_return_all_repositories(self):
+        result = changed_repositories(
+            self.repos_list, self.crawl_state, full_refresh=True)
+
+        self.assertEqual(self.repos_list, result)
+
+    def test_crawl_watermark_should_be_capped_at_the_interval_end(self):
+        interval_end = datetime(2021, 3, 1, tzinfo=timezone.utc)
+
+        self.assertEqual("2021-03-01T00:00:00+00:00", crawl_watermark(
+            "2021-03-01T10:00:00Z", interval_end))
+        self.assertEqual("2021-02-10T00:00:00+00:00", crawl_watermark(
+            "2021-02-10T00:00:00Z", interval_end))
+        self.assertIsNone(crawl_watermark(None, interval_end))
+
+    def test_push_after_the_interval_end_should_be_crawled_by_the_next_run(self):
+        interval_end = datetime(2021, 3, 1, tzinfo=timezone.utc)
+        repo = {"name": "react", "pushed_at": "2021-03-01T10:00:00Z"}
+        crawl_state = {"react": {"pushed_at": crawl_watermark(repo["pushed_at"], interval_end)}}
+
+        result = changed_repositories([repo], crawl_state)
+
+        self.assertEqual(["react"], [repo["name"] for repo in result])
+
+    def test_shard_repositories_should_balance_the_repositories_size(self):
+        repos_list = [{"name": f"repo{i}", "size": size}
+                      for i, size in enumerate([100, 1, 1, 50, 50, 1, 1, None])]
+
+        result = shard_repositories(repos_list, 2)
+
+        self.assertEqual(2, len(result))
+        self.assertEqual(sorted(repo["name"] for repo in repos_list), sorted(
+            repo["name"] for shard in result for repo in shard))
+        self.assertEqual([["repo0", "repo1", "repo5", "repo7"], ["repo2", "repo3", "repo4", "repo6"]],
+                         [sorted(repo["name"] for repo in shard) for shard in result])
+
+    def test_shard_repositories_should_not_return_empty_shards(self):
+        self.assertEqual([[{"name": "repo"}]], shard_repositories([{"name": "repo"}], 4))
+        self.assertEqual([], shard_repositories([], 4))
+
+    def test_shard_repositories_invalid_shards_should_raise_an_exception(self):
+        with self.assertRaises(ValueError):
+            shard_repositories([], 0)
+
+
+    def test_shard_owners_should_split_the_shards_by_owner_size_and_interleave_them(self):
+        repos_per_owner = {
+            "facebook": [{"name": f"repo{i}", "size": 100} for i in range(0, 6)],
+            "google": [{"name": "repo0", "size": 100}, {"name": "repo1", "size": 100}],
+            "microsoft": [{"name": "repo0", "size": 1}],
+            "netflix": []}
+
+        result = shard_owners(repos_per_owner, 4)
+
+        self.assertEqual(["facebook", "google", "microsoft", "facebook", "facebook"],
+                         [shard["owner"] for shard in result])
+        self.assertEqual({"facebook": 6, "google": 2, "microsoft": 1}, {
+            owner: sum(len(shard["repos"]) for shard in result if shard["owner"] == owner) for owner in ("facebook", "google", "microsoft")})
+
+    def test_shard_owners_without_repositories_should_return_no_shards(self):
+        self.assertEqual([], shard_owners({"facebook": []}, 4))
+
+    def test_shard_owners_invalid_shards_should_raise_an_exception(self):
+        with self.assertRaises(ValueError):
+            shard_owners({}, 0)
+
+if __name__ == '__main__':
+    unittest.main()
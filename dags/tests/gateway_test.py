@@ -4,8 +4,12 @@ from datetime import datetime, timedelta
 
 from dateutil.relativedelta import relativedelta
 from mock.mock import Mock, call
-from src.exceptions import HttpRequestError, RateLimitExceedError
+from src.exceptions import (HttpRequestError, RateLimitExceedError,
+                            StatsNotReadyError)
 from src.gateway import GitGateway
+from src.metrics import metrics
+from src.rate_limit import token_key
+from src.response_cache import CachedResponse
 
 
 class GatewayTests(unittest.TestCase):
@@ -66,16 +70,37 @@ class GatewayTests(unittest.TestCase):
         gateway = GitGateway("123")
         gateway.http.request = Mock()
         gateway.http.request().status = 200
-        gateway.http.request().data = '[{"name": "test1"},{"name": "test2"}]'
+        gateway.http.request().data = '[{"name": "test1", "pushed_at": "2021-01-01T00:00:00Z", "size": 10, "archived": true},{"name": "test2"}]'
         gateway.http.request().headers = self.set_rate_limit()
 
         result = gateway.get_repositories("facebook")
 
         self.assertEqual(2, len(result))
-        self.assertEqual(['test1', 'test2'], result)
-        self.assertEqual(call('GET', 'https://api.github.com/users/facebook/repos?page=1&page_size=50', headers={
+        self.assertEqual([{"name": "test1", "pushed_at": "2021-01-01T00:00:00Z", "size": 10, "archived": True},
+                          {"name": "test2", "pushed_at": None, "size": None, "archived": False}], result)
+        self.assertEqual(call('GET', 'https://api.github.com/users/facebook/repos?page=1&per_page=100', headers={
                          'Authorization': 'token 123', 'user-agent': 'github-crawler'}), gateway.http.request.call_args_list[-1])
 
+    def test_get_all_repositories_should_request_pages_until_last_page_link(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock(side_effect=lambda method, url, headers: self.repositories_page(url, 3))
+
+        result = gateway.get_all_repositories("facebook")
+
+        self.assertEqual(["page1", "page2", "page3"], [repo["name"] for repo in result])
+        self.assertEqual(3, gateway.http.request.call_count)
+
+    def test_get_all_repositories_without_link_should_request_pages_until_partial_page(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock(side_effect=lambda method, url, headers: self.repositories_page(url, 2, with_link=False))
+
+        result = gateway.get_all_repositories("facebook")
+
+        self.assertEqual(101, len(result))
+        self.assertEqual(2, gateway.http.request.call_count)
+
     def test_get_contributors_per_month_error_status_should_raise_an_exception(self):
 
         gateway = GitGateway("123")
@@ -171,6 +196,210 @@ class GatewayTests(unittest.TestCase):
         self.assertEqual({'repo_owner': 'facebook', 'contributor': 'username',
                           'month': current_month.replace(day=1).strftime('%Y-%m-%d'), 'repo_name': 'react', 'total_commits': 1}, result[0])
 
+    def test_get_contributors_per_months_should_return_first_contributions_of_all_months(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock()
+        gateway.http.request().status = 200
+        gateway.http.request().headers = self.set_rate_limit()
+
+        gateway.http.request().data = json.dumps([
+            {"total": 2, "weeks": [
+                {"c": 0, "w": datetime(2020, 1, 5).timestamp()},
+                {"c": 2, "w": datetime(2020, 2, 9).timestamp()}],
+             "author": {"login": "user1"}},
+            {"total": 1, "weeks": [
+                {"c": 1, "w": datetime(2021, 6, 6).timestamp()}],
+             "author": {"login": "user2"}}])
+
+        result = gateway.get_contributors_per_months("facebook", "react")
+
+        self.assertEqual([
+            {'repo_owner': 'facebook', 'contributor': 'user1', 'month': '2020-02-01',
+                'repo_name': 'react', 'total_commits': 2},
+            {'repo_owner': 'facebook', 'contributor': 'user2', 'month': '2021-06-01',
+                'repo_name': 'react', 'total_commits': 1}], result)
+
+    def test_get_contributors_per_months_should_discard_first_contributions_out_of_range(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock()
+        gateway.http.request().status = 200
+        gateway.http.request().headers = self.set_rate_limit()
+
+        gateway.http.request().data = json.dumps([
+            {"total": 1, "weeks": [{"c": 1, "w": datetime(2019, 12, 1).timestamp()}],
+             "author": {"login": "user1"}},
+            {"total": 1, "weeks": [{"c": 1, "w": datetime(2020, 3, 1).timestamp()}],
+             "author": {"login": "user2"}},
+            {"total": 1, "weeks": [{"c": 1, "w": datetime(2020, 7, 5).timestamp()}],
+             "author": {"login": "user3"}}])
+
+        result = gateway.get_contributors_per_months(
+            "facebook", "react", datetime(2020, 1, 1), datetime(2020, 6, 1))
+
+        self.assertEqual(['user2'], [row["contributor"] for row in result])
+
+    def test_get_contributors_per_months_invalid_month_should_raise_an_exception(self):
+
+        gateway = GitGateway("123")
+
+        with self.assertRaises(ValueError):
+            gateway.get_contributors_per_months("facebook", "react", "2020-01-01")
+
+    def test_get_repositories_with_cached_response_should_send_conditional_headers(self):
+
+        cache = Mock()
+        cache.get.return_value = CachedResponse(
+            '"etag"', "Tue, 01 Feb 2022 00:00:00 GMT", b'[{"name": "test1"}]')
+        gateway = GitGateway("123", cache)
+        gateway.http.request = Mock()
+        gateway.http.request().status = 304
+        gateway.http.request().data = b""
+        gateway.http.request().headers = self.set_rate_limit()
+
+        result = gateway.get_repositories("facebook")
+
+        self.assertEqual(['test1'], [repo["name"] for repo in result])
+        self.assertEqual(call('GET', 'https://api.github.com/users/facebook/repos?page=1&per_page=100', headers={
+                         'Authorization': 'token 123', 'user-agent': 'github-crawler', 'If-None-Match': '"etag"',
+                         'If-Modified-Since': 'Tue, 01 Feb 2022 00:00:00 GMT'}), gateway.http.request.call_args_list[-1])
+        self.assertEqual(0, cache.set.call_count)
+
+    def test_get_contributors_with_etag_should_store_response_on_cache(self):
+
+        cache = Mock()
+        cache.get.return_value = None
+        gateway = GitGateway("123", cache)
+        gateway.http.request = Mock()
+        gateway.http.request().status = 200
+        gateway.http.request().data = "[]"
+        gateway.http.request().headers = dict(
+            self.set_rate_limit(), ETag='"etag"')
+
+        result = gateway.get_contributors_per_months("facebook", "react")
+
+        self.assertEqual([], result)
+        cache.set.assert_called_once_with(
+            'https://api.github.com/repos/facebook/react/stats/contributors', '"etag"', None, "[]")
+
+    def test_get_repositories_with_budget_should_use_the_acquired_token(self):
+
+        budget = Mock()
+        budget.acquire.return_value = ("456", 0)
+        gateway = GitGateway("123", budget=budget)
+        gateway.http.request = Mock()
+        gateway.http.request().status = 200
+        gateway.http.request().data = "[]"
+        gateway.http.request().headers = self.set_rate_limit()
+
+        gateway.get_repositories("facebook")
+
+        self.assertEqual({'Authorization': 'token 456', 'user-agent': 'github-crawler'},
+                         gateway.http.request.call_args_list[-1][1]["headers"])
+        budget.update.assert_called_once_with(
+            "456", gateway.http.request().headers)
+
+    def test_request_transport_error_should_release_the_reserved_budget(self):
+
+        budget = Mock()
+        budget.acquire.return_value = ("456", 0)
+        gateway = GitGateway("123", budget=budget)
+        gateway.http.request = Mock(side_effect=TimeoutError())
+
+        with self.assertRaises(TimeoutError):
+            gateway.get_repositories("facebook")
+        with self.assertRaises(TimeoutError):
+            list(gateway.iter_contributors_per_months("facebook", "react"))
+
+        self.assertEqual([call("456"), call("456")],
+                         budget.release.call_args_list)
+        budget.update.assert_not_called()
+
+    def test_get_contributors_stats_being_computed_should_raise_an_exception(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock()
+        gateway.http.request().status = 202
+        gateway.http.request().data = "{}"
+        gateway.http.request().headers = self.set_rate_limit()
+
+        with self.assertRaises(StatsNotReadyError) as context:
+            gateway.get_contributors_per_months("facebook", "react")
+
+        self.assertEqual(202, context.exception.status)
+
+    def test_iter_contributors_per_months_should_parse_the_streamed_response(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock()
+        gateway.http.request().status = 200
+        gateway.http.request().headers = self.set_rate_limit()
+        data = json.dumps([
+            {"total": 2, "weeks": [
+                {"c": 0, "w": datetime(2020, 1, 5).timestamp()},
+                {"c": 2, "w": datetime(2020, 2, 9).timestamp()}],
+             "author": {"login": "user1"}},
+            {"total": 1, "weeks": [
+                {"c": 1, "w": datetime(2021, 6, 6).timestamp()}],
+             "author": {"login": "user2"}}]).encode("utf-8")
+        gateway.http.request().stream.return_value = [
+            data[offset:offset + 7] for offset in range(0, len(data), 7)]
+
+        result = list(gateway.iter_contributors_per_months(
+            "facebook", "react", datetime(2020, 1, 1), datetime(2020, 12, 1)))
+
+        self.assertEqual([{'repo_owner': 'facebook', 'contributor': 'user1', 'month': '2020-02-01',
+                           'repo_name': 'react', 'total_commits': 2}], result)
+        self.assertFalse(gateway.http.request.call_args[1]["preload_content"])
+        gateway.http.request().release_conn.assert_called_once_with()
+
+    def test_iter_contributors_stats_being_computed_should_raise_an_exception(self):
+
+        gateway = GitGateway("123")
+        gateway.http.request = Mock()
+        gateway.http.request().status = 202
+        gateway.http.request().stream.return_value = [b"{}"]
+        gateway.http.request().headers = self.set_rate_limit()
+
+        with self.assertRaises(StatsNotReadyError):
+            list(gateway.iter_contributors_per_months("facebook", "react"))
+
+        gateway.http.request().release_conn.assert_called_once_with()
+
+    def repositories_page(self, url, last_page, with_link=True):
+        page = int(url.split("page=")[1].split("&")[0])
+        response = Mock()
+        response.status = 200
+        response.headers = self.set_rate_limit()
+        if with_link:
+            response.headers["Link"] = f'<https://api.github.com/user/1/repos?page={page + 1}&per_page=100>; rel="next", <https://api.github.com/user/1/repos?page={last_page}&per_page=100>; rel="last"'
+            response.data = json.dumps([{"name": f"page{page}"}])
+        else:
+            response.data = json.dumps(
+                [{"name": f"page{page}-{i}"} for i in range(0, 100 if page < last_page else 1)])
+        return response
+
+    def test_get_contributors_should_record_http_parse_and_transform_metrics(self):
+        metrics.reset()
+        gateway = GitGateway("123")
+        gateway.http.request = Mock()
+        gateway.http.request().status = 200
+        gateway.http.request().headers = self.set_rate_limit()
+        gateway.http.request().data = json.dumps([{"total": 1, "weeks": [
+            {"c": 1, "w": datetime.now().timestamp()}], "author": {"login": "username"}}])
+
+        gateway.get_contributors_per_month("facebook", "react", datetime.now())
+
+        summary = metrics.summary()
+        self.assertEqual(
+            1, summary["counters"]['github_http_requests_total{kind="contributors",status="200"}'])
+        self.assertEqual(
+            100, summary["gauges"][f'github_rate_limit_remaining{{token="{token_key("123")}"}}'])
+        self.assertEqual({"http", "parse", "transform"}, set(
+            summary["repositories"]["facebook/react"]))
+        metrics.reset()
+
     def set_rate_limit(self, reached=False):
 
         if(reached == False):
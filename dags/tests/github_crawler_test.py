@@ -0,0 +1,227 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from importlib.util import find_spec
+
+from mock.mock import AsyncMock, Mock, patch
+from src.crawl_state import changed_repositories
+from src.exceptions import RateLimitExceedError, StatsNotReadyError
+from src.gateway import get_first_contribution
+from src.rate_limit import RateLimitBudget
+
+
+# The tasks are run through the real task instance path, on a throwaway metadata database
+@unittest.skipIf(find_spec("airflow") is None, "Airflow isn't installed")
+class GithubCrawlerTaskInstanceTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.airflow_home = tempfile.TemporaryDirectory()
+        os.environ["AIRFLOW_HOME"] = cls.airflow_home.name
+        os.environ["AIRFLOW__CORE__UNIT_TEST_MODE"] = "True"
+        os.environ["AIRFLOW__CORE__LOAD_EXAMPLES"] = "False"
+        from airflow.utils import db
+        db.resetdb()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.airflow_home.cleanup()
+
+    def setUp(self):
+        from airflow.models import Variable
+        from src import github_crawler
+        self.github_crawler = github_crawler
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.patches = [patch.object(github_crawler, "DATA_DIR", self.data_dir.name),
+                        patch.object(github_crawler, "PostgresHook"),
+                        patch.object(github_crawler, "Repository")]
+        for patcher in self.patches:
+            patcher.start()
+        github_crawler.Repository.return_value.get_checkpoint.return_value = set()
+        Variable.set("GITHUB_REPO_OWNER", "facebook")
+
+    def tearDown(self):
+        for patcher in self.patches:
+            patcher.stop()
+        self.data_dir.cleanup()
+
+    def test_rate_limited_task_should_be_up_for_retry(self):
+        from airflow.exceptions import AirflowException
+        from airflow.utils.state import State
+
+        dag_run = self.create_dag_run(self.github_crawler.dag)
+        task_instance = self.get_task_instance(
+            dag_run, "discover_repositories")
+
+        with patch.object(self.github_crawler, "list_repositories", side_effect=RateLimitExceedError("exceed", 600)):
+            with self.assertRaises(AirflowException):
+                task_instance.run(ignore_all_deps=True)
+
+        task_instance.refresh_from_db()
+        self.assertEqual(State.UP_FOR_RETRY, task_instance.state)
+        self.assertEqual(0, self.count_reschedules(task_instance))
+
+    def test_rate_limited_mapped_task_should_be_up_for_retry(self):
+        from airflow.exceptions import AirflowException
+        from airflow.utils.state import State
+
+        dag_run = self.create_dag_run(self.github_crawler.dag)
+        task_instances = self.expand_shards(dag_run, {"facebook": [
+            {"name": "react", "size": 1}, {"name": "jest", "size": 1}]})
+
+        with patch.object(self.github_crawler, "crawl_shard", AsyncMock(side_effect=RateLimitExceedError("exceed", 600))):
+            with self.assertRaises(AirflowException):
+                task_instances[0].run(ignore_all_deps=True)
+
+        task_instances[0].refresh_from_db()
+        self.assertEqual(State.UP_FOR_RETRY, task_instances[0].state)
+        self.assertEqual(0, self.count_reschedules(task_instances[0]))
+
+    def test_stats_never_ready_should_be_deferred_and_the_shard_finished(self):
+        from airflow.utils.state import State
+
+        dag_run = self.create_dag_run(self.github_crawler.dag)
+        task_instances = self.expand_shards(dag_run, {"facebook": [
+            {"name": "react", "size": 1}, {"name": "frozen", "size": 1}]}, shards=1)
+        gateway = StatsGateway({"frozen": StatsNotReadyError("{}")})
+
+        with patch.object(self.github_crawler, "get_async_gateway", return_value=gateway):
+            task_instances[0].run(ignore_all_deps=True)
+
+        task_instances[0].refresh_from_db()
+        self.assertEqual(State.SUCCESS, task_instances[0].state)
+        self.assertEqual(3, sum(repos.count("frozen") for repos in gateway.requests))
+        repository = self.github_crawler.Repository.return_value
+        checkpointed = [name for args in repository.save_checkpoint.call_args_list for name in args[0][2]]
+        crawled = [repo["name"] for args in repository.save_crawl_state.call_args_list for repo in args[0][1]]
+        self.assertEqual(["react"], checkpointed)
+        self.assertEqual(["react"], crawled)
+
+    def test_push_on_a_week_started_before_the_watermark_month_should_be_loaded(self):
+        # Pushed on Tuesday 2021-03-02 after the watermark capped at the end of February, the
+        # commit is on the week of Sunday 2021-02-28 so its first contribution is in February
+        crawl_state = {"react": {"pushed_at": "2021-03-01T00:00:00+00:00"}}
+        repos = changed_repositories(
+            [{"name": "react", "pushed_at": "2021-03-02T10:00:00Z"}], crawl_state)
+        dag_run = self.create_dag_run(self.github_crawler.dag)
+        task_instances = self.expand_shards(
+            dag_run, {"facebook": repos}, shards=1)
+        week = datetime(2021, 2, 28, tzinfo=timezone.utc).timestamp()
+        gateway = StatsGateway({"react": [get_first_contribution("facebook", "react", {
+            "author": {"login": "react-user"}, "total": 1, "weeks": [{"w": week, "a": 1, "d": 0, "c": 1}]})]})
+
+        with patch.object(self.github_crawler, "get_async_gateway", return_value=gateway):
+            task_instances[0].run(ignore_all_deps=True)
+
+        repository = self.github_crawler.Repository.return_value
+        loaded = [(row["contributor"], row["month"])
+                  for row in repository.bulk_insert.call_args[0][0]]
+        self.assertEqual([("react-user", "2021-02-01")], loaded)
+        self.assertEqual([datetime(2016, 1, 1)], gateway.start_months)
+        self.assertEqual({"react": "2021-03-02T10:00:00+00:00"},
+                         {repo["name"]: repo["pushed_at"] for repo in repository.save_crawl_state.call_args[0][1]})
+
+    def test_push_after_the_interval_end_should_be_left_to_the_next_run(self):
+        dag_run = self.create_dag_run(self.github_crawler.dag)
+        task_instances = self.expand_shards(dag_run, {"facebook": [
+            {"name": "react", "pushed_at": "2022-06-03T10:00:00Z"},
+            {"name": "jest", "pushed_at": "2022-05-02T00:00:00Z"}]}, shards=1)
+        gateway = StatsGateway({repo: [self.contributor(repo, "2019-01-01"), self.contributor(repo, "2022-04-01")]
+                                for repo in ("react", "jest")})
+
+        with patch.object(self.github_crawler, "get_async_gateway", return_value=gateway):
+            task_instances[0].run(ignore_all_deps=True)
+
+        repository = self.github_crawler.Repository.return_value
+        loaded = [(row["repo_name"], row["month"]) for row in repository.bulk_insert.call_args[0][0]]
+        self.assertEqual([("react", "2019-01-01"), ("react", "2022-04-01"),
+                          ("jest", "2019-01-01"), ("jest", "2022-04-01")], loaded)
+        self.assertEqual({"react": "2022-06-01T00:00:00+00:00", "jest": "2022-05-02T00:00:00+00:00"},
+                         {repo["name"]: repo["pushed_at"] for repo in repository.save_crawl_state.call_args[0][1]})
+
+    def test_exhausted_budget_should_reschedule_the_sensor(self):
+        from airflow.utils.state import State
+
+        RateLimitBudget(os.path.join(self.data_dir.name, "rate_limit.json"), []).update(None, {
+            "X-RateLimit-Remaining": "0", "X-RateLimit-Limit": "5000",
+            "X-RateLimit-Reset": str(datetime.now().timestamp() + 600)})
+        dag_run = self.create_dag_run(self.github_crawler.dag)
+        task_instance = self.get_task_instance(dag_run, "wait_for_rate_limit")
+
+        task_instance.run(ignore_all_deps=True)
+
+        task_instance.refresh_from_db()
+        self.assertEqual(State.UP_FOR_RESCHEDULE, task_instance.state)
+        self.assertEqual(1, self.count_reschedules(task_instance))
+
+    def create_dag_run(self, dag):
+        from airflow.models import DagRun, TaskReschedule
+        from airflow.utils.session import create_session
+        from airflow.utils.state import State
+        from airflow.utils.types import DagRunType
+
+        with create_session() as session:
+            session.query(TaskReschedule).delete()
+            session.query(DagRun).delete()
+        execution_date = datetime(2022, 5, 1, tzinfo=timezone.utc)
+        return dag.create_dagrun(run_id=f"manual__{self.id()}", run_type=DagRunType.MANUAL, state=State.RUNNING,
+                                 execution_date=execution_date, data_interval=(execution_date, datetime(2022, 6, 1, tzinfo=timezone.utc)))
+
+    def get_task_instance(self, dag_run, task_id, map_index=-1):
+        task_instance = dag_run.get_task_instance(task_id, map_index=map_index)
+        task_instance.task = dag_run.dag.get_task(task_id)
+        return task_instance
+
+    def expand_shards(self, dag_run, repos_per_owner, shards=2):
+        from airflow.models import XCom
+        from airflow.utils.session import create_session
+
+        # The shards are listed by the real upstream task, then the crawl is expanded over them
+        XCom.set(key="return_value", value=repos_per_owner, task_id="warm_up_stats",
+                 dag_id=dag_run.dag_id, run_id=dag_run.run_id)
+        with patch.object(self.github_crawler.Variable, "get", Mock(return_value=str(shards))):
+            self.get_task_instance(
+                dag_run, "shard_repositories_list").run(ignore_all_deps=True)
+        with create_session() as session:
+            task_instances, _ = dag_run.dag.get_task("get_contributors").expand_mapped_task(
+                dag_run.run_id, session=session)
+        for task_instance in task_instances:
+            task_instance.task = dag_run.dag.get_task("get_contributors")
+        return sorted(task_instances, key=lambda task_instance: task_instance.map_index)
+
+    def contributor(self, repo_name, month):
+        return {"repo_owner": "facebook", "contributor": f"{repo_name}-user", "month": month,
+                "repo_name": repo_name, "total_commits": 1}
+
+    def count_reschedules(self, task_instance):
+        from airflow.models import TaskReschedule
+        from airflow.utils.session import create_session
+
+        with create_session() as session:
+            return session.query(TaskReschedule).filter(TaskReschedule.dag_id == task_instance.dag_id,
+                                                        TaskReschedule.task_id == task_instance.task_id,
+                                                        TaskReschedule.run_id == task_instance.run_id).count()
+
+
+class StatsGateway():
+
+    def __init__(self, results):
+        self.results = results
+        self.requests = []
+        self.start_months = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def crawl_contributors(self, owner, repos, start_month=None, end_month=None, poll_timeout=300):
+        self.requests.append(repos)
+        self.start_months.append(start_month)
+        return {repo: self.results.get(repo, []) for repo in repos}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import json
+import unittest
+
+from src.json_stream import JsonArrayStream, aiter_json_array, iter_json_array
+
+
+class JsonStreamTests(unittest.TestCase):
+
+    def test_iter_json_array_should_yield_items_split_across_chunks(self):
+        items = [{"author": {"login": "usér"}, "total": 12, "weeks": [{"w": 1, "c": 0}]},
+                 {"author": {"login": "user2"}, "total": 3, "weeks": []}]
+        data = json.dumps(items, ensure_ascii=False).encode("utf-8")
+
+        for chunk_size in (1, 3, 64, len(data)):
+            chunks = [data[offset:offset + chunk_size]
+                      for offset in range(0, len(data), chunk_size)]
+            self.assertEqual(items, list(iter_json_array(chunks)))
+
+    def test_iter_json_array_should_wait_for_numbers_split_across_chunks(self):
+        self.assertEqual([12, 345], list(iter_json_array([b"[1", b"2, 3", b"45]"])))
+
+    def test_iter_json_array_should_wait_for_numbers_split_mid_token(self):
+        self.assertEqual([-2500.0, 1e5, 2], list(iter_json_array([b"[-2500.", b"0, 1e", b"5 ,2", b"]"])))
+
+    def test_iter_json_array_with_empty_array_should_yield_nothing(self):
+        self.assertEqual([], list(iter_json_array([b" [ ", b"] "])))
+
+    def test_feed_should_return_items_as_soon_as_they_are_complete(self):
+        stream = JsonArrayStream()
+
+        self.assertEqual([{"a": 1}], stream.feed(b'[{"a": 1}, {"b"'))
+        self.assertEqual([{"b": 2}, {"c": 3}], stream.feed(b': 2}, {"c": 3}'))
+        self.assertEqual([], stream.feed(b']'))
+        self.assertEqual([], stream.close())
+
+    def test_iter_json_array_invalid_payload_should_raise_an_exception(self):
+        for chunks in ([b'{"message": "Not Found"}'], [b'[{"a": 1} {"b": 2}]'], [b'[{"a": 1}'], [b'[1]]']):
+            with self.assertRaises(ValueError):
+                list(iter_json_array(chunks))
+
+    def test_aiter_json_array_should_yield_items(self):
+        async def chunks():
+            for chunk in (b'[{"a"', b': 1}, {"b": 2}]'):
+                yield chunk
+
+        async def collect():
+            return [item async for item in aiter_json_array(chunks())]
+
+        self.assertEqual([{"a": 1}, {"b": 2}], asyncio.run(collect()))
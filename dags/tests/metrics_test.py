@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.metrics import Metrics, StageTimer
+
+
+class MetricsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.1, 1, 10))
+
+    def test_counters_and_gauges_should_be_kept_per_labels(self):
+        self.metrics.inc("github_http_requests_total", kind="contributors", status=200)
+        self.metrics.inc("github_http_requests_total", kind="contributors", status=200)
+        self.metrics.inc("github_http_requests_total", kind="contributors", status=202)
+        self.metrics.set("github_rate_limit_remaining", 10, token="a")
+        self.metrics.set("github_rate_limit_remaining", 5, token="a")
+
+        summary = self.metrics.summary()
+
+        self.assertEqual({'github_http_requests_total{kind="contributors",status="200"}': 2,
+                          'github_http_requests_total{kind="contributors",status="202"}': 1}, summary["counters"])
+        self.assertEqual(
+            {'github_rate_limit_remaining{token="a"}': 5}, summary["gauges"])
+
+    def test_to_prometheus_should_render_cumulative_histogram_buckets(self):
+        for seconds in (0.05, 0.5, 0.5, 20):
+            self.metrics.observe("github_stage_seconds", seconds, stage="http")
+        self.metrics.inc("github_rows_loaded_total", 3)
+
+        self.assertEqual("\n".join([
+            "# TYPE github_rows_loaded_total counter",
+            "github_rows_loaded_total 3",
+            "# TYPE github_stage_seconds histogram",
+            'github_stage_seconds_bucket{stage="http",le="0.1"} 1',
+            'github_stage_seconds_bucket{stage="http",le="1"} 3',
+            'github_stage_seconds_bucket{stage="http",le="10"} 3',
+            'github_stage_seconds_bucket{stage="http",le="+Inf"} 4',
+            'github_stage_seconds_sum{stage="http"} 21.05',
+            'github_stage_seconds_count{stage="http"} 4',
+        ]) + "\n", self.metrics.to_prometheus())
+
+    def test_to_prometheus_should_escape_label_values(self):
+        self.metrics.inc("errors_total", message='a "quoted"\nvalue')
+
+        self.assertIn('errors_total{message="a \\"quoted\\"\\nvalue"} 1',
+                      self.metrics.to_prometheus())
+
+    def test_summary_should_estimate_quantiles_from_buckets(self):
+        for seconds in [0.05] * 98 + [5, 5]:
+            self.metrics.observe("github_stage_seconds", seconds, stage="load")
+
+        histogram = self.metrics.summary(
+        )["histograms"]['github_stage_seconds{stage="load"}']
+
+        self.assertEqual(100, histogram["count"])
+        self.assertEqual(0.1, histogram["p50"])
+        self.assertEqual(10, histogram["p99"])
+
+    def test_stages_should_be_added_up_per_repository(self):
+        self.metrics.observe_stage("http", 0.5, "facebook", "react")
+        self.metrics.observe_stage("http", 0.25, "facebook", "react")
+        self.metrics.observe_stage("load", 1)
+
+        summary = self.metrics.summary()
+
+        self.assertEqual(
+            {"facebook/react": {"http": 0.75}}, summary["repositories"])
+        self.assertEqual(
+            3, sum(histogram["count"] for histogram in summary["histograms"].values()))
+
+    def test_stage_timer_should_record_each_stage_once(self):
+        timer = StageTimer("facebook", "react", self.metrics)
+        for _ in range(3):
+            timer.lap("parse")
+            timer.lap("transform")
+        timer.record()
+
+        summary = self.metrics.summary()
+
+        self.assertEqual({"parse", "transform"}, set(
+            summary["repositories"]["facebook/react"]))
+        self.assertEqual(
+            1, summary["histograms"]['github_stage_seconds{stage="parse"}']["count"])
+
+    def test_write_should_replace_the_prometheus_and_json_files(self):
+        self.metrics.inc("github_rows_loaded_total", 3)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.metrics.write(directory, "github_etl")
+            self.metrics.write(directory, "github_etl")
+
+            self.assertEqual(["github_etl.json", "github_etl.prom"],
+                             sorted(os.listdir(directory)))
+            with open(os.path.join(directory, "github_etl.json")) as summary_file:
+                self.assertEqual(
+                    {"github_rows_loaded_total": 3}, json.load(summary_file)["counters"])
+
+    def test_reset_should_drop_every_series(self):
+        self.metrics.inc("github_rows_loaded_total")
+        self.metrics.observe_stage("http", 1, "facebook", "react")
+
+        self.metrics.reset()
+
+        self.assertEqual("\n", self.metrics.to_prometheus())
+        self.assertEqual({}, self.metrics.summary()["repositories"])
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+
+from benchmark.crawl_benchmark import percentile, run_benchmark
+from benchmark.mock_github import MockGithubServer, SyntheticOrg
+from src.exceptions import RateLimitExceedError, StatsNotReadyError
+from src.gateway import GitGateway
+from src.response_cache import ResponseCache
+
+
+class MockGithubTests(unittest.TestCase):
+
+    def test_get_all_repositories_should_follow_the_mock_pages(self):
+        with MockGithubServer([SyntheticOrg("facebook", repos=250)]) as server:
+            result = GitGateway("123", base_url=server.base_url).get_all_repositories("facebook")
+
+        self.assertEqual(250, len(result))
+        self.assertEqual(3, server.requests)
+
+    def test_get_contributors_should_answer_202_until_warmed_up(self):
+        org = SyntheticOrg("facebook", repos=1, contributors=10, weeks=52)
+        with MockGithubServer([org], warm_up_requests=1) as server:
+            gateway = GitGateway("123", base_url=server.base_url)
+            with self.assertRaises(StatsNotReadyError):
+                gateway.get_contributors_per_months("facebook", "facebook-repo-0")
+            result = gateway.get_contributors_per_months(
+                "facebook", "facebook-repo-0")
+
+        self.assertEqual(10, len(result))
+        self.assertEqual(
+            {f"facebook-repo-0-user-{i}" for i in range(0, 10)}, {row["contributor"] for row in result})
+
+    def test_get_contributors_should_be_rate_limited_per_token(self):
+        org = SyntheticOrg("facebook", repos=1, contributors=1, weeks=4)
+        with MockGithubServer([org], rate_limit=2) as server:
+            gateway = GitGateway("123", base_url=server.base_url)
+            gateway.get_contributors_per_months("facebook", "facebook-repo-0")
+            gateway.get_contributors_per_months("facebook", "facebook-repo-0")
+            with self.assertRaises(RateLimitExceedError):
+                gateway.get_contributors_per_months("facebook", "facebook-repo-0")
+            GitGateway("456", base_url=server.base_url).get_contributors_per_months(
+                "facebook", "facebook-repo-0")
+
+    def test_not_modified_responses_should_not_count_on_the_rate_limit(self):
+        org = SyntheticOrg("facebook", repos=1, contributors=1, weeks=4)
+        with tempfile.TemporaryDirectory() as directory, MockGithubServer([org], rate_limit=2) as server:
+            gateway = GitGateway("123", cache=ResponseCache(os.path.join(directory, "cache.sqlite")),
+                                 base_url=server.base_url)
+            for _ in range(0, 3):
+                result = gateway.get_contributors_per_months(
+                    "facebook", "facebook-repo-0")
+            remaining = server.budgets["token 123"]["remaining"]
+
+        self.assertEqual(1, len(result))
+        self.assertEqual(1, remaining)
+
+    def test_synthetic_org_should_be_deterministic(self):
+        org = SyntheticOrg("facebook", repos=1, contributors=5, weeks=20, seed=1)
+
+        self.assertEqual(org.contributors_stats("facebook-repo-0"),
+                         SyntheticOrg("facebook", repos=1, contributors=5, weeks=20, seed=1).contributors_stats("facebook-repo-0"))
+        self.assertNotEqual(org.contributors_stats("facebook-repo-0"),
+                            SyntheticOrg("facebook", repos=1, contributors=5, weeks=20, seed=2).contributors_stats("facebook-repo-0"))
+
+    def test_run_benchmark_should_report_the_crawl(self):
+        org = SyntheticOrg("facebook", repos=20, contributors=5, weeks=52)
+        with MockGithubServer([org], warm_up_requests=1) as server:
+            report = run_benchmark(server.base_url, "facebook",
+                                   workers=4, load_batch_size=30, poll_interval=0.01)
+
+        self.assertEqual(20, report["repositories"])
+        self.assertEqual(41, report["requests"])
+        self.assertEqual(100, report["rows"])
+        self.assertEqual(20, report["stats_polls"])
+        self.assertFalse(report["loaded"])
+        self.assertIsNone(report["peak_memory_mb"])
+        self.assertGreater(report["requests_per_second"], 0)
+        self.assertLessEqual(report["latency_p50_ms"], report["latency_p99_ms"])
+
+    def test_run_benchmark_with_streamed_stats_should_time_every_request(self):
+        org = SyntheticOrg("facebook", repos=20, contributors=5, weeks=52)
+        with MockGithubServer([org], warm_up_requests=1) as server:
+            report = run_benchmark(server.base_url, "facebook", workers=4, poll_interval=0.01,
+                                   stream=True, trace_memory=True)
+
+        self.assertEqual(41, report["requests"])
+        self.assertEqual(100, report["rows"])
+        self.assertGreater(report["peak_memory_mb"], 0)
+
+    def test_percentile_should_use_the_nearest_rank(self):
+        self.assertEqual(0, percentile([], 99))
+        self.assertEqual(50, percentile(list(range(1, 101)), 50))
+        self.assertEqual(99, percentile(list(range(1, 101)), 99))
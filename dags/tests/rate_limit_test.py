@@ -0,0 +1,99 @@
+import os
+import tempfile
+import time
+import unittest
+
+from src.exceptions import RateLimitExceedError
+from src.rate_limit import RateLimitBudget
+
+
+class RateLimitBudgetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "rate_limit.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_acquire_should_rotate_to_the_token_with_largest_budget(self):
+        budget = RateLimitBudget(self.path, ["token1", "token2"])
+        budget.update("token1", self.headers(remaining=10))
+        budget.update("token2", self.headers(remaining=4000))
+
+        token, delay = budget.acquire()
+
+        self.assertEqual("token2", token)
+        self.assertEqual(0, delay)
+
+    def test_budget_should_be_shared_between_instances(self):
+        RateLimitBudget(self.path, ["token1"]).update(
+            "token1", self.headers(remaining=2, limit=2))
+        budget = RateLimitBudget(self.path, ["token1"])
+
+        budget.acquire(count=2)
+
+        with self.assertRaises(RateLimitExceedError) as context:
+            RateLimitBudget(self.path, ["token1"]).acquire()
+        self.assertTrue(0 < context.exception.time_to_wait <= 60)
+
+    def test_update_should_release_reserved_budget(self):
+        budget = RateLimitBudget(self.path, ["token1"])
+        budget.update("token1", self.headers(remaining=1, limit=1))
+
+        budget.acquire()
+        budget.update("token1", self.headers(remaining=1, limit=1))
+
+        self.assertEqual("token1", budget.acquire()[0])
+
+    def test_release_should_give_back_the_reservation_of_a_failed_request(self):
+        budget = RateLimitBudget(self.path, ["token1"])
+        budget.update("token1", self.headers(remaining=1, limit=1))
+
+        budget.acquire()
+        budget.release("token1")
+
+        self.assertEqual("token1", budget.acquire()[0])
+        with self.assertRaises(RateLimitExceedError):
+            budget.acquire()
+
+    def test_seconds_to_wait_should_not_reserve_the_budget(self):
+        budget = RateLimitBudget(self.path, ["token1"])
+        budget.update("token1", self.headers(remaining=1, limit=1))
+
+        self.assertEqual(0, budget.seconds_to_wait())
+        self.assertEqual(0, budget.seconds_to_wait())
+        budget.acquire()
+        self.assertTrue(0 < budget.seconds_to_wait() <= 60)
+
+    def test_acquire_close_to_exhaustion_should_pace_requests(self):
+        budget = RateLimitBudget(self.path, ["token1"])
+        budget.update("token1", self.headers(remaining=10, limit=100))
+
+        _, first_delay = budget.acquire()
+        _, second_delay = budget.acquire()
+
+        self.assertEqual(0, first_delay)
+        self.assertTrue(4 < second_delay <= 6)
+
+    def test_expired_window_should_restore_the_budget(self):
+        budget = RateLimitBudget(self.path, ["token1"])
+        budget.update("token1", self.headers(remaining=0, reset=time.time() - 1))
+
+        self.assertEqual("token1", budget.acquire()[0])
+
+    def test_tokens_should_not_be_written_on_disk(self):
+        budget = RateLimitBudget(self.path, ["secret-token"])
+
+        budget.acquire()
+
+        with open(self.path) as state_file:
+            self.assertNotIn("secret-token", state_file.read())
+
+    def headers(self, remaining, limit=5000, reset=None):
+        return {'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Limit': str(limit),
+                'X-RateLimit-Reset': str(reset or time.time() + 60)}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import unittest
+from datetime import datetime
 
 from mock.mock import Mock
 from src.repository import Repository
@@ -13,19 +14,138 @@ class RepositoryTests(unittest.TestCase):
         repository.bulk_insert([])
 
         self.assertEqual(0, mock_poll.cursor().execute.call_count)
+        self.assertEqual(0, mock_poll.cursor().copy_expert.call_count)
         self.assertEqual(0, mock_poll.commit.call_count)
         self.assertEqual(0, mock_poll.cursor().close.call_count)
 
-    def test_bulk_insert_with_one_contributor_list_should_ignore_it(self):
+    def test_bulk_insert_with_one_contributor_list_should_copy_one_batch(self):
         mock_poll = Mock()
         repository = Repository(mock_poll)
 
         repository.bulk_insert([{"repo_owner": "facebook", "contributor": "test",
                                "month": "2020-01-01", "repo_name": "react", "total_commits": 10}])
 
+        self.assertEqual(1, mock_poll.cursor().copy_expert.call_count)
+        self.assertEqual("facebook,test,2020-01-01,react,10\r\n",
+                         mock_poll.cursor().copy_expert.call_args[0][1].getvalue())
+        self.assertEqual(2, mock_poll.commit.call_count)
+        self.assertEqual(1, mock_poll.cursor().close.call_count)
+
+    def test_bulk_insert_should_merge_one_statement_per_batch(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll, batch_size=2)
+
+        repository.bulk_insert([{"repo_owner": "facebook", "contributor": f"test{i}",
+                               "month": "2020-01-01", "repo_name": "react", "total_commits": 1} for i in range(0, 5)])
+
+        merges = [c for c in mock_poll.cursor().execute.call_args_list
+                  if c[0][0].startswith("WITH staged")]
+        self.assertEqual(3, mock_poll.cursor().copy_expert.call_count)
+        self.assertEqual(3, len(merges))
+        self.assertEqual(2, mock_poll.commit.call_count)
+
+    def test_bulk_insert_should_create_each_month_partition_once(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll)
+        contributors_list = [{"repo_owner": "facebook", "contributor": f"test{i}",
+                              "month": f"2020-0{i % 2 + 1}-01", "repo_name": "react", "total_commits": 1} for i in range(0, 4)]
+
+        repository.bulk_insert(contributors_list)
+        repository.bulk_insert(contributors_list)
+
+        partitions = [c[0][1] for c in mock_poll.cursor().execute.call_args_list
+                      if c[0][0].startswith("SELECT ensure_month_partition")]
+        self.assertEqual([("github_repo_data", "2020-01-01"),
+                          ("github_repo_data", "2020-02-01")], partitions)
+
+    def test_replace_contributors_should_delete_and_load_in_one_transaction(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll)
+        batches = [[{"repo_owner": "facebook", "contributor": f"test{i}", "month": "2020-03-01",
+                     "repo_name": "react", "total_commits": 1} for i in range(0, 2)]] * 2
+
+        result = repository.replace_contributors(
+            iter(batches), "facebook", datetime(2020, 1, 1), datetime(2020, 6, 1))
+
+        deletes = [c[0] for c in mock_poll.cursor().execute.call_args_list
+                   if c[0][0].startswith("DELETE")]
+        self.assertEqual([("DELETE FROM github_repo_data WHERE repo_owner = %s AND month >= %s AND month <= %s",
+                           ("facebook", "2020-01-01", "2020-06-01")),
+                          ("DELETE FROM github_contributor_months WHERE repo_owner = %s AND month >= %s AND month <= %s",
+                           ("facebook", "2020-01-01", "2020-06-01"))], deletes)
+        self.assertEqual(4, result)
+        self.assertEqual(2, mock_poll.cursor().copy_expert.call_count)
+        self.assertEqual(1, mock_poll.commit.call_count)
+        self.assertEqual({"2020-03-01"}, repository.partitions)
+
+    def test_replace_contributors_without_bounds_should_truncate(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll)
+
+        repository.replace_contributors(iter([]))
+
+        mock_poll.cursor().execute.assert_called_once_with(
+            "TRUNCATE github_repo_data, github_contributor_months")
+        self.assertEqual(1, mock_poll.commit.call_count)
+
+    def test_invalid_batch_size_should_raise_an_exception(self):
+        with self.assertRaises(ValueError):
+            Repository(Mock(), batch_size=0)
+
+    def test_get_crawl_state_should_return_state_by_repository(self):
+        mock_poll = Mock()
+        mock_poll.cursor().fetchall.return_value = [
+            ("react", "2021-01-01T00:00:00Z")]
+        repository = Repository(mock_poll)
+
+        result = repository.get_crawl_state("facebook")
+
+        self.assertEqual(
+            {"react": {"pushed_at": "2021-01-01T00:00:00Z"}}, result)
+        self.assertEqual(("facebook",), mock_poll.cursor().execute.call_args[0][1])
+
+    def test_save_crawl_state_should_upsert_all_repositories_at_once(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll)
+
+        repository.save_crawl_state("facebook", [{"name": "react", "pushed_at": "2021-01-01T00:00:00Z"},
+                                                 {"name": "jest", "pushed_at": None}])
+
         self.assertEqual(1, mock_poll.cursor().execute.call_count)
+        self.assertEqual(("facebook", ["react", "jest"], ["2021-01-01T00:00:00Z", None]),
+                         mock_poll.cursor().execute.call_args[0][1])
+        self.assertEqual(1, mock_poll.commit.call_count)
+
+    def test_save_crawl_state_with_empty_list_should_ignore_it(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll)
+
+        repository.save_crawl_state("facebook", [])
+
+        self.assertEqual(0, mock_poll.cursor().execute.call_count)
+
+    def test_get_checkpoint_should_return_the_finished_repositories(self):
+        mock_poll = Mock()
+        mock_poll.cursor().fetchall.return_value = [("react",), ("jest",)]
+        repository = Repository(mock_poll)
+
+        result = repository.get_checkpoint("scheduled__2021-01-01", "facebook")
+
+        self.assertEqual({"react", "jest"}, result)
+        self.assertEqual(("scheduled__2021-01-01", "facebook"),
+                         mock_poll.cursor().execute.call_args[0][1])
+
+    def test_save_checkpoint_should_insert_all_repositories_at_once(self):
+        mock_poll = Mock()
+        repository = Repository(mock_poll)
+
+        repository.save_checkpoint("scheduled__2021-01-01", "facebook", ["react", "jest"])
+        repository.save_checkpoint("scheduled__2021-01-01", "facebook", [])
+
+        self.assertEqual(1, mock_poll.cursor().execute.call_count)
+        self.assertEqual(("scheduled__2021-01-01", "facebook", ["react", "jest"]),
+                         mock_poll.cursor().execute.call_args[0][1])
         self.assertEqual(1, mock_poll.commit.call_count)
-        self.assertEqual(1, mock_poll.cursor().close.call_count)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from src.response_cache import CachedResponse, ResponseCache
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "http_cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_unknown_url_should_return_none(self):
+        cache = ResponseCache(self.path)
+
+        self.assertIsNone(cache.get("https://api.github.com/users/facebook/repos"))
+
+    def test_set_response_should_be_persisted(self):
+        ResponseCache(self.path).set(
+            "https://api.github.com/users/facebook/repos", '"abc"', None, '[{"name": "react"}]')
+
+        result = ResponseCache(self.path).get(
+            "https://api.github.com/users/facebook/repos")
+
+        self.assertEqual(CachedResponse('"abc"', None, b'[{"name": "react"}]'), result)
+
+    def test_set_over_max_size_should_evict_least_recently_used(self):
+        cache = ResponseCache(self.path, max_size=2500)
+        body = os.urandom(1000)
+
+        cache.set("url1", '"1"', None, body)
+        cache.set("url2", '"2"', None, body)
+        cache.get("url1")
+        cache.set("url3", '"3"', None, body)
+
+        self.assertIsNotNone(cache.get("url1"))
+        self.assertIsNone(cache.get("url2"))
+        self.assertIsNotNone(cache.get("url3"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from src.snapshot import SNAPSHOT_VERSION, RepositoriesSnapshot
+
+
+class RepositoriesSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_without_snapshot_should_return_none(self):
+        snapshot = RepositoriesSnapshot(self.directory.name, "facebook")
+
+        self.assertIsNone(snapshot.load(timedelta(hours=24)))
+
+    def test_load_saved_snapshot_should_return_repositories(self):
+        snapshot = RepositoriesSnapshot(self.directory.name, "facebook")
+
+        snapshot.save([{"name": "react"}, {"name": "jest"}])
+
+        self.assertEqual([{"name": "react"}, {"name": "jest"}],
+                         snapshot.load(timedelta(hours=24)))
+        self.assertEqual(["facebook_repos.json"],
+                         os.listdir(self.directory.name))
+
+    def test_load_expired_snapshot_should_return_none(self):
+        snapshot = RepositoriesSnapshot(self.directory.name, "facebook")
+        with open(snapshot.path, "w") as snapshot_file:
+            json.dump({"version": SNAPSHOT_VERSION, "created_at": (datetime.now() - timedelta(hours=25)).timestamp(),
+                       "repositories": [{"name": "react"}]}, snapshot_file)
+
+        self.assertIsNone(snapshot.load(timedelta(hours=24)))
+
+    def test_load_snapshot_of_previous_version_should_return_none(self):
+        snapshot = RepositoriesSnapshot(self.directory.name, "facebook")
+        with open(snapshot.path, "w") as snapshot_file:
+            json.dump({"created_at": datetime.now().timestamp(),
+                       "repositories": ["react"]}, snapshot_file)
+
+        self.assertIsNone(snapshot.load(timedelta(hours=24)))
+
+    def test_load_corrupted_snapshot_should_return_none(self):
+        snapshot = RepositoriesSnapshot(self.directory.name, "facebook")
+        with open(snapshot.path, "w") as snapshot_file:
+            snapshot_file.write("{")
+
+        self.assertIsNone(snapshot.load(timedelta(hours=24)))
+
+
+if __name__ == '__main__':
+    unittest.main()
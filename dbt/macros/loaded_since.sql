@@ -0,0 +1,9 @@
+{#
+  loaded_at is the start time of the load transaction, a load committing after the last dbt
+  run may hold rows older than its watermark. Rows loaded within the lookback before the
+  watermark are read again, recomputing them is idempotent with the delete+insert strategy.
+  The lookback must be longer than a load transaction
+#}
+{% macro loaded_since() %}
+(SELECT COALESCE(MAX(loaded_at), '-infinity') - INTERVAL '{{ var("loaded_at_lookback", "1 hour") }}' FROM {{ this }})
+{%- endmacro %}
@@ -1,17 +1,55 @@
 {{
   config(
     materialized='incremental',
-    unique_key='month',
-    incremental_strategy='insert_overwrite',
+    unique_key=['repo_owner', 'repo_name', 'month'],
+    incremental_strategy='delete+insert',
+    full_refresh=false,
+    pre_hook=[
+      "SELECT ensure_month_partition('{{ this.identifier }}', to_date(substring(child.relname from '(\\d{4}_\\d{2})$'), 'YYYY_MM')) FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid WHERE pg_inherits.inhparent = 'github_repo_data'::regclass",
+      "{{ 'TRUNCATE ' ~ this if var('recompute_all', false) else 'SELECT 1' }}",
+      "DELETE FROM {{ this }} WHERE (repo_owner,repo_name,month) IN (SELECT repo_owner,repo_name,previous_month FROM github_repo_data WHERE previous_month IS NOT NULL AND loaded_at > {{ loaded_since() }})",
+    ],
+    post_hook=[
+      "CREATE UNIQUE INDEX IF NOT EXISTS github_first_contributors_month_owner_repo_idx ON {{ this }} (month, repo_owner, repo_name) INCLUDE (number_of_new_contributors)",
+      "CREATE INDEX IF NOT EXISTS github_first_contributors_repo_month_idx ON {{ this }} (repo_name, repo_owner, month) INCLUDE (number_of_new_contributors)",
+      "CREATE INDEX IF NOT EXISTS github_first_contributors_owner_month_idx ON {{ this }} (repo_owner, month, repo_name) INCLUDE (number_of_new_contributors)",
+    ],
   )
 }}
 
-SELECT repo_name,month,COUNT(*) as number_of_new_contributors FROM github_repo_data 
+{#
+  The table is partitioned by month on init.sql, so it's never dropped by a --full-refresh.
+  The read model partitions mirror the github_repo_data ones, and the whole model is
+  recomputed inside the run transaction with --vars '{recompute_all: true}'
+#}
+
 {% if is_incremental() %}
 
--- this filter will only be applied on an incremental run
-where month = '{{ var("execution_date") }}'
+-- this filter will only be applied on an incremental run:
+-- only the repository months with source rows loaded since the last run are recomputed.
+-- The months contributors moved from are deleted by the pre-hook, the inner join doesn't
+-- insert them again once all their contributors moved, as a full recompute wouldn't
+WITH changed AS (
+    SELECT repo_owner,repo_name,month,loaded_at FROM github_repo_data
+    WHERE loaded_at > {{ loaded_since() }}
+    UNION ALL
+    SELECT repo_owner,repo_name,previous_month,loaded_at FROM github_repo_data
+    WHERE previous_month IS NOT NULL AND loaded_at > {{ loaded_since() }}
+),
+changed_months AS (
+    SELECT repo_owner,repo_name,month,MAX(loaded_at) as loaded_at FROM changed
+    GROUP BY repo_owner,repo_name,month
+)
+SELECT changed_months.repo_owner,changed_months.repo_name,changed_months.month,COUNT(github_repo_data.contributor) as number_of_new_contributors,changed_months.loaded_at
+FROM changed_months
+JOIN github_repo_data ON github_repo_data.repo_owner = changed_months.repo_owner
+    AND github_repo_data.repo_name = changed_months.repo_name
+    AND github_repo_data.month = changed_months.month
+GROUP BY changed_months.repo_owner,changed_months.repo_name,changed_months.month,changed_months.loaded_at
+
+{% else %}
+
+SELECT repo_owner,repo_name,month,COUNT(*) as number_of_new_contributors,MAX(loaded_at) as loaded_at FROM github_repo_data
+GROUP BY repo_owner,repo_name,month
 
 {% endif %}
-GROUP BY repo_name,month 
-ORDER BY month DESC
\ No newline at end of file
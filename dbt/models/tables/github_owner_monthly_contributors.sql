@@ -0,0 +1,37 @@
+{{
+  config(
+    materialized='incremental',
+    unique_key=['repo_owner'],
+    incremental_strategy='delete+insert',
+    pre_hook=[
+      "{{ 'TRUNCATE ' ~ this if var('recompute_all', false) and is_incremental() else 'SELECT 1' }}",
+    ],
+    post_hook=[
+      "CREATE UNIQUE INDEX IF NOT EXISTS github_owner_monthly_contributors_owner_month_idx ON {{ this }} (repo_owner, month) INCLUDE (number_of_new_contributors, cumulative_new_contributors)",
+    ],
+  )
+}}
+
+{#
+  A contributor is new to the account on the month of its first contribution to any of its
+  repositories, so the account counts aren't the sum of the repository counts. Cumulative totals
+  need the whole series, every account with source rows loaded since the last run is recomputed
+#}
+
+WITH owners AS (
+    SELECT DISTINCT repo_owner FROM github_repo_data
+    {% if is_incremental() and not var('recompute_all', false) %}
+    WHERE loaded_at > {{ loaded_since() }}
+    {% endif %}
+),
+first_contributions AS (
+    SELECT github_repo_data.repo_owner,github_repo_data.contributor,MIN(github_repo_data.month) as month,MAX(github_repo_data.loaded_at) as loaded_at
+    FROM github_repo_data
+    JOIN owners ON owners.repo_owner = github_repo_data.repo_owner
+    GROUP BY github_repo_data.repo_owner,github_repo_data.contributor
+)
+SELECT repo_owner,month,COUNT(*) as number_of_new_contributors,
+    CAST(SUM(COUNT(*)) OVER (PARTITION BY repo_owner ORDER BY month) AS BIGINT) as cumulative_new_contributors,
+    MAX(loaded_at) as loaded_at
+FROM first_contributions
+GROUP BY repo_owner,month
@@ -0,0 +1,26 @@
+{{
+  config(
+    materialized='incremental',
+    unique_key=['repo_owner'],
+    incremental_strategy='delete+insert',
+    pre_hook=[
+      "{{ 'TRUNCATE ' ~ this if var('recompute_all', false) and is_incremental() else 'SELECT 1' }}",
+    ],
+    post_hook=[
+      "CREATE UNIQUE INDEX IF NOT EXISTS github_owner_yearly_contributors_owner_year_idx ON {{ this }} (repo_owner, year) INCLUDE (number_of_new_contributors, cumulative_new_contributors)",
+    ],
+  )
+}}
+
+-- Rolled up from the monthly counts of the accounts recomputed since the last run
+WITH owners AS (
+    SELECT DISTINCT repo_owner FROM {{ ref('github_owner_monthly_contributors') }}
+    {% if is_incremental() and not var('recompute_all', false) %}
+    WHERE loaded_at > {{ loaded_since() }}
+    {% endif %}
+)
+SELECT monthly.repo_owner,CAST(date_trunc('year', monthly.month) AS DATE) as year,CAST(SUM(monthly.number_of_new_contributors) AS BIGINT) as number_of_new_contributors,
+    MAX(monthly.cumulative_new_contributors) as cumulative_new_contributors,MAX(monthly.loaded_at) as loaded_at
+FROM {{ ref('github_owner_monthly_contributors') }} monthly
+JOIN owners ON owners.repo_owner = monthly.repo_owner
+GROUP BY monthly.repo_owner,CAST(date_trunc('year', monthly.month) AS DATE)
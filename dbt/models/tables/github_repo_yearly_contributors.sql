@@ -0,0 +1,36 @@
+{{
+  config(
+    materialized='incremental',
+    unique_key=['repo_owner', 'repo_name'],
+    incremental_strategy='delete+insert',
+    pre_hook=[
+      "{{ 'TRUNCATE ' ~ this if var('recompute_all', false) and is_incremental() else 'SELECT 1' }}",
+    ],
+    post_hook=[
+      "CREATE UNIQUE INDEX IF NOT EXISTS github_repo_yearly_contributors_owner_repo_year_idx ON {{ this }} (repo_owner, repo_name, year) INCLUDE (number_of_new_contributors, cumulative_new_contributors)",
+    ],
+  )
+}}
+
+{#
+  Contributors have a single first month per repository, so the yearly counts are the sum of the
+  monthly ones. Every repository with months recomputed since the last run is recomputed
+#}
+
+WITH repositories AS (
+    SELECT DISTINCT repo_owner,repo_name FROM {{ ref('github_first_contributors') }}
+    {% if is_incremental() and not var('recompute_all', false) %}
+    WHERE loaded_at > {{ loaded_since() }}
+    {% endif %}
+),
+yearly AS (
+    SELECT monthly.repo_owner,monthly.repo_name,CAST(date_trunc('year', monthly.month) AS DATE) as year,
+        CAST(SUM(monthly.number_of_new_contributors) AS BIGINT) as number_of_new_contributors,MAX(monthly.loaded_at) as loaded_at
+    FROM {{ ref('github_first_contributors') }} monthly
+    JOIN repositories ON repositories.repo_owner = monthly.repo_owner AND repositories.repo_name = monthly.repo_name
+    GROUP BY monthly.repo_owner,monthly.repo_name,CAST(date_trunc('year', monthly.month) AS DATE)
+)
+SELECT repo_owner,repo_name,year,number_of_new_contributors,
+    CAST(SUM(number_of_new_contributors) OVER (PARTITION BY repo_owner,repo_name ORDER BY year) AS BIGINT) as cumulative_new_contributors,
+    loaded_at
+FROM yearly
@@ -1,14 +1,115 @@
+-- Monthly partitions are created on the first write of a month, e.g. github_repo_data_2020_01
+CREATE OR REPLACE FUNCTION airflow.public.ensure_month_partition(parent_table TEXT, partition_month DATE) RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', partition_month)::DATE;
+    partition_name TEXT := format('%s_%s', parent_table, to_char(month_start, 'YYYY_MM'));
+BEGIN
+    -- Creating a partition locks the parent table, existing ones are skipped first
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, parent_table, month_start, (month_start + INTERVAL '1 month')::DATE);
+EXCEPTION WHEN duplicate_table THEN
+    -- Created by a concurrent writer
+    NULL;
+END;
+$$ LANGUAGE plpgsql;
+
 CREATE TABLE IF NOT EXISTS airflow.public.github_repo_data (
     contributor VARCHAR NOT NULL,
     repo_owner VARCHAR NOT NULL,
     repo_name VARCHAR NOT NULL,
     month DATE NOT NULL,
     total_commits INTEGER NOT NULL,
-    PRIMARY KEY(contributor,repo_owner,repo_name)
+    -- Month of the row before its last change, its aggregate must be recomputed too
+    previous_month DATE,
+    -- Watermark of the incremental dbt model, the start time of the load transaction. dbt reads
+    -- back the loaded_at_lookback var before it, for loads committed after its last run
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    -- The partition key must be part of the primary key
+    PRIMARY KEY(contributor,repo_owner,repo_name,month)
+) PARTITION BY RANGE (month);
+
+CREATE INDEX IF NOT EXISTS github_repo_data_loaded_at_idx
+    ON airflow.public.github_repo_data (loaded_at);
+
+-- Month of each contributor of a repository, a contributor moved to another month is
+-- deleted from its old partition without probing every partition
+CREATE TABLE IF NOT EXISTS airflow.public.github_contributor_months (
+    repo_owner VARCHAR NOT NULL,
+    repo_name VARCHAR NOT NULL,
+    contributor VARCHAR NOT NULL,
+    month DATE NOT NULL,
+    PRIMARY KEY(repo_owner,repo_name,contributor)
 );
 
 CREATE TABLE IF NOT EXISTS airflow.public.github_first_contributors (
+    repo_owner VARCHAR NOT NULL,
     repo_name VARCHAR NOT NULL,
     month DATE NOT NULL,
-    number_of_new_contributors INTEGER NOT NULL
-);
\ No newline at end of file
+    number_of_new_contributors INTEGER NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    -- Keyset pagination of the API walks the read model by (month, repo_owner, repo_name)
+    CONSTRAINT github_first_contributors_month_owner_repo_idx PRIMARY KEY(month,repo_owner,repo_name) INCLUDE (number_of_new_contributors)
+) PARTITION BY RANGE (month);
+
+-- Covering indexes allow index-only scans of a repository or owner time series
+CREATE INDEX IF NOT EXISTS github_first_contributors_repo_month_idx
+    ON airflow.public.github_first_contributors (repo_name, repo_owner, month) INCLUDE (number_of_new_contributors);
+CREATE INDEX IF NOT EXISTS github_first_contributors_owner_month_idx
+    ON airflow.public.github_first_contributors (repo_owner, month, repo_name) INCLUDE (number_of_new_contributors);
+
+-- Rollups of the read model, time series of an account or a repository are read by their key
+CREATE TABLE IF NOT EXISTS airflow.public.github_owner_monthly_contributors (
+    repo_owner VARCHAR NOT NULL,
+    month DATE NOT NULL,
+    number_of_new_contributors BIGINT NOT NULL,
+    cumulative_new_contributors BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT github_owner_monthly_contributors_owner_month_idx PRIMARY KEY(repo_owner,month) INCLUDE (number_of_new_contributors, cumulative_new_contributors)
+);
+
+CREATE TABLE IF NOT EXISTS airflow.public.github_owner_yearly_contributors (
+    repo_owner VARCHAR NOT NULL,
+    year DATE NOT NULL,
+    number_of_new_contributors BIGINT NOT NULL,
+    cumulative_new_contributors BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT github_owner_yearly_contributors_owner_year_idx PRIMARY KEY(repo_owner,year) INCLUDE (number_of_new_contributors, cumulative_new_contributors)
+);
+
+CREATE TABLE IF NOT EXISTS airflow.public.github_repo_yearly_contributors (
+    repo_owner VARCHAR NOT NULL,
+    repo_name VARCHAR NOT NULL,
+    year DATE NOT NULL,
+    number_of_new_contributors BIGINT NOT NULL,
+    cumulative_new_contributors BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT github_repo_yearly_contributors_owner_repo_year_idx PRIMARY KEY(repo_owner,repo_name,year) INCLUDE (number_of_new_contributors, cumulative_new_contributors)
+);
+
+-- Watermark of each repository, its last push covered by a crawl
+CREATE TABLE IF NOT EXISTS airflow.public.github_crawl_state (
+    repo_owner VARCHAR NOT NULL,
+    repo_name VARCHAR NOT NULL,
+    pushed_at TIMESTAMPTZ,
+    crawled_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY(repo_owner,repo_name)
+);
+
+-- Repositories finished by each DAG run, a retried shard skips them
+CREATE TABLE IF NOT EXISTS airflow.public.github_crawl_checkpoint (
+    run_id VARCHAR NOT NULL,
+    repo_owner VARCHAR NOT NULL,
+    repo_name VARCHAR NOT NULL,
+    finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY(run_id,repo_owner,repo_name)
+);
+
+CREATE TABLE IF NOT EXISTS airflow.public.github_read_model_version (
+    model VARCHAR NOT NULL,
+    version BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY(model)
+);
@@ -0,0 +1,75 @@
+-- Moves github_repo_data and github_first_contributors created before the month partitioning
+-- into partitioned tables and fills github_contributor_months. init.sql skips existing tables,
+-- so it is run first for the partition function and the new tables, then this migration:
+--   psql -v ON_ERROR_STOP=1 -d airflow -f docker/postgres/init.sql
+--   psql -v ON_ERROR_STOP=1 -d airflow -f docker/postgres/migrations/001_partition_by_month.sql
+-- Tables already partitioned are skipped, and the copy and the swap are a single transaction
+BEGIN;
+
+DO $$
+DECLARE
+    partition_month DATE;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('github_repo_data')) = 'r' THEN
+        -- The old constraint and index names are kept by the new table
+        ALTER TABLE github_repo_data RENAME TO github_repo_data_unpartitioned;
+        ALTER TABLE github_repo_data_unpartitioned RENAME CONSTRAINT github_repo_data_pkey TO github_repo_data_unpartitioned_pkey;
+        DROP INDEX IF EXISTS github_repo_data_loaded_at_idx;
+
+        CREATE TABLE github_repo_data (
+            contributor VARCHAR NOT NULL,
+            repo_owner VARCHAR NOT NULL,
+            repo_name VARCHAR NOT NULL,
+            month DATE NOT NULL,
+            total_commits INTEGER NOT NULL,
+            previous_month DATE,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY(contributor,repo_owner,repo_name,month)
+        ) PARTITION BY RANGE (month);
+        CREATE INDEX github_repo_data_loaded_at_idx ON github_repo_data (loaded_at);
+
+        FOR partition_month IN SELECT DISTINCT month FROM github_repo_data_unpartitioned LOOP
+            PERFORM ensure_month_partition('github_repo_data', partition_month);
+        END LOOP;
+        INSERT INTO github_repo_data(contributor,repo_owner,repo_name,month,total_commits,previous_month,loaded_at)
+        SELECT contributor,repo_owner,repo_name,month,total_commits,previous_month,loaded_at FROM github_repo_data_unpartitioned;
+        DROP TABLE github_repo_data_unpartitioned;
+    END IF;
+
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('github_first_contributors')) = 'r' THEN
+        ALTER TABLE github_first_contributors RENAME TO github_first_contributors_unpartitioned;
+        ALTER TABLE github_first_contributors_unpartitioned RENAME CONSTRAINT github_first_contributors_month_owner_repo_idx TO github_first_contributors_unpartitioned_pkey;
+        DROP INDEX IF EXISTS github_first_contributors_repo_month_idx;
+        DROP INDEX IF EXISTS github_first_contributors_owner_month_idx;
+
+        CREATE TABLE github_first_contributors (
+            repo_owner VARCHAR NOT NULL,
+            repo_name VARCHAR NOT NULL,
+            month DATE NOT NULL,
+            number_of_new_contributors INTEGER NOT NULL,
+            loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            CONSTRAINT github_first_contributors_month_owner_repo_idx PRIMARY KEY(month,repo_owner,repo_name) INCLUDE (number_of_new_contributors)
+        ) PARTITION BY RANGE (month);
+        CREATE INDEX github_first_contributors_repo_month_idx
+            ON github_first_contributors (repo_name, repo_owner, month) INCLUDE (number_of_new_contributors);
+        CREATE INDEX github_first_contributors_owner_month_idx
+            ON github_first_contributors (repo_owner, month, repo_name) INCLUDE (number_of_new_contributors);
+
+        -- The read model mirrors the source partitions, as on the dbt pre-hook
+        FOR partition_month IN SELECT DISTINCT month FROM github_first_contributors_unpartitioned
+                               UNION SELECT DISTINCT month FROM github_repo_data LOOP
+            PERFORM ensure_month_partition('github_first_contributors', partition_month);
+        END LOOP;
+        INSERT INTO github_first_contributors(repo_owner,repo_name,month,number_of_new_contributors,loaded_at)
+        SELECT repo_owner,repo_name,month,number_of_new_contributors,loaded_at FROM github_first_contributors_unpartitioned;
+        DROP TABLE github_first_contributors_unpartitioned;
+    END IF;
+END $$;
+
+-- Filled from the loaded rows, the latest month is kept if a contributor has several
+INSERT INTO github_contributor_months(repo_owner,repo_name,contributor,month)
+SELECT DISTINCT ON (repo_owner,repo_name,contributor) repo_owner,repo_name,contributor,month FROM github_repo_data
+ORDER BY repo_owner,repo_name,contributor,loaded_at DESC
+ON CONFLICT (repo_owner,repo_name,contributor) DO NOTHING;
+
+COMMIT;